@@ -8,6 +8,6 @@ python manage.py collectstatic --noinput
 echo "Apply database migrations"
 python manage.py migrate
 
-# Start server
+# Start server, through WSGI so that the uploaded files are streamed to IPFS while they are received
 echo "Starting server"
 python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -6,5 +6,5 @@ class OceandbsConfig(AppConfig):
     name = 'oceandbs'
 
     def ready(self):
-      from . import tasks
+      from . import registry, tasks
       tasks.start()
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import http_client, metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Value of the state gauge, for monitoring tools that only take numbers
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a storage micro-service whose circuit is open.
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Storage '{name}' is unavailable, retry in {retry_after:.0f} seconds.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of the calls made to a storage micro-service over a sliding window.
+    Errors, 5xx responses and calls slower than BREAKER_SLOW_CALL all count as failures.
+    The circuit opens after BREAKER_FAILURE_THRESHOLD consecutive failures, or when the error rate
+    of the window reaches BREAKER_ERROR_RATE. Once BREAKER_OPEN_SECONDS have passed, a single
+    request at a time is let through as a probe: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.outcomes = deque()  # (time, failed) of the calls in the window
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self):
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < settings.BREAKER_OPEN_SECONDS:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record(self, success, latency):
+        failed = not success or latency >= settings.BREAKER_SLOW_CALL
+        now = time.monotonic()
+        with self.lock:
+            self.outcomes.append((now, failed))
+            while self.outcomes and now - self.outcomes[0][0] > settings.BREAKER_WINDOW:
+                self.outcomes.popleft()
+            self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+
+            if self.state == HALF_OPEN:
+                self.probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.outcomes.clear()
+                    self._set_state(CLOSED)
+            elif self.state == CLOSED and failed and self._should_open():
+                self._open(now)
+
+    def retry_after(self):
+        with self.lock:
+            if self.state != OPEN:
+                return 0
+            return max(0, settings.BREAKER_OPEN_SECONDS - (time.monotonic() - self.opened_at))
+
+    def status(self):
+        with self.lock:
+            failures = sum(1 for _, failed in self.outcomes if failed)
+            return {
+                'state': self.state,
+                'calls': len(self.outcomes),
+                'failures': failures,
+                'error_rate': failures / len(self.outcomes) if self.outcomes else 0,
+                'consecutive_failures': self.consecutive_failures
+            }
+
+    def _should_open(self):
+        if self.consecutive_failures >= settings.BREAKER_FAILURE_THRESHOLD:
+            return True
+        if len(self.outcomes) < settings.BREAKER_MIN_CALLS:
+            return False
+        failures = sum(1 for _, failed in self.outcomes if failed)
+        return failures / len(self.outcomes) >= settings.BREAKER_ERROR_RATE
+
+    def _open(self, now):
+        self.opened_at = now
+        self._set_state(OPEN)
+
+    def _set_state(self, state):
+        if state != self.state:
+            print(f"Circuit of storage '{self.name}' is now {state}.")
+            metrics.increment('circuit_breaker_transitions', storage=self.name, state=state)
+        self.state = state
+        metrics.set_gauge('circuit_breaker_state', STATE_VALUES[state], storage=self.name)
+
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+# This function returns the circuit breaker of a storage, created on first use
+def get_breaker(storage):
+    with _lock:
+        breaker = _breakers.get(storage.pk)
+        if breaker is None:
+            breaker = _breakers[storage.pk] = CircuitBreaker(storage.type)
+        return breaker
+
+
+# This function calls a storage micro-service through its circuit breaker, raising CircuitOpenError when it is open
+def storage_request(storage, method, url, **kwargs):
+    breaker = get_breaker(storage)
+    if not breaker.allow():
+        metrics.increment('circuit_breaker_rejections', storage=storage.type)
+        raise CircuitOpenError(storage.type, breaker.retry_after())
+
+    start = time.perf_counter()
+    try:
+        response = http_client.request(method, url, **kwargs)
+    except BaseException:
+        breaker.record(False, time.perf_counter() - start)
+        raise
+    breaker.record(response.status_code < 500, time.perf_counter() - start)
+    return response
+
+
+# This function returns the status of every circuit breaker, by storage
+def breakers_status():
+    with _lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in breakers}
+
+
+# This function forgets every circuit breaker
+def reset():
+    with _lock:
+        _breakers.clear()
+
+
+metrics.register_collector('circuit_breakers', breakers_status)
@@ -0,0 +1,102 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import metrics
+
+_lock = threading.Lock()
+# One session per upstream host, so that each host gets its own pool of keep-alive connections
+_sessions = {}
+
+
+def _host(url):
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+# This function returns the session of the host of an URL, created on first use
+def get_session(url):
+    host = _host(url)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=getattr(settings, 'UPSTREAM_POOL_CONNECTIONS', 4),
+                    pool_maxsize=getattr(settings, 'UPSTREAM_POOL_MAXSIZE', 20),
+                    max_retries=0
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _sessions[host] = session
+    return session
+
+
+# This function returns the default (connect, read) timeout of upstream calls
+def get_default_timeout():
+    return (getattr(settings, 'UPSTREAM_CONNECT_TIMEOUT', 5), getattr(settings, 'UPSTREAM_READ_TIMEOUT', 60))
+
+
+# This function sends a request through the pooled session of its host, recording its latency and outcome
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', get_default_timeout())
+    host = _host(url)
+    start = time.perf_counter()
+    try:
+        response = get_session(url).request(method, url, **kwargs)
+    except requests.RequestException:
+        metrics.increment('upstream_errors', host=host)
+        raise
+    finally:
+        metrics.observe('upstream_request_seconds', time.perf_counter() - start, host=host)
+    metrics.increment('upstream_responses', host=host, status=response.status_code)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    return request('POST', url, data=data, **kwargs)
+
+
+# This function returns, for every host, how many requests reused a pooled connection instead of opening a new one
+def pool_stats():
+    stats = {}
+    with _lock:
+        sessions = dict(_sessions)
+    for host, session in sessions.items():
+        requests_count = 0
+        connections = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+        stats[host] = {
+            'requests': requests_count,
+            'connections': connections,
+            'hit_rate': 1 - connections / requests_count if requests_count else None
+        }
+    return stats
+
+
+# This function closes every pooled connection
+def close_all():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+metrics.register_collector('upstream_pools', pool_stats)
@@ -0,0 +1,109 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Quote, UploadJob, JOB_STATE, UPLOAD_CODE
+from .status_broker import broker
+from .upload_handlers import IPFSUploadedFile
+from .utils import ipfs_add_concurrently, parse_ipfs_add_entry, push_quote_files, read_staged_file, digests_of_chunks, find_known_cid, \
+    check_local_cid
+
+# Pool of background workers pushing the staged files to IPFS then to the microservices
+executor = ThreadPoolExecutor(max_workers=getattr(settings, 'UPLOAD_JOB_WORKERS', 4), thread_name_prefix='upload-job')
+
+
+# This function creates the job uploading the staged files of a quote, and schedules it once the transaction is committed
+def enqueue_upload_job(quote, params, staged_files):
+    job = UploadJob.objects.create(
+        quote=quote,
+        files=staged_files,
+        nonce=params['nonce'][0],
+        signature=params['signature'][0]
+    )
+    schedule_upload_job(job.pk)
+    return job
+
+
+def schedule_upload_job(job_id):
+    transaction.on_commit(lambda: executor.submit(_run_in_worker, job_id))
+
+
+def _run_in_worker(job_id):
+    try:
+        run_upload_job(job_id)
+    finally:
+        # Worker threads get their own database connection, which must not outlive the job
+        connection.close()
+
+
+# This function runs an upload job, unless another worker already claimed it
+def run_upload_job(job_id):
+    claimed = UploadJob.objects.filter(pk=job_id, state=JOB_STATE[0][0]).update(state=JOB_STATE[1][0], updated=timezone.now())
+    if not claimed:
+        return
+
+    job = UploadJob.objects.select_related('quote__storage').get(pk=job_id)
+    print(f"Running upload job {job.pk} for quote {job.quote.quoteId}")
+
+    try:
+        response = _push_staged_files(job)
+    except Exception as e:
+        response = None
+        job.error = str(e)
+
+    if response is not None and response.status_code == 200:
+        job.state = JOB_STATE[2][0]
+    else:
+        job.state = JOB_STATE[3][0]
+        if response is not None:
+            job.error = str(response.data)
+        print(f"Upload job {job.pk} failed: {job.error}")
+        # The quote is left retryable, the user uploads the files again with a new request
+        if Quote.objects.filter(pk=job.quote.pk, status=str(UPLOAD_CODE[4][0])).update(status=UPLOAD_CODE[6][0]):
+            broker.publish(job.quote.quoteId, UPLOAD_CODE[6][0])
+
+    # The staged files are not needed anymore, whether the job succeeded or failed
+    for staged in job.files:
+        if os.path.exists(staged['path']):
+            os.remove(staged['path'])
+
+    job.updated = timezone.now()
+    job.save(update_fields=['state', 'error', 'updated'])
+    return job
+
+
+# This function pushes the staged files of a job to IPFS then to the microservice, and returns the response of the upload
+def _push_staged_files(job):
+    # Files whose content is already in IPFS are not added again
+    added = {}
+    files = {}
+    digests = {}
+    for index, staged in enumerate(job.files):
+        if not staged.get('sha256') or not staged.get('cid'):
+            staged['sha256'], staged['cid'] = digests_of_chunks(read_staged_file(staged['path']))
+        digests[index] = staged['sha256']
+        cid = find_known_cid(digests[index], staged['cid'])
+        if cid:
+            added[index] = IPFSUploadedFile(staged['name'], None, staged['size'], None, cid=cid, sha256=digests[index])
+        else:
+            files[index] = (staged['name'], partial(read_staged_file, staged['path']))
+
+    for index, entry, error in ipfs_add_concurrently(files):
+        cid = None
+        if error is None:
+            try:
+                _, cid, _ = parse_ipfs_add_entry(entry)
+            except (KeyError, TypeError):
+                error = ValueError(f"Invalid IPFS response: {entry}")
+        staged = job.files[index]
+        check_local_cid(staged['name'], staged['cid'], cid)
+        added[index] = IPFSUploadedFile(staged['name'], None, staged['size'], None, cid=cid, error=error, sha256=digests[index])
+
+    request_files = {f"file{index + 1}": added[index] for index in range(len(job.files))}
+
+    params = {'nonce': [job.nonce], 'signature': [job.signature]}
+    return push_quote_files(job.quote, params, request_files)
@@ -0,0 +1,88 @@
+import bisect
+import threading
+
+# Upper bounds (in seconds) of the latency histograms buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+# Callables returning a dict of values, computed when a snapshot is taken
+_collectors = {}
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{value}"' for label, value in sorted(labels.items())) + '}'
+
+
+# This function increments a counter, created on first use
+def increment(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+# This function sets the current value of a gauge
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+# This function records an observation (usually a duration in seconds) in a histogram
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'count': 0, 'sum': 0.0}
+        histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+        histogram['count'] += 1
+        histogram['sum'] += value
+
+
+# This function registers a callable whose values are added to every snapshot under the given name
+def register_collector(name, collector):
+    with _lock:
+        _collectors[name] = collector
+
+
+# This function returns the current value of a counter
+def get_counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+# This function returns a copy of every metric, histograms buckets being cumulative
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {}
+        for key, histogram in _histograms.items():
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(list(histogram['buckets']) + ['+Inf'], histogram['counts']):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            histograms[key] = {'count': histogram['count'], 'sum': histogram['sum'], 'buckets': buckets}
+        collectors = dict(_collectors)
+
+    collected = {}
+    for name, collector in collectors.items():
+        try:
+            collected[name] = collector()
+        except Exception as e:
+            print(f"Error collecting metrics '{name}': {e}")
+
+    return {'counters': counters, 'gauges': gauges, 'histograms': histograms, **collected}
+
+
+# This function clears every recorded value, collectors are kept
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
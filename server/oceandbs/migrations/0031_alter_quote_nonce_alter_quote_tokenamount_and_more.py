@@ -0,0 +1,42 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:15
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0030_remove_quote_expiration_alter_quote_nonce'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 15, 18, 750385, tzinfo=datetime.timezone.utc)),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='tokenAmount',
+            field=models.CharField(max_length=256, null=True),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sessionId', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('filename', models.CharField(max_length=256)),
+                ('length', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('nonce', models.CharField(max_length=256)),
+                ('signature', models.CharField(max_length=256)),
+                ('finalized', models.BooleanField(default=False)),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='oceandbs.quote')),
+            ],
+        ),
+    ]
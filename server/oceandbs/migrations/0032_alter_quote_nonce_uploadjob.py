@@ -0,0 +1,38 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:17
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0031_alter_quote_nonce_alter_quote_tokenamount_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 17, 9, 26935, tzinfo=datetime.timezone.utc)),
+        ),
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('state', models.CharField(choices=[['queued', 'Queued'], ['running', 'Running'], ['done', 'Done'], ['failed', 'Failed']], default='queued', max_length=16)),
+                ('files', models.JSONField(default=list)),
+                ('nonce', models.CharField(max_length=256)),
+                ('signature', models.CharField(max_length=256)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to='oceandbs.quote')),
+            ],
+            options={
+                'ordering': ['created'],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:19
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0032_alter_quote_nonce_uploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 19, 26, 741850, tzinfo=datetime.timezone.utc)),
+        ),
+    ]
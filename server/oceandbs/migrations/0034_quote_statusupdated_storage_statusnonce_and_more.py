@@ -0,0 +1,29 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:31
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0033_file_sha256_alter_quote_nonce'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quote',
+            name='statusUpdated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='statusNonce',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 31, 33, 9792, tzinfo=datetime.timezone.utc)),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:32
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0034_quote_statusupdated_storage_statusnonce_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quote',
+            name='statusChecked',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 32, 58, 387086, tzinfo=datetime.timezone.utc)),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:43
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0035_quote_statuschecked_alter_quote_nonce'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quote',
+            name='link',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 43, 29, 954606, tzinfo=datetime.timezone.utc)),
+        ),
+    ]
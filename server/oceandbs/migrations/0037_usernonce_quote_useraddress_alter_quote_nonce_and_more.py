@@ -0,0 +1,46 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:44
+
+import datetime
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower
+
+
+def copy_user_addresses(apps, schema_editor):
+    Quote = apps.get_model('oceandbs', 'Quote')
+    Payment = apps.get_model('oceandbs', 'Payment')
+    userAddress = Payment.objects.filter(pk=OuterRef('payment_id')).values('userAddress')
+    Quote.objects.filter(payment__isnull=False).update(userAddress=Lower(Subquery(userAddress)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0036_quote_link_alter_quote_nonce'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNonce',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('userAddress', models.CharField(max_length=256, unique=True)),
+                ('nonce', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='userAddress',
+            field=models.CharField(blank=True, max_length=256, null=True),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 44, 35, 658426, tzinfo=datetime.timezone.utc)),
+        ),
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(fields=['userAddress', 'created'], name='quote_user_created_idx'),
+        ),
+        migrations.RunPython(copy_user_addresses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:49
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0037_usernonce_quote_useraddress_alter_quote_nonce_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 49, 40, 614075, tzinfo=datetime.timezone.utc)),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:52
+
+import datetime
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0038_registryversion_alter_quote_nonce'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='last_heartbeat',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 7, 52, 6, 21323, tzinfo=datetime.timezone.utc)),
+        ),
+        migrations.AddIndex(
+            model_name='storage',
+            index=models.Index(fields=['is_active', 'last_heartbeat'], name='storage_heartbeat_idx'),
+        ),
+    ]
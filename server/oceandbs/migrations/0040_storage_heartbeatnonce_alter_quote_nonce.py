@@ -0,0 +1,24 @@
+# Generated by Django 4.1.2 on 2026-10-18 08:12
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oceandbs', '0039_storage_last_heartbeat_alter_quote_nonce_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='heartbeatNonce',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='nonce',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 11, 8, 12, 29, 840705, tzinfo=datetime.timezone.utc)),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from tabnanny import verbose
 from unittest.util import _MAX_LENGTH
+import os
+import uuid
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
@@ -10,6 +13,13 @@ PAYMENT_STATUS = [
   ['refunded', _('Payment refunded')]
 ]
 
+JOB_STATE = [
+  ['queued', _('Queued')],
+  ['running', _('Running')],
+  ['done', _('Done')],
+  ['failed', _('Failed')]
+]
+
 UPLOAD_CODE = [
   (0, 'No such quote'),
   (1, 'Waiting for files to be uploaded'),
@@ -27,6 +37,12 @@ class Storage(models.Model):
   description= models.TextField(verbose_name = _("Storage description"), null=True, blank=True)
   url = models.URLField(max_length=2048, default="https://example.com")
   is_active = models.BooleanField(default=True)
+  # Nonce of the last status update pushed by the storage, a push must come with a higher one
+  statusNonce = models.BigIntegerField(default=0)
+  # Last time the storage registered or sent a heartbeat, it is deactivated once STORAGE_HEARTBEAT_TIMEOUT has passed since
+  last_heartbeat = models.DateTimeField(default=timezone.now)
+  # Nonce of the last heartbeat of the storage, separate from statusNonce so that heartbeats and pushes do not refuse each other
+  heartbeatNonce = models.BigIntegerField(default=0)
 
   def __str__(self):
     print("Storage __str__ method called")
@@ -34,6 +50,9 @@ class Storage(models.Model):
 
   class Meta:
     ordering = ['created']
+    indexes = [
+      models.Index(fields=['is_active', 'last_heartbeat'], name='storage_heartbeat_idx'),
+    ]
 
 class PaymentMethod(models.Model):
   chainId = models.CharField(max_length=256)
@@ -75,6 +94,14 @@ class Quote(models.Model):
   approveAddress = models.CharField(max_length=256, null=True)
   tokenAmount = models.CharField(max_length=256, null=True)
   status = models.CharField(choices=UPLOAD_CODE, default=UPLOAD_CODE[1], null=True, blank=True, max_length=3)
+  # Set when the status is pushed by the storage micro-service, the status is then served without asking it
+  statusUpdated = models.DateTimeField(null=True, blank=True)
+  # Last time the status was fetched from the storage micro-service
+  statusChecked = models.DateTimeField(null=True, blank=True)
+  # Normalized getLink result, stored once the upload is done since the links of the files never change afterwards
+  link = models.JSONField(null=True, blank=True)
+  # Lowercased copy of payment.userAddress, so that the history of a user is read from a single index
+  userAddress = models.CharField(max_length=256, null=True, blank=True)
   nonce = models.DateTimeField(default=nonce_computation())
 
   def __str__(self):
@@ -83,6 +110,9 @@ class Quote(models.Model):
 
   class Meta:
     ordering = ['created']
+    indexes = [
+      models.Index(fields=['userAddress', 'created'], name='quote_user_created_idx'),
+    ]
 
 class File(models.Model):
   title = models.CharField(max_length=256, null=True)
@@ -90,7 +120,64 @@ class File(models.Model):
   cid = models.CharField(max_length=2048, null=True)
   quote = models.ForeignKey(Quote, null=True, on_delete=models.SET_NULL, related_name="files")
   length = models.BigIntegerField(default=0)
+  sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True)
 
   def __str__(self):
     print("File __str__ method called")
     return str(self.quote) + " - " + str(self.length)
+
+
+# Version of the registered storages, payment methods and accepted tokens, raised on every change of them.
+# Each process keeps a snapshot of the registry, reloaded when this version moves.
+class RegistryVersion(models.Model):
+  version = models.BigIntegerField(default=0)
+
+  def __str__(self):
+    return str(self.version)
+
+
+# Last nonce signed by a user for the requests not tied to a quote, such as the history
+class UserNonce(models.Model):
+  userAddress = models.CharField(max_length=256, unique=True)
+  nonce = models.BigIntegerField(default=0)
+
+  def __str__(self):
+    return self.userAddress + " - " + str(self.nonce)
+
+
+class UploadSession(models.Model):
+  created = models.DateTimeField(default=timezone.now)
+  sessionId = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+  quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name="upload_sessions")
+  filename = models.CharField(max_length=256)
+  length = models.BigIntegerField()
+  offset = models.BigIntegerField(default=0)
+  nonce = models.CharField(max_length=256)
+  signature = models.CharField(max_length=256)
+  finalized = models.BooleanField(default=False)
+
+  @property
+  def path(self):
+    # Bytes received so far are staged on disk, in a file named after the session
+    return os.path.join(settings.UPLOAD_STAGING_DIR, str(self.sessionId))
+
+  def __str__(self):
+    return str(self.quote) + " - " + self.filename + " - " + str(self.offset) + "/" + str(self.length)
+
+
+class UploadJob(models.Model):
+  created = models.DateTimeField(default=timezone.now)
+  updated = models.DateTimeField(default=timezone.now)
+  quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name="upload_jobs")
+  state = models.CharField(choices=JOB_STATE, default=JOB_STATE[0][0], max_length=16)
+  # Files staged on disk, as a list of {"name": ..., "path": ..., "size": ...}
+  files = models.JSONField(default=list)
+  nonce = models.CharField(max_length=256)
+  signature = models.CharField(max_length=256)
+  error = models.TextField(null=True, blank=True)
+
+  def __str__(self):
+    return str(self.quote) + " - " + self.state
+
+  class Meta:
+    ordering = ['created']
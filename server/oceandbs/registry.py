@@ -0,0 +1,123 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .models import AcceptedToken, PaymentMethod, RegistryVersion, Storage
+
+
+class Snapshot:
+    """
+    Storages of a registry version, with their payment methods and accepted tokens prefetched.
+    Snapshots are never modified: a new one replaces them when the version moves.
+    """
+
+    def __init__(self, version, storages):
+        self.version = version
+        self.by_pk = {storage.pk: storage for storage in storages}
+        self.active = [storage for storage in storages if storage.is_active]
+        self.by_type = {storage.type: storage for storage in self.active}
+
+
+# This function returns the registry version stored in the database, 0 until a first change
+def get_registry_version():
+    return RegistryVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+class StorageRegistry:
+    """
+    Process-local snapshot of the registered storages, used by the views instead of querying them on every request.
+    The registry version is read from the database at most every REGISTRY_CHECK_INTERVAL seconds, and the
+    snapshot is reloaded only when it moved. Storages missing from the snapshot, such as ones registered
+    by another process since the last check, are looked up in the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.checked = 0
+
+    def get_snapshot(self):
+        snapshot = self.snapshot
+        if snapshot is not None and time.monotonic() - self.checked < getattr(settings, 'REGISTRY_CHECK_INTERVAL', 5):
+            return snapshot
+
+        with self.lock:
+            if self.snapshot is not None and time.monotonic() - self.checked < getattr(settings, 'REGISTRY_CHECK_INTERVAL', 5):
+                return self.snapshot
+            # The version is read before the storages, a change made in between is caught by the next check
+            version = get_registry_version()
+            if self.snapshot is None or self.snapshot.version != version:
+                storages = list(Storage.objects.order_by('pk').prefetch_related('payment__acceptedTokens'))
+                self.snapshot = Snapshot(version, storages)
+                metrics.increment('registry_reloads')
+            self.checked = time.monotonic()
+            return self.snapshot
+
+    def version(self):
+        return self.get_snapshot().version
+
+    # Active storages, in registration order
+    def active(self):
+        return list(self.get_snapshot().active)
+
+    # Active storage of the given type, or None
+    def get(self, storage_type):
+        storage = self.get_snapshot().by_type.get(storage_type)
+        if storage is None:
+            storage = Storage.objects.filter(type=storage_type, is_active=True).first()
+            if storage is not None:
+                self.expire()
+        return storage
+
+    # Storage of the given primary key, active or not, or None
+    def get_by_pk(self, pk):
+        if pk is None:
+            return None
+        storage = self.get_snapshot().by_pk.get(pk)
+        if storage is None:
+            storage = Storage.objects.filter(pk=pk).first()
+            if storage is not None:
+                self.expire()
+        return storage
+
+    # Sets the storage of a quote from the snapshot, instead of loading it when it is accessed
+    def attach(self, quote):
+        storage = self.get_by_pk(quote.storage_id)
+        if storage is not None:
+            quote.storage = storage
+        return quote
+
+    # Makes the next lookup check the registry version
+    def expire(self):
+        self.checked = 0
+
+    def clear(self):
+        with self.lock:
+            self.snapshot = None
+            self.checked = 0
+
+
+registry = StorageRegistry()
+
+
+# This function records a change of the storages, payment methods or accepted tokens: every process reloads its snapshot
+def registry_changed():
+    if not RegistryVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        RegistryVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+    registry.clear()
+
+
+# Changes saved through the models, from the registration or the admin, move the version. Bulk updates call registry_changed themselves.
+@receiver(post_save, sender=Storage)
+@receiver(post_save, sender=PaymentMethod)
+@receiver(post_save, sender=AcceptedToken)
+@receiver(post_delete, sender=Storage)
+@receiver(post_delete, sender=PaymentMethod)
+@receiver(post_delete, sender=AcceptedToken)
+def on_registry_change(sender, **kwargs):
+    registry_changed()
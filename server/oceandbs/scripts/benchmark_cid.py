@@ -0,0 +1,49 @@
+import os
+import sys, getopt
+import time
+
+from benchmark_utils import SERVER_DIR
+
+
+def main(argv):
+  size = 256
+  chunk = 64
+  version = 0
+
+  try:
+    opts, args = getopt.getopt(argv, "hs:c:v:", ["size=", "chunk=", "version="])
+  except getopt.GetoptError:
+    print('benchmark_cid.py -s <content size in MB> -c <received chunk size in KB> -v <CID version>')
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt == '-h':
+      print('benchmark_cid.py -s <content size in MB> -c <received chunk size in KB> -v <CID version>')
+      sys.exit()
+    elif opt in ("-s", "--size"):
+      size = int(arg)
+    elif opt in ("-c", "--chunk"):
+      chunk = int(arg)
+    elif opt in ("-v", "--version"):
+      version = int(arg)
+
+  sys.path.insert(0, SERVER_DIR)
+  from oceandbs.unixfs import UnixFSHasher
+
+  # Feed the hasher with chunks the size of the ones received from the clients
+  piece = os.urandom(chunk * 2 ** 10)
+  pieces = (size * 2 ** 20) // len(piece)
+
+  hasher = UnixFSHasher(cid_version=version)
+  start = time.perf_counter()
+  for _ in range(pieces):
+    hasher.update(piece)
+  cid = hasher.cid()
+  elapsed = time.perf_counter() - start
+
+  print(f"CIDv{version} of {pieces * len(piece) / 2 ** 20:.0f} MB received in {chunk} KB chunks: {cid}")
+  print(f"Computed in {elapsed:.2f} s, {pieces * len(piece) / 2 ** 20 / elapsed:.1f} MB/s")
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import sys, getopt
+import time
+
+from benchmark_utils import FakeUpstreamServer, setup_django
+
+
+def main(argv):
+  size = 64
+  bandwidth = 50
+  runs = 5
+
+  try:
+    opts, args = getopt.getopt(argv, "hs:b:r:", ["size=", "bandwidth=", "runs="])
+  except getopt.GetoptError:
+    print('benchmark_dedup.py -s <file size in MB> -b <IPFS bandwidth in MB/s> -r <runs>')
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt == '-h':
+      print('benchmark_dedup.py -s <file size in MB> -b <IPFS bandwidth in MB/s> -r <runs>')
+      sys.exit()
+    elif opt in ("-s", "--size"):
+      size = int(arg)
+    elif opt in ("-b", "--bandwidth"):
+      bandwidth = float(arg)
+    elif opt in ("-r", "--runs"):
+      runs = int(arg)
+
+  # Fake IPFS add endpoint, taking as long as the given bandwidth requires to receive the body
+  def ipfs_add(method, path, body):
+    time.sleep(len(body) / (bandwidth * 2 ** 20))
+    return 200, json.dumps({"Name": "data.bin", "Hash": "Qm" + hashlib.sha256(body).hexdigest()[:44], "Size": str(len(body))})
+
+  ipfs = FakeUpstreamServer(ipfs_add)
+  os.environ['IPFS_SERVICE_ENDPOINT'] = ipfs.url + 'api/v0/add'
+  setup_django()
+
+  from django.core.files.uploadedfile import SimpleUploadedFile
+  from oceandbs.models import Quote, Storage
+  from oceandbs.utils import upload_files_to_ipfs
+
+  storage = Storage.objects.create(type='benchmark', description='Benchmark storage')
+  content = os.urandom(size * 2 ** 20)
+
+  print(f"Uploading a {size} MB file {runs} times, IPFS bandwidth {bandwidth} MB/s")
+  timings = []
+  for run in range(runs):
+    quote = Quote.objects.create(quoteId=f'benchmark-{run}', storage=storage, duration=1)
+    bytes_before = ipfs.bytes_received
+    start = time.perf_counter()
+    upload_files_to_ipfs({'file': SimpleUploadedFile('data.bin', content)}, quote)
+    timings.append(time.perf_counter() - start)
+    print(f"Run {run + 1}: {timings[-1] * 1000:.1f} ms, {ipfs.bytes_received - bytes_before} bytes sent to IPFS")
+
+  first = timings[0]
+  repeat = sum(timings[1:]) / max(1, len(timings) - 1)
+  print(f"First upload: {first * 1000:.1f} ms")
+  print(f"Repeat uploads: {repeat * 1000:.1f} ms on average ({(1 - repeat / first) * 100:.1f}% latency cut)")
+  print(f"Bytes saved: {(runs - 1) * len(content)} ({ipfs.requests} IPFS requests for {runs} uploads)")
+  ipfs.stop()
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
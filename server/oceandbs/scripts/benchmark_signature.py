@@ -0,0 +1,103 @@
+import hashlib
+import os
+import sys, getopt
+import threading
+import time
+
+from benchmark_utils import setup_django
+
+
+def main(argv):
+  pairs = 200
+  repeats = 5
+  workers = os.cpu_count() or 1
+  threads = 32
+
+  try:
+    opts, args = getopt.getopt(argv, "hp:r:w:t:", ["pairs=", "repeats=", "workers=", "threads="])
+  except getopt.GetoptError:
+    print('benchmark_signature.py -p <distinct signed messages> -r <requests per message> -w <verification processes> -t <request threads>')
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt == '-h':
+      print('benchmark_signature.py -p <distinct signed messages> -r <requests per message> -w <verification processes> -t <request threads>')
+      sys.exit()
+    elif opt in ("-p", "--pairs"):
+      pairs = int(arg)
+    elif opt in ("-r", "--repeats"):
+      repeats = int(arg)
+    elif opt in ("-w", "--workers"):
+      workers = int(arg)
+    elif opt in ("-t", "--threads"):
+      threads = int(arg)
+
+  setup_django()
+
+  from django.test.utils import override_settings
+  from eth_account.messages import encode_defunct
+  from web3.auto import w3
+  from oceandbs import signatures
+
+  account = w3.eth.account.create()
+  signed = []
+  for index in range(pairs):
+    message = "0x" + hashlib.sha256(f'quote-{index}{int(time.time())}'.encode('utf-8')).hexdigest()
+    signed.append((message, account.sign_message(encode_defunct(text=message)).signature.hex()))
+
+  # Cold: every verification recovers the address, as before the cache
+  signatures.clear()
+  start = time.perf_counter()
+  for _ in range(repeats):
+    for message, signature in signed:
+      signatures.clear()
+      signatures.recover_address(message, signature)
+  cold = (time.perf_counter() - start) / (pairs * repeats)
+
+  # Warm: the first request of each pair recovers the address, the retries are cache hits
+  signatures.clear()
+  start = time.perf_counter()
+  for _ in range(repeats):
+    for message, signature in signed:
+      signatures.recover_address(message, signature)
+  warm = (time.perf_counter() - start) / (pairs * repeats)
+
+  start = time.perf_counter()
+  for message, signature in signed:
+    signatures.recover_address(message, signature)
+  hit = (time.perf_counter() - start) / pairs
+
+  print(f"{pairs} signed messages, each verified {repeats} times")
+  print(f"Cold verification: {cold * 1e6:.1f} us per request")
+  print(f"Warm verification: {warm * 1e6:.1f} us per request ({cold / warm:.1f}x faster)")
+  print(f"Cache hit: {hit * 1e6:.1f} us per request ({cold / hit:.0f}x faster)")
+
+  # Throughput of distinct verifications sent by concurrent request threads, inline and through the process pool
+  def verify_all(batch):
+    for message, signature in batch:
+      signatures.recover_address(message, signature)
+
+  print(f"{pairs} distinct verifications from {threads} request threads")
+  for processes in (0, workers):
+    with override_settings(SIGNATURE_WORKERS=processes):
+      signatures.clear()
+      if processes:
+        # The worker processes are started before the measure
+        signatures.recover_address(*signed[0])
+        signatures.recovered_addresses.clear()
+      slices = [signed[index::threads] for index in range(threads)]
+      start = time.perf_counter()
+      running = [threading.Thread(target=verify_all, args=(batch,)) for batch in slices]
+      for thread in running:
+        thread.start()
+      for thread in running:
+        thread.join()
+      rate = pairs / (time.perf_counter() - start)
+      cores = max(1, processes)
+      label = f"{processes} processes" if processes else "inline"
+      print(f"{label}: {rate:.0f} verifications/s, {rate / cores:.0f} per core")
+      signatures.clear()
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
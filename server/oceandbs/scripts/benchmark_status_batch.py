@@ -0,0 +1,77 @@
+import json
+import sys, getopt
+import time
+
+from benchmark_utils import FakeUpstreamServer, setup_django
+
+
+def main(argv):
+  latency = 20
+  counts = [1, 100, 1000]
+
+  try:
+    opts, args = getopt.getopt(argv, "hl:c:", ["latency=", "counts="])
+  except getopt.GetoptError:
+    print('benchmark_status_batch.py -l <storage latency in ms> -c <comma separated quote counts>')
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt == '-h':
+      print('benchmark_status_batch.py -l <storage latency in ms> -c <comma separated quote counts>')
+      sys.exit()
+    elif opt in ("-l", "--latency"):
+      latency = int(arg)
+    elif opt in ("-c", "--counts"):
+      counts = [int(count) for count in arg.split(',')]
+
+  # Fake storage micro-service getStatus endpoint
+  def get_status(method, path, body):
+    time.sleep(latency / 1000)
+    return 200, json.dumps({"status": 300})
+
+  microservice = FakeUpstreamServer(get_status)
+  setup_django()
+
+  from django.db import connection
+  from django.test import Client
+  from django.test.utils import CaptureQueriesContext
+  from oceandbs.models import Quote, Storage
+
+  storage = Storage.objects.create(type='benchmark', description='Benchmark storage', url=microservice.url)
+  Quote.objects.bulk_create([Quote(quoteId=f'benchmark-{index}', storage=storage, duration=1, status='200') for index in range(max(counts))])
+  client = Client()
+
+  def run(request, quoteIds):
+    # Every status is made stale, so that the storage is asked for all of them
+    Quote.objects.update(statusChecked=None)
+    requests_before = microservice.requests
+    with CaptureQueriesContext(connection) as queries:
+      start = time.perf_counter()
+      request(quoteIds)
+      elapsed = time.perf_counter() - start
+    return elapsed, len(queries), microservice.requests - requests_before
+
+  def one_by_one(quoteIds):
+    for quoteId in quoteIds:
+      client.get(f'/getStatus?quoteId={quoteId}')
+
+  def batch(quoteIds):
+    client.post('/getStatuses', data=json.dumps({'quoteIds': quoteIds}), content_type='application/json')
+
+  print(f"Stale quote statuses, storage latency {latency} ms")
+  for count in counts:
+    quoteIds = [f'benchmark-{index}' for index in range(count)]
+    single, single_queries, single_calls = run(one_by_one, quoteIds)
+    batched, batched_queries, batched_calls = run(batch, quoteIds)
+    print(f"{count} quotes: getStatus x{count} {single * 1000:.1f} ms ({single_queries} queries, {single_calls} storage calls), "
+      f"getStatuses {batched * 1000:.1f} ms ({batched_queries} queries, {batched_calls} storage calls), {single / batched:.1f}x faster")
+
+    # Once refreshed, the statuses are served from a single query
+    start = time.perf_counter()
+    batch(quoteIds)
+    print(f"{count} quotes, fresh: getStatuses {(time.perf_counter() - start) * 1000:.1f} ms")
+  microservice.stop()
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
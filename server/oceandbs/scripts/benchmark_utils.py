@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# This function sets Django up against a throw-away test database, so that benchmarks never touch real data
+def setup_django():
+  sys.path.insert(0, SERVER_DIR)
+  os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+  os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+  import django
+  django.setup()
+
+  from django.db import connection
+  from django.test.utils import setup_test_environment
+  setup_test_environment()
+  connection.creation.create_test_db(verbosity=0)
+
+
+# This function reads a request body, sent either with a Content-Length or with a chunked transfer encoding
+def read_body(handler):
+  if handler.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+    return handler.rfile.read(int(handler.headers.get('Content-Length', 0)))
+
+  body = b''
+  while True:
+    size = int(handler.rfile.readline().strip().split(b';')[0], 16)
+    if size == 0:
+      handler.rfile.readline()
+      return body
+    body += handler.rfile.read(size)
+    handler.rfile.readline()
+
+
+# Local HTTP server standing for an upstream service (IPFS, storage microservice...).
+# respond(method, path, body) returns a (status, body) tuple and may sleep to simulate latency.
+class FakeUpstreamServer:
+  def __init__(self, respond):
+    self.requests = 0
+    self.bytes_received = 0
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def handle_request(self):
+        body = read_body(self)
+        server.requests += 1
+        server.bytes_received += len(body)
+        status, content = respond(self.command, self.path, body)
+        content = content.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+      do_GET = handle_request
+      do_POST = handle_request
+
+      def log_message(self, *args):
+        pass
+
+    self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self.url = f'http://127.0.0.1:{self.httpd.server_port}/'
+    threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+  def stop(self):
+    self.httpd.shutdown()
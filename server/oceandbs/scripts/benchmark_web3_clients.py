@@ -0,0 +1,80 @@
+import json
+import sys, getopt
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_utils import FakeUpstreamServer, setup_django
+
+ABI = '[{"constant":false,"inputs":[{"name":"guy","type":"address"},{"name":"wad","type":"uint256"}],"name":"approve","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"","type":"address"}],"name":"balanceOf","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"}]'
+TOKEN = '0x222c30d5b3b54b5a7e9a7f0e2f0d1c2e3b4a5f60'
+USER = '0x1111111111111111111111111111111111111111'
+
+
+def main(argv):
+  calls = 500
+  threads = 8
+  latency = 2
+
+  try:
+    opts, args = getopt.getopt(argv, "hc:t:l:", ["calls=", "threads=", "latency="])
+  except getopt.GetoptError:
+    print('benchmark_web3_clients.py -c <allowance calls> -t <request threads> -l <RPC latency in ms>')
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt == '-h':
+      print('benchmark_web3_clients.py -c <allowance calls> -t <request threads> -l <RPC latency in ms>')
+      sys.exit()
+    elif opt in ("-c", "--calls"):
+      calls = int(arg)
+    elif opt in ("-t", "--threads"):
+      threads = int(arg)
+    elif opt in ("-l", "--latency"):
+      latency = int(arg)
+
+  # Fake JSON-RPC node, every method returns 1
+  def rpc(method, path, body):
+    time.sleep(latency / 1000)
+    return 200, json.dumps({"jsonrpc": "2.0", "id": json.loads(body)['id'], "result": "0x1"})
+
+  node = FakeUpstreamServer(rpc)
+  setup_django()
+
+  from web3 import Web3
+  from web3.middleware import geth_poa_middleware
+  from oceandbs import metrics, web3_clients
+
+  host = node.url.split('/')[2]
+
+  # Before: provider, middleware, ABI and contract built for every call, as create_allowance did
+  def rebuilt(_):
+    w3 = Web3(Web3.HTTPProvider(node.url))
+    w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    # Timed as the cached clients are
+    w3.middleware_onion.add(web3_clients.construct_rpc_latency_middleware(host), name='rpc_latency')
+    contract = w3.eth.contract(Web3.toChecksumAddress(TOKEN), abi=json.loads(ABI))
+    w3.eth.get_transaction_count(Web3.toChecksumAddress(USER))
+    return contract.encodeABI('approve', [Web3.toChecksumAddress(USER), 1])
+
+  # After: client and contract from the registry
+  def cached(_):
+    client = web3_clients.get_client(node.url)
+    contract = client.get_contract(80001, TOKEN, ABI)
+    client.w3.eth.get_transaction_count(Web3.toChecksumAddress(USER))
+    return contract.encodeABI('approve', [Web3.toChecksumAddress(USER), 1])
+
+  print(f"{calls} allowance preparations from {threads} threads, {latency} ms RPC latency")
+  for label, prepare in (("Rebuilt per call", rebuilt), ("Cached clients", cached)):
+    metrics.reset()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+      start = time.perf_counter()
+      list(executor.map(prepare, range(calls)))
+      elapsed = time.perf_counter() - start
+    histogram = metrics.snapshot()['histograms'][f'rpc_request_seconds{{host="{host}",method="eth_getTransactionCount"}}']
+    print(f"{label}: {elapsed / calls * 1000:.2f} ms per call, {histogram['sum'] / histogram['count'] * 1000:.2f} ms mean RPC latency")
+
+  node.stop()
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -101,6 +101,7 @@ class QuoteSerializer(serializers.ModelSerializer):
             print(f"Payment created: {payment}")
 
             quote.payment = payment
+            quote.userAddress = (payment.userAddress or '').lower() or None
             quote.save()
 
             for file_data in files_data:
@@ -0,0 +1,73 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+# Session tokens: a verified signature is exchanged for a short-lived token, checked on the following requests
+# with an HMAC instead of a secp256k1 recovery. A token is scoped to a quote or to a user address, and carries
+# the nonce and signature it was issued for, forwarded to the storage micro-services as before.
+
+
+class TokenError(ValueError):
+    """
+    Raised when a session token is malformed, forged, expired or presented for another quote or user.
+    """
+
+
+def _key():
+    secret = getattr(settings, 'SESSION_TOKEN_SECRET', '') or settings.SECRET_KEY
+    # Derived key, the tokens cannot be confused with the other values signed with the same secret
+    return hmac.new(secret.encode('utf-8'), b'oceandbs.session-token', hashlib.sha256).digest()
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _mac(payload):
+    return hmac.new(_key(), payload.encode('ascii'), hashlib.sha256).digest()
+
+
+# This function returns a token for the scope ('quote' or 'user') and subject (quoteId or lowercased user address),
+# issued for the given nonce and signature, and its expiration timestamp
+def issue_token(scope, subject, nonce, signature):
+    expires = int(time.time()) + getattr(settings, 'SESSION_TOKEN_TTL', 300)
+    claims = {'scope': scope, 'sub': str(subject), 'nonce': int(nonce), 'signature': signature, 'exp': expires}
+    payload = _encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    metrics.increment('session_tokens_issued', scope=scope)
+    return payload + '.' + _encode(_mac(payload)), expires
+
+
+# This function returns the claims of a token issued for the scope and subject, it raises TokenError otherwise.
+# The MAC is compared in constant time.
+def read_token(token, scope, subject):
+    try:
+        payload, mac = str(token).split('.')
+        mac = _decode(mac)
+    except (TypeError, ValueError):
+        raise TokenError("Invalid token.")
+
+    if not hmac.compare_digest(mac, _mac(payload)):
+        raise TokenError("Invalid token.")
+
+    try:
+        claims = json.loads(_decode(payload))
+    except ValueError:
+        raise TokenError("Invalid token.")
+
+    if claims.get('scope') != scope or claims.get('sub') != str(subject):
+        raise TokenError("Token not valid for this request.")
+    if claims.get('exp', 0) < time.time():
+        raise TokenError("Token expired.")
+
+    metrics.increment('session_token_checks', scope=scope)
+    return claims
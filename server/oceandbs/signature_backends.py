@@ -0,0 +1,36 @@
+import importlib
+
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+# Signature recovery backends, and the batch entry point run by the verification processes.
+# This module imports neither Django nor the app, so that the worker processes start quickly.
+# A backend is a function taking a text message and a signature, and returning the address that signed it.
+_backends = {}
+
+
+# Default backend, the pure Python secp256k1 of eth_account, or coincurve when it is installed
+def eth_account_recover(message, signature):
+    return Account.recover_message(encode_defunct(text=message), signature=signature)
+
+
+# This function returns the backend function named by its dotted path, imported once per process
+def load_backend(path):
+    backend = _backends.get(path)
+    if backend is None:
+        module, name = path.rsplit('.', 1)
+        backend = _backends[path] = getattr(importlib.import_module(module), name)
+    return backend
+
+
+# This function recovers a batch of (message, signature) pairs with the given backend.
+# It returns one (address, error) tuple per pair, so that an invalid signature does not fail the whole batch.
+def recover_batch(path, pairs):
+    backend = load_backend(path)
+    results = []
+    for message, signature in pairs:
+        try:
+            results.append((backend(message, signature), None))
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+    return results
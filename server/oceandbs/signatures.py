@@ -0,0 +1,188 @@
+import hashlib
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from . import metrics
+from .cache import TTLCache
+from .signature_backends import load_backend, recover_batch
+
+# Addresses recovered from (message, signature) pairs. Clients retrying or paginating send the same pairs again,
+# their recovery is then a lookup instead of a secp256k1 computation.
+recovered_addresses = TTLCache('signatures', getattr(settings, 'SIGNATURE_CACHE_SIZE', 4096), getattr(settings, 'SIGNATURE_CACHE_TTL', 3600))
+
+
+class SignatureError(ValueError):
+    """
+    Raised when the address cannot be recovered from a signature.
+    """
+
+
+class SignatureVerifier:
+    """
+    Recovers the addresses that signed messages with the given backend, a dotted path to a function.
+    Without workers, recoveries run inline in the calling thread. With workers, the pairs submitted by all the
+    request threads are gathered into batches of at most batch_size pairs, waiting batch_wait seconds at most
+    for a batch to fill, and each batch is recovered in one task of a pool of worker processes.
+    When a worker process dies, the pool is replaced and the batches it failed are recovered inline.
+    """
+
+    def __init__(self, backend, workers=0, batch_size=64, batch_wait=0.002):
+        self.backend = backend
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.lock = threading.Lock()
+        self.pool_lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.pool = None
+        self.dispatcher = None
+
+    def recover(self, message, signature):
+        if not self.workers:
+            try:
+                return load_backend(self.backend)(message, signature)
+            finally:
+                metrics.increment('signature_recoveries')
+        return self.submit(message, signature).result()
+
+    # Returns a future of the address, resolved once the batch holding the pair is recovered
+    def submit(self, message, signature):
+        future = Future()
+        self.start()
+        self.pending.put((message, signature, future))
+        return future
+
+    def start(self):
+        if self.dispatcher is not None:
+            return
+        with self.lock:
+            if self.dispatcher is None:
+                self.pool = self.create_pool()
+                self.dispatcher = threading.Thread(target=self.dispatch, name='signature-batches', daemon=True)
+                self.dispatcher.start()
+
+    def create_pool(self):
+        # Worker processes are spawned rather than forked, the server threads are not copied into them
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    # Replaces the pool broken by the death of one of its processes, unless it was already replaced or the verifier stopped
+    def restart_pool(self, broken):
+        with self.pool_lock:
+            if self.pool is broken:
+                broken.shutdown(wait=False)
+                self.pool = self.create_pool()
+                metrics.increment('signature_pool_restarts')
+
+    def dispatch(self):
+        while True:
+            batch = [self.pending.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.pending.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.pending.put(None)
+                    break
+                batch.append(item)
+
+            metrics.observe('signature_batch_size', len(batch), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+            pool = self.pool
+            try:
+                task = pool.submit(recover_batch, self.backend, [(message, signature) for message, signature, _ in batch])
+            except BrokenProcessPool:
+                self.restart_pool(pool)
+                metrics.increment('signature_recoveries', len(batch))
+                self.settle(batch, recover_batch(self.backend, [(message, signature) for message, signature, _ in batch]))
+                continue
+            except RuntimeError as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            task.add_done_callback(lambda task, batch=batch, pool=pool: self.resolve(batch, task, pool))
+
+    def resolve(self, batch, task, pool):
+        metrics.increment('signature_recoveries', len(batch))
+        try:
+            results = task.result()
+        except BrokenProcessPool:
+            self.restart_pool(pool)
+            results = recover_batch(self.backend, [(message, signature) for message, signature, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        self.settle(batch, results)
+
+    # Resolves the futures of a batch with the (address, error) tuples recovered for it
+    def settle(self, batch, results):
+        for (_, _, future), (address, error) in zip(batch, results):
+            if error is None:
+                future.set_result(address)
+            else:
+                future.set_exception(SignatureError(error))
+
+    def shutdown(self):
+        with self.lock:
+            if self.dispatcher is not None:
+                self.pending.put(None)
+                self.dispatcher.join()
+                with self.pool_lock:
+                    self.pool.shutdown()
+                    self.pool = None
+                self.dispatcher = None
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+# This function returns the verifier configured by SIGNATURE_BACKEND and SIGNATURE_WORKERS
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = SignatureVerifier(
+                    getattr(settings, 'SIGNATURE_BACKEND', 'oceandbs.signature_backends.eth_account_recover'),
+                    workers=getattr(settings, 'SIGNATURE_WORKERS', 0),
+                    batch_size=getattr(settings, 'SIGNATURE_BATCH_SIZE', 64),
+                    batch_wait=getattr(settings, 'SIGNATURE_BATCH_WAIT', 0.002),
+                )
+    return _verifier
+
+
+def _signature_key(message, signature):
+    if isinstance(signature, (bytes, bytearray)):
+        signature = '0x' + bytes(signature).hex()
+    return hashlib.sha256(message.encode('utf-8')).hexdigest(), str(signature).lower()
+
+
+# This function returns the address that signed the text message, from the cache when possible, otherwise through the verifier.
+# Invalid signatures raise an exception, and are not cached.
+def recover_address(message, signature):
+    key = _signature_key(message, signature)
+    address = recovered_addresses.get(key)
+    if address is None:
+        address = get_verifier().recover(message, signature)
+        recovered_addresses.set(key, address)
+    return address
+
+
+# This function drops the cached addresses, and stops the verifier so that the next one follows the settings
+def clear():
+    global _verifier
+    recovered_addresses.clear()
+    with _verifier_lock:
+        if _verifier is not None:
+            _verifier.shutdown()
+        _verifier = None
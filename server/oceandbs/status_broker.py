@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+from . import metrics
+
+
+def _resolve(future, status):
+    if not future.done():
+        future.set_result(status)
+
+
+class StatusBroker:
+    """
+    In-process registry of the clients waiting for a quote status change.
+    Waiting clients are asyncio futures: holding one costs no thread, whatever the number of watchers.
+    Status changes are published from any thread, and resolve the futures in their own event loop.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watchers = {}  # quoteId -> set of (loop, future)
+
+    # Must be called from the event loop of the waiting client
+    def watch(self, quoteId):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            self.watchers.setdefault(str(quoteId), set()).add((loop, future))
+            count = sum(len(watchers) for watchers in self.watchers.values())
+        metrics.set_gauge('status_watchers', count)
+        return future
+
+    def unwatch(self, quoteId, future):
+        with self.lock:
+            watchers = self.watchers.get(str(quoteId))
+            if watchers is not None:
+                watchers.discard((future.get_loop(), future))
+                if not watchers:
+                    del self.watchers[str(quoteId)]
+            count = sum(len(watchers) for watchers in self.watchers.values())
+        metrics.set_gauge('status_watchers', count)
+
+    # Wakes up the clients waiting for the status of a quote, they check whether it changed for them
+    def publish(self, quoteId, status):
+        with self.lock:
+            watchers = list(self.watchers.get(str(quoteId), ()))
+        for loop, future in watchers:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, str(status))
+            except RuntimeError:
+                # The event loop of the client is closed, it is not waiting anymore
+                pass
+
+    def publish_many(self, statuses):
+        for quoteId, status in statuses.items():
+            self.publish(quoteId, status)
+
+    # Returns the quoteIds someone is waiting for
+    def watched(self):
+        with self.lock:
+            return list(self.watchers)
+
+
+broker = StatusBroker()
@@ -1,15 +1,59 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 import datetime
-from .models import Storage
+import os
+from django.conf import settings
+from .models import Quote, Storage, UploadSession, UploadJob, JOB_STATE
+from .registry import registry_changed
 
-# Simple scheduled tasks to run every minutes which checks when a storage service is more than 10 minutes old, and if so, set it to inactive
+# Simple scheduled tasks to run every minutes which deactivates the storage services that did not register or send a heartbeat
+# for STORAGE_HEARTBEAT_TIMEOUT seconds, in a single indexed UPDATE whatever the number of storages
 def remove_expired_storage():
-  date_check=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=10)
-  storages = Storage.objects.filter(created__lte=date_check)
-  for storage in storages:
-    storage.is_active = False
+  date_check=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=settings.STORAGE_HEARTBEAT_TIMEOUT)
+  expired = Storage.objects.filter(is_active=True, last_heartbeat__lte=date_check).update(is_active=False)
+  if expired:
+    print(f"Deactivated {expired} storages without heartbeat.")
+    registry_changed()
+  return expired
+
+# Scheduled task removing the resumable upload sessions abandoned by their users, along with their staged bytes
+def remove_expired_upload_sessions():
+  date_check=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+  sessions = UploadSession.objects.filter(created__lte=date_check)
+  for session in sessions:
+    if os.path.exists(session.path):
+      os.remove(session.path)
+  sessions.delete()
+
+# Scheduled task rescheduling the upload jobs lost by a restart, or stuck for longer than UPLOAD_JOB_TIMEOUT
+def requeue_stale_upload_jobs():
+  from .jobs import schedule_upload_job
+  now = datetime.datetime.now(datetime.timezone.utc)
+  UploadJob.objects.filter(
+    state=JOB_STATE[1][0], updated__lte=now - datetime.timedelta(seconds=settings.UPLOAD_JOB_TIMEOUT)
+  ).update(state=JOB_STATE[0][0], updated=now)
+  jobs = UploadJob.objects.filter(state=JOB_STATE[0][0], updated__lte=now - datetime.timedelta(minutes=1))
+  job_ids = list(jobs.values_list('pk', flat=True))
+  jobs.update(updated=now)
+  for job_id in job_ids:
+    schedule_upload_job(job_id)
+
+# Scheduled task refreshing the status of the quotes in progress, for the storages which do not push their statuses
+def poll_quote_statuses():
+  from .utils import poll_quote_statuses as poll
+  poll()
+
+# Scheduled task publishing the statuses of the watched quotes, so that changes made by other processes reach the waiting clients
+def publish_watched_statuses():
+  from .status_broker import broker
+  quoteIds = broker.watched()
+  if quoteIds:
+    broker.publish_many(dict(Quote.objects.filter(quoteId__in=quoteIds).values_list('quoteId', 'status')))
 
 def start():
   sched = BackgroundScheduler()
   sched.add_job(remove_expired_storage, 'cron', minute='*')
+  sched.add_job(remove_expired_upload_sessions, 'cron', minute='*/15')
+  sched.add_job(requeue_stale_upload_jobs, 'cron', minute='*')
+  sched.add_job(publish_watched_statuses, 'interval', seconds=settings.STATUS_WAIT_RECHECK, max_instances=1, coalesce=True)
+  sched.add_job(poll_quote_statuses, 'interval', seconds=settings.STATUS_POLL_INTERVAL, max_instances=1, coalesce=True)
   sched.start()
\ No newline at end of file
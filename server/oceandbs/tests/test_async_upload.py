@@ -0,0 +1,138 @@
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+import requests
+import responses
+
+from oceandbs.jobs import run_upload_job
+from oceandbs.models import File as DBSFile, Quote, UploadJob, UPLOAD_CODE
+from ..utils import generate_signature
+
+STAGING_DIR = tempfile.mkdtemp()
+
+# Upload with async=true, the request returns once the files are staged and the job runs afterwards
+@override_settings(UPLOAD_STAGING_DIR=STAGING_DIR)
+class TestAsyncUploadEndpoint(APITestCase):
+  fixtures = ["storages.json"]
+
+  @classmethod
+  def tearDownClass(cls):
+    super().tearDownClass()
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+
+  def setUp(self):
+    self.client = APIClient()
+    nonce = int(time.time())
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    self.upload_url = f'/upload?quoteId=123565&nonce={nonce}&signature={signature}&async=true'
+
+  @responses.activate
+  def test_async_upload(self):
+    responses.post(
+      url='http://127.0.0.1:5001/api/v0/add',
+      body='{"Name":"data.bin","Hash":"QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq","Size":"1000"}',
+      status=200
+    )
+    responses.post(url='https://filecoin.org/upload/', status=200)
+
+    with self.captureOnCommitCallbacks() as callbacks:
+      response = self.client.post(self.upload_url, {'file1': SimpleUploadedFile('data.bin', b'0123456789' * 100)}, format="multipart")
+
+    self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+    self.assertEqual(len(callbacks), 1)
+    self.assertEqual(len(responses.calls), 0)
+
+    # While the job is pending, the status is served locally without calling the micro-service
+    response = self.client.get('/getStatus?quoteId=123565')
+    self.assertEqual(response.data['status'], str(UPLOAD_CODE[4][0]))
+    self.assertEqual(len(responses.calls), 0)
+
+    # A second upload is refused while the first one is in progress
+    response = self.client.post(self.upload_url, {'file1': SimpleUploadedFile('data.bin', b'0')}, format="multipart")
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    job = UploadJob.objects.get()
+    run_upload_job(job.pk)
+
+    job.refresh_from_db()
+    self.assertEqual(job.state, 'done')
+    self.assertEqual(DBSFile.objects.get().length, 1000)
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[5][0]))
+
+  @override_settings(IPFS_ADD_RETRIES=0)
+  @responses.activate
+  def test_async_upload_failure(self):
+    responses.post(url='http://127.0.0.1:5001/api/v0/add', status=500)
+
+    with self.captureOnCommitCallbacks():
+      response = self.client.post(self.upload_url, {'file1': SimpleUploadedFile('data.bin', b'0123456789')}, format="multipart")
+    self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    staged_path = UploadJob.objects.get().files[0]['path']
+    job = run_upload_job(UploadJob.objects.get().pk)
+
+    self.assertEqual(job.state, 'failed')
+    self.assertIsNotNone(job.error)
+    self.assertFalse(os.path.exists(staged_path))
+    response = self.client.get('/getStatus?quoteId=123565')
+    self.assertEqual(response.data['status'], str(UPLOAD_CODE[6][0]))
+
+  @responses.activate
+  def test_async_upload_microservice_error(self):
+    responses.post(
+      url='http://127.0.0.1:5001/api/v0/add',
+      body='{"Name":"data.bin","Hash":"QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq","Size":"10"}',
+      status=200
+    )
+    responses.post(url='https://filecoin.org/upload/', body=requests.ConnectionError('connection refused'))
+
+    with self.captureOnCommitCallbacks():
+      self.client.post(self.upload_url, {'file1': SimpleUploadedFile('data.bin', b'0123456789')}, format="multipart")
+    staged_path = UploadJob.objects.get().files[0]['path']
+
+    job = run_upload_job(UploadJob.objects.get().pk)
+
+    self.assertEqual(job.state, 'failed')
+    self.assertFalse(os.path.exists(staged_path))
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[6][0]))
+
+    # The upload can be retried
+    nonce = int(time.time()) + 1
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    with self.captureOnCommitCallbacks():
+      response = self.client.post(f'/upload?quoteId=123565&nonce={nonce}&signature={signature}&async=true',
+        {'file1': SimpleUploadedFile('data.bin', b'0123456789')}, format="multipart")
+    self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+  @responses.activate
+  def test_nonce_advanced_during_job(self):
+    responses.post(
+      url='http://127.0.0.1:5001/api/v0/add',
+      body='{"Name":"data.bin","Hash":"QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq","Size":"10"}',
+      status=200
+    )
+    advanced = timezone.now() + datetime.timedelta(hours=1)
+    # A getLink request consumes a newer nonce while the files are pushed
+    def upload(request):
+      Quote.objects.filter(quoteId='123565').update(nonce=advanced)
+      return (200, {}, '')
+    responses.add_callback(responses.POST, 'https://filecoin.org/upload/', callback=upload)
+
+    with self.captureOnCommitCallbacks():
+      self.client.post(self.upload_url, {'file1': SimpleUploadedFile('data.bin', b'0123456789')}, format="multipart")
+    job = run_upload_job(UploadJob.objects.get().pk)
+
+    self.assertEqual(job.state, 'done')
+    quote = Quote.objects.get()
+    self.assertEqual(quote.status, str(UPLOAD_CODE[5][0]))
+    # The status written at the end of the job does not roll the nonce back
+    self.assertEqual(quote.nonce, advanced)
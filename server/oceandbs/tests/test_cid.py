@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from oceandbs.unixfs import UnixFSHasher, compute_cid
+from ..utils import generate_signature
+
+STAGING_DIR = tempfile.mkdtemp()
+
+# CIDs given by `ipfs add` (kubo, default settings) to small contents
+KUBO_CIDS_V0 = {
+  b'': 'QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH',
+  b'hello world': 'Qmf412jQZiuVUtdgnB36FXFX7xg5V6KEbSJ4dpQuhkLyfD',
+  b'hello world\n': 'QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o',
+}
+
+# CIDs given by `ipfs add --cid-version=1`, which uses raw leaves
+KUBO_CIDS_V1 = {
+  b'': 'bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku',
+  b'hello world\n': 'bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4',
+}
+
+# Compute CIDs locally and compare them with the ones kubo gives
+class TestLocalCID(SimpleTestCase):
+  def test_kubo_cids_v0(self):
+    for content, cid in KUBO_CIDS_V0.items():
+      self.assertEqual(compute_cid([content]), cid)
+
+  def test_kubo_cids_v1(self):
+    for content, cid in KUBO_CIDS_V1.items():
+      self.assertEqual(compute_cid([content], cid_version=1), cid)
+
+  def test_chunks_boundaries(self):
+    # The CID only depends on the content, not on how it was received
+    content = bytes(range(256)) * 5000
+    expected = compute_cid([content], chunk_size=1000)
+    pieces = [content[i:i + 777] for i in range(0, len(content), 777)]
+    self.assertEqual(compute_cid(pieces, chunk_size=1000), expected)
+    self.assertNotEqual(compute_cid([content], chunk_size=1024), expected)
+
+  def test_single_chunk_is_root(self):
+    # A content filling exactly one chunk is a single leaf, with no parent node
+    content = b'a' * 16
+    self.assertEqual(compute_cid([content], chunk_size=16), compute_cid([content], chunk_size=32))
+    self.assertNotEqual(compute_cid([content + b'a'], chunk_size=16), compute_cid([content + b'a'], chunk_size=32))
+
+  def test_balanced_layout(self):
+    # Up to 174 leaves hang from the root, one more adds a level to the tree
+    hasher = UnixFSHasher(chunk_size=1)
+    hasher.update(b'x' * 174)
+    hasher.cid()
+    self.assertEqual(len(hasher.levels), 2)
+
+    hasher = UnixFSHasher(chunk_size=1)
+    hasher.update(b'x' * 175)
+    hasher.cid()
+    self.assertEqual(len(hasher.levels), 3)
+
+  def test_cid_v1_multiple_chunks(self):
+    # Raw leaves under a dag-pb root
+    self.assertTrue(compute_cid([b'x' * 32], cid_version=1, chunk_size=32).startswith('bafkrei'))
+    self.assertTrue(compute_cid([b'x' * 33], cid_version=1, chunk_size=32).startswith('bafybei'))
+
+  def test_unsupported_version(self):
+    with self.assertRaises(ValueError):
+      UnixFSHasher(cid_version=2)
+
+
+# The CIDs computed while the files are staged are returned with the 202 of an async upload
+@override_settings(UPLOAD_STAGING_DIR=STAGING_DIR)
+class TestAsyncUploadCID(APITestCase):
+  fixtures = ["storages.json"]
+
+  @classmethod
+  def tearDownClass(cls):
+    super().tearDownClass()
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+
+  def test_async_upload_returns_cid(self):
+    client = APIClient()
+    nonce = int(time.time())
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+
+    response = client.post(
+      f'/upload?quoteId=123565&nonce={nonce}&signature={signature}&async=true',
+      {'file1': SimpleUploadedFile('hello.txt', b'hello world\n')},
+      format="multipart"
+    )
+    self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+    self.assertEqual(response.data['files'], [{'name': 'hello.txt', 'cid': KUBO_CIDS_V0[b'hello world\n']}])
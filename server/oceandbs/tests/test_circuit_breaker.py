@@ -0,0 +1,82 @@
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs import circuit_breaker, metrics
+
+STATUS_URL = 'https://filecoin.org/getStatus?quoteId=123565'
+
+# A failing storage micro-service gets its circuit opened, requests then fail fast until a probe succeeds
+@override_settings(BREAKER_FAILURE_THRESHOLD=3, BREAKER_OPEN_SECONDS=60, STATUS_MAX_AGE=0)
+class TestCircuitBreaker(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    circuit_breaker.reset()
+
+  def tearDown(self):
+    circuit_breaker.reset()
+
+  @responses.activate
+  def test_circuit_opens_after_failures(self):
+    responses.get(url=STATUS_URL, status=500)
+
+    for _ in range(3):
+      response = self.client.get('/getStatus?quoteId=123565')
+      self.assertNotEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+    self.assertEqual(len(responses.calls), 3)
+
+    # The storage is not called anymore while the circuit is open
+    response = self.client.get('/getStatus?quoteId=123565')
+    self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+    self.assertIn('Retry-After', response)
+    self.assertEqual(len(responses.calls), 3)
+
+    self.assertEqual(metrics.snapshot()['circuit_breakers']['filecoin']['state'], circuit_breaker.OPEN)
+
+  @responses.activate
+  def test_half_open_probe(self):
+    responses.get(url=STATUS_URL, status=500)
+    for _ in range(3):
+      self.client.get('/getStatus?quoteId=123565')
+
+    with override_settings(BREAKER_OPEN_SECONDS=0):
+      # The probe fails, the circuit opens again
+      self.client.get('/getStatus?quoteId=123565')
+      self.assertEqual(len(responses.calls), 4)
+      self.assertEqual(circuit_breaker.breakers_status()['filecoin']['state'], circuit_breaker.OPEN)
+
+      # The probe succeeds, the circuit closes
+      responses.replace(responses.GET, STATUS_URL, json={'status': 400}, status=200)
+      response = self.client.get('/getStatus?quoteId=123565')
+      self.assertEqual(response.data['status'], 400)
+      self.assertEqual(circuit_breaker.breakers_status()['filecoin']['state'], circuit_breaker.CLOSED)
+
+  def test_single_probe_at_a_time(self):
+    breaker = circuit_breaker.CircuitBreaker('filecoin')
+    for _ in range(3):
+      breaker.record(False, 0.1)
+    self.assertFalse(breaker.allow())
+
+    with override_settings(BREAKER_OPEN_SECONDS=0):
+      self.assertTrue(breaker.allow())
+      self.assertFalse(breaker.allow())
+      breaker.record(True, 0.1)
+      self.assertTrue(breaker.allow())
+      self.assertTrue(breaker.allow())
+
+  @override_settings(BREAKER_SLOW_CALL=1)
+  def test_slow_calls_count_as_failures(self):
+    breaker = circuit_breaker.CircuitBreaker('filecoin')
+    for _ in range(3):
+      breaker.record(True, 2)
+    self.assertEqual(breaker.status()['state'], circuit_breaker.OPEN)
+
+  @override_settings(BREAKER_MIN_CALLS=4, BREAKER_ERROR_RATE=0.5)
+  def test_error_rate(self):
+    breaker = circuit_breaker.CircuitBreaker('filecoin')
+    for success in (True, False, True, False):
+      breaker.record(success, 0.1)
+    self.assertEqual(breaker.status()['state'], circuit_breaker.OPEN)
@@ -0,0 +1,56 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs.models import File as DBSFile, Quote, UPLOAD_CODE
+from ..utils import generate_signature
+
+CONTENT = b'0123456789' * 100
+CONTENT_SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+# Upload a file whose content was already added to IPFS by a previous upload
+class TestUploadDeduplication(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    nonce = int(time.time())
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    self.upload_url = f'/upload?quoteId=123565&nonce={nonce}&signature={signature}'
+
+  @override_settings(IPFS_STREAMING_UPLOAD=False)
+  @responses.activate
+  def test_known_content_is_not_added_again(self):
+    DBSFile.objects.create(title='previous.bin', cid='QmPrevious', length=len(CONTENT), sha256=CONTENT_SHA256)
+    responses.post(url='https://filecoin.org/upload/', status=200)
+
+    response = self.client.post(self.upload_url, {'file1': SimpleUploadedFile('data.bin', CONTENT)}, format="multipart")
+
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    # Only the micro-service has been called, not IPFS
+    self.assertEqual([call.request.url.split('?')[0] for call in responses.calls], ['https://filecoin.org/upload/'])
+    file = DBSFile.objects.get(quote__quoteId='123565')
+    self.assertEqual(file.cid, 'QmPrevious')
+    self.assertEqual(file.sha256, CONTENT_SHA256)
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[5][0]))
+
+  @override_settings(IPFS_STREAMING_UPLOAD=True)
+  @responses.activate
+  def test_streamed_file_digest_is_recorded(self):
+    responses.post(
+      url='http://127.0.0.1:5001/api/v0/add',
+      body='{"Name":"data.bin","Hash":"QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq","Size":"1000"}',
+      status=200
+    )
+    responses.post(url='https://filecoin.org/upload/', status=200)
+
+    response = self.client.post(self.upload_url, {'file1': SimpleUploadedFile('data.bin', CONTENT)}, format="multipart")
+
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(DBSFile.objects.get().sha256, CONTENT_SHA256)
@@ -0,0 +1,72 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import SimpleTestCase
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from oceandbs import http_client, metrics
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    content = b'{"status": 400}'
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  def log_message(self, *args):
+    pass
+
+
+# Successive calls to the same host reuse the pooled keep-alive connection
+class TestPooledHTTPClient(SimpleTestCase):
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StatusHandler)
+    cls.url = f'http://127.0.0.1:{cls.server.server_port}/'
+    threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    super().tearDownClass()
+
+  def setUp(self):
+    http_client.close_all()
+
+  def test_connection_reuse(self):
+    for _ in range(5):
+      response = http_client.get(self.url + 'getStatus?quoteId=1')
+      self.assertEqual(response.json(), {"status": 400})
+
+    stats = http_client.pool_stats()[self.url.rstrip('/')]
+    self.assertEqual(stats['requests'], 5)
+    self.assertEqual(stats['connections'], 1)
+    self.assertEqual(stats['hit_rate'], 0.8)
+
+  def test_one_session_per_host(self):
+    self.assertIs(http_client.get_session(self.url + 'a'), http_client.get_session(self.url + 'b'))
+    self.assertIsNot(http_client.get_session(self.url), http_client.get_session('http://localhost:1/'))
+
+  def test_latency_recorded(self):
+    host = self.url.rstrip('/')
+    metrics.reset()
+    http_client.get(self.url)
+    snapshot = metrics.snapshot()
+    self.assertEqual(snapshot['counters'][f'upstream_responses{{host="{host}",status="200"}}'], 1)
+    self.assertEqual(snapshot['histograms'][f'upstream_request_seconds{{host="{host}"}}']['count'], 1)
+
+
+class TestMetricsEndpoint(APITestCase):
+  def test_metrics(self):
+    response = APIClient().get('/metrics')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertIn('upstream_pools', response.data)
+    self.assertIn('histograms', response.data)
@@ -0,0 +1,99 @@
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from eth_account.messages import encode_defunct
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from web3.auto import w3
+
+from oceandbs.models import File, Payment, PaymentMethod, Quote, Storage
+
+# The history of a user is read from the local quotes, newest first, one keyset page at a time
+class TestLocalHistory(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    self.account = w3.eth.account.from_key(getattr(settings, 'TEST_PRIVATE_KEY', ''))
+    self.nonce = int(time.time())
+    filecoin = Storage.objects.get(type='filecoin')
+    arweave = Storage.objects.create(type='arweave', description='Arweave', url='https://arweave.org/')
+    now = timezone.now()
+    user = self.account.address.lower()
+    for index in range(5):
+      Quote.objects.create(quoteId=f'filecoin-{index}', storage=filecoin, duration=1, status='400',
+        userAddress=user, created=now - datetime.timedelta(minutes=index * 2))
+    # Two quotes created at the same time are both listed, whatever the page boundary
+    Quote.objects.create(quoteId='arweave-0', storage=arweave, duration=1, status='300', userAddress=user,
+      created=now - datetime.timedelta(minutes=3))
+    Quote.objects.create(quoteId='arweave-1', storage=arweave, duration=1, status='300', userAddress=user,
+      created=now - datetime.timedelta(minutes=3))
+    Quote.objects.create(quoteId='other-user', storage=filecoin, duration=1, userAddress='0x1234', created=now)
+
+    payment = Payment.objects.create(paymentMethod=PaymentMethod.objects.get(pk=1), userAddress=self.account.address)
+    Quote.objects.filter(quoteId='filecoin-0').update(payment=payment)
+    File.objects.create(quote=Quote.objects.get(quoteId='filecoin-0'), cid='QmXXX', length=12)
+
+  def get_history(self, key=None, **params):
+    self.nonce += 1
+    message = "0x" + hashlib.sha256(('' + str(self.nonce)).encode('utf-8')).hexdigest()
+    signature = w3.eth.account.sign_message(encode_defunct(text=message), private_key=key or self.account.key).signature.hex()
+    params = {'source': 'local', 'userAddress': self.account.address, 'nonce': self.nonce, 'signature': signature, **params}
+    return self.client.get('/getHistory', params)
+
+  def test_pages(self):
+    quoteIds = []
+    cursor = None
+    while True:
+      response = self.get_history(pageSize=2, **({'cursor': cursor} if cursor else {}))
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      quoteIds += [quote['quoteId'] for quote in response.data['quotes']]
+      cursor = response.data['next']
+      if cursor is None:
+        break
+
+    self.assertEqual(quoteIds, ['filecoin-0', 'filecoin-1', 'arweave-1', 'arweave-0', 'filecoin-2', 'filecoin-3', 'filecoin-4'])
+
+  def test_quote_details(self):
+    response = self.get_history(pageSize=1)
+    quote = response.data['quotes'][0]
+    self.assertEqual(quote['type'], 'filecoin')
+    self.assertEqual(quote['status'], 400)
+    self.assertEqual(quote['chainId'], 80001)
+    self.assertEqual(quote['files'], [{'cid': 'QmXXX', 'length': 12}])
+
+  def test_legacy_status(self):
+    # Older versions stored the whole status tuple
+    Quote.objects.filter(quoteId='filecoin-0').update(status="(300, 'Uploading file to storage')")
+    Quote.objects.filter(quoteId='filecoin-1').update(status='unknown')
+    response = self.get_history(pageSize=2)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual([quote['status'] for quote in response.data['quotes']], [300, None])
+
+  def test_storage_filter(self):
+    response = self.get_history(storage='arweave')
+    self.assertEqual([quote['quoteId'] for quote in response.data['quotes']], ['arweave-1', 'arweave-0'])
+    self.assertIsNone(response.data['next'])
+
+  def test_page_queries(self):
+    cursor = self.get_history(pageSize=2).data['next']
+    # Nonce lookup and consumption, then the page of quotes and their files, whatever the position of the page
+    with self.assertNumQueries(4):
+      response = self.get_history(pageSize=2, cursor=cursor)
+    self.assertEqual(len(response.data['quotes']), 2)
+
+  def test_replayed_nonce(self):
+    self.assertEqual(self.get_history().status_code, status.HTTP_200_OK)
+    self.nonce -= 1
+    self.assertEqual(self.get_history().status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_other_signer(self):
+    response = self.get_history(key='0x' + '11' * 32)
+    self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+  def test_invalid_cursor(self):
+    self.assertEqual(self.get_history(cursor='forged').status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.get_history(pageSize=1000).status_code, status.HTTP_400_BAD_REQUEST)
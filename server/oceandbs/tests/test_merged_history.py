@@ -0,0 +1,117 @@
+import datetime
+from urllib.parse import parse_qs, urlparse
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+import responses
+
+from oceandbs import circuit_breaker
+from oceandbs.models import Quote, Storage
+
+# With storage=all, the histories of every active storage are read at once and merged by the creation time of the local quotes
+class TestMergedHistory(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    circuit_breaker.reset()
+    Storage.objects.create(type='arweave', description='Arweave', url='https://arweave.org/')
+    # Creation times, newest first, of the quotes of each storage. None stands for a quote the uploader does not know,
+    # it is listed after the entry before it in the history of its storage.
+    self.histories = {
+      'filecoin': [100, 90, 50, 40, 30],
+      'arweave': [95, 60, None, 10],
+    }
+    now = timezone.now()
+    for storage_type, times in self.histories.items():
+      storage = Storage.objects.get(type=storage_type)
+      for time in times:
+        if time is not None:
+          Quote.objects.create(quoteId=f'{storage_type}-{time}', storage=storage, duration=1,
+            created=now - datetime.timedelta(seconds=1000 - time))
+    self.pages = []
+
+  def tearDown(self):
+    circuit_breaker.reset()
+
+  def mock_storages(self):
+    def history(storage_type):
+      def callback(request):
+        query = parse_qs(urlparse(request.url).query)
+        page, pageSize = int(query['page'][0]), int(query['pageSize'][0])
+        self.pages.append((storage_type, page))
+        times = self.histories[storage_type][(page - 1) * pageSize:page * pageSize]
+        # Entries as returned by the micro-services, without creation time; filecoin groups them in lists
+        entries = [{
+          'quoteId': f'{storage_type}-{time if time is not None else "unknown"}',
+          'chainId': 80001,
+          'tokenAddress': '0x222',
+          'tokenAmount': '999999999',
+          'approveAddress': '0x1234',
+          'transactionHash': 'xxxx'
+        } for time in times]
+        if storage_type == 'filecoin':
+          entries = [entries[:1], entries[1:]] if entries else []
+        return (200, {}, json.dumps(entries))
+      return callback
+
+    responses.add_callback(responses.GET, 'https://filecoin.org/getHistory', callback=history('filecoin'))
+    responses.add_callback(responses.GET, 'https://arweave.org/getHistory', callback=history('arweave'))
+
+  def get_history(self, **params):
+    params = {'storage': 'all', 'userAddress': '0x123', 'nonce': 1, 'signature': '0x', **params}
+    return self.client.get('/getHistory', params)
+
+  @responses.activate
+  def test_pages(self):
+    self.mock_storages()
+    sizes = []
+    quoteIds = []
+    cursor = None
+    while True:
+      response = self.get_history(pageSize=3, **({'cursor': cursor} if cursor else {}))
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      self.assertEqual(response.data['unavailable'], [])
+      sizes.append(len(response.data['quotes']))
+      quoteIds += [quote['quoteId'] for quote in response.data['quotes']]
+      self.assertTrue(all(quote['type'] == quote['quoteId'].split('-')[0] for quote in response.data['quotes']))
+      cursor = response.data['next']
+      if cursor is None:
+        break
+
+    # Pages are full until the histories end
+    self.assertEqual(sizes, [3, 3, 3])
+    self.assertEqual(quoteIds, [
+      'filecoin-100', 'arweave-95', 'filecoin-90', 'arweave-60', 'arweave-unknown',
+      'filecoin-50', 'filecoin-40', 'filecoin-30', 'arweave-10'
+    ])
+    # Pages of a storage already returned are never fetched again
+    for storage_type in self.histories:
+      pages = [page for fetched_type, page in self.pages if fetched_type == storage_type]
+      self.assertEqual(pages, sorted(pages))
+
+  @responses.activate
+  def test_unavailable_storage(self):
+    self.mock_storages()
+    Storage.objects.create(type='down', description='Failing storage', url='https://down.org/')
+    responses.get(url='https://down.org/getHistory', status=500)
+
+    response = self.get_history(pageSize=10)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(len(response.data['quotes']), 9)
+    self.assertEqual(response.data['unavailable'], ['down'])
+    # The failing storage is asked again with the next page
+    self.assertIsNotNone(response.data['next'])
+
+  @responses.activate
+  def test_single_query_per_page(self):
+    self.mock_storages()
+    # The storages are resolved from the registry, the creation times of all the entries are read at once
+    self.get_history(pageSize=3)
+    with self.assertNumQueries(1):
+      self.get_history(pageSize=3)
+
+  def test_invalid_cursor(self):
+    self.assertEqual(self.get_history(cursor='forged').status_code, status.HTTP_400_BAD_REQUEST)
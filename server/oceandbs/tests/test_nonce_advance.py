@@ -0,0 +1,79 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs import circuit_breaker, signatures
+from oceandbs.models import Quote
+from ..utils import check_params_validity, generate_signature
+
+# The nonce of a quote is advanced by a single conditional UPDATE of the nonce column, compared as a number
+class TestNonceAdvance(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.nonce = int(time.time())
+    signatures.clear()
+    circuit_breaker.reset()
+
+  def tearDown(self):
+    signatures.clear()
+
+  def params(self, nonce):
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    return {'nonce': [str(nonce)], 'signature': [signature]}
+
+  def test_single_update(self):
+    quote = Quote.objects.get(quoteId='123565')
+    with self.assertNumQueries(1):
+      self.assertIs(check_params_validity(self.params(self.nonce), quote), True)
+    self.assertEqual(round(Quote.objects.get(quoteId='123565').nonce.timestamp()), self.nonce)
+
+  def test_replayed_nonce(self):
+    self.assertIs(check_params_validity(self.params(self.nonce), Quote.objects.get(quoteId='123565')), True)
+    # A second request with the same nonce, served with a quote read before the first one, is refused
+    response = check_params_validity(self.params(self.nonce), Quote.objects.get(quoteId='123565'))
+    self.assertIsInstance(response, Response)
+    self.assertEqual(response.data, "Nonce value invalid.")
+
+  def test_concurrent_requests(self):
+    quotes = [Quote.objects.get(quoteId='123565') for _ in range(2)]
+    results = [check_params_validity(self.params(self.nonce), quote) for quote in quotes]
+    self.assertIs(results[0], True)
+    self.assertIsInstance(results[1], Response)
+
+  def test_numeric_comparison(self):
+    Quote.objects.filter(quoteId='123565').update(nonce=datetime.datetime.fromtimestamp(999999999, timezone.utc))
+    # "999999999" > "1000000000" as strings, the nonce is nevertheless higher
+    self.assertIs(check_params_validity(self.params(1000000000), Quote.objects.get(quoteId='123565')), True)
+
+  def test_invalid_nonce(self):
+    response = check_params_validity({'nonce': ['xxx'], 'signature': ['0x1234']}, Quote.objects.get(quoteId='123565'))
+    self.assertEqual(response.status_code, 400)
+
+  def test_other_columns_untouched(self):
+    quote = Quote.objects.get(quoteId='123565')
+    Quote.objects.filter(quoteId='123565').update(status='400')
+    self.assertIs(check_params_validity(self.params(self.nonce), quote), True)
+    # The status written meanwhile is not overwritten by the stale quote
+    self.assertEqual(Quote.objects.get(quoteId='123565').status, '400')
+
+  @responses.activate
+  def test_status_check_keeps_nonce(self):
+    Quote.objects.filter(quoteId='123565').update(status='300')
+    advanced = timezone.now() + datetime.timedelta(hours=1)
+    # A signed request advances the nonce while the micro-service is asked for the status
+    def get_status(request):
+      Quote.objects.filter(quoteId='123565').update(nonce=advanced)
+      return (200, {}, '{"status": 400}')
+    responses.add_callback(responses.GET, 'https://filecoin.org/getStatus', callback=get_status)
+
+    response = APIClient().get('/getStatus?quoteId=123565')
+    self.assertEqual(response.data['status'], 400)
+    quote = Quote.objects.get(quoteId='123565')
+    self.assertEqual(quote.status, '400')
+    self.assertEqual(quote.nonce, advanced)
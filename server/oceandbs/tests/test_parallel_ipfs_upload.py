@@ -0,0 +1,66 @@
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs.models import File as DBSFile, Quote, UPLOAD_CODE
+from ..utils import generate_signature
+
+# Upload several files added to IPFS one request per file, through a bounded pool of workers
+@override_settings(IPFS_STREAMING_UPLOAD=False, IPFS_ADD_CONCURRENCY=3, IPFS_ADD_RETRIES=1)
+class TestParallelIPFSUpload(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    nonce = int(time.time())
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    self.upload_url = f'/upload?quoteId=123565&nonce={nonce}&signature={signature}'
+    self.attempts = Counter()
+    self.failing = {}
+
+  def ipfs_add_callback(self, request):
+    body = b''.join(request.body)
+    filename = re.search(rb'filename="([^"]+)"', body).group(1).decode()
+    self.attempts[filename] += 1
+    if self.failing.get(filename, 0) >= self.attempts[filename]:
+      return (500, {}, 'error')
+    return (200, {}, '{"Name":"%s","Hash":"Qm%s","Size":"10"}' % (filename, filename.split('.')[0]))
+
+  def post_files(self):
+    return self.client.post(self.upload_url, {
+      'file1': SimpleUploadedFile('a.bin', b'a' * 10),
+      'file2': SimpleUploadedFile('b.bin', b'b' * 10),
+      'file3': SimpleUploadedFile('c.bin', b'c' * 10),
+    }, format="multipart")
+
+  @responses.activate
+  def test_retry_only_failed_files(self):
+    responses.add_callback(responses.POST, 'http://127.0.0.1:5001/api/v0/add', callback=self.ipfs_add_callback)
+    responses.post(url='https://filecoin.org/upload/', status=200)
+    self.failing = {'b.bin': 1}
+
+    response = self.post_files()
+
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(self.attempts, Counter({'a.bin': 1, 'b.bin': 2, 'c.bin': 1}))
+    self.assertEqual(sorted(DBSFile.objects.values_list('cid', flat=True)), ['Qma', 'Qmb', 'Qmc'])
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[5][0]))
+
+  @responses.activate
+  def test_failed_file_does_not_abort_others(self):
+    responses.add_callback(responses.POST, 'http://127.0.0.1:5001/api/v0/add', callback=self.ipfs_add_callback)
+    self.failing = {'c.bin': 2}
+
+    response = self.post_files()
+
+    self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    self.assertIn('c.bin', response.data)
+    self.assertEqual(sorted(DBSFile.objects.values_list('title', flat=True)), ['a.bin', 'b.bin'])
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[6][0]))
@@ -0,0 +1,112 @@
+import time
+
+from django.test import SimpleTestCase
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+import responses
+
+from oceandbs.cache import TTLCache
+from oceandbs.models import Quote, Storage
+from ..utils import quote_cache, invalidate_storage_quotes
+
+# Identical getQuote requests of a user get back the same quote, until it is used or the storage registers again
+class TestQuoteCache(APITestCase):
+  fixtures = ['storages.json']
+
+  def setUp(self):
+    self.client = APIClient()
+    quote_cache.clear()
+    self.body = {
+      "type": "filecoin",
+      "files": [{"length": 123}, {"length": 456}],
+      "duration": 12,
+      "payment": {"chainId": 80001, "tokenAddress": "0x9c3C9283D3e44854697Cd22D3Faa240Cfb032889"},
+      "userAddress": "0xCC866199C810B216710A3F3714d35920C343a8CD"
+    }
+    self.quote_ids = iter(['quote-1', 'quote-2', 'quote-3'])
+
+  def tearDown(self):
+    quote_cache.clear()
+
+  def mock_get_quote(self):
+    def callback(request):
+      return (200, {}, json.dumps({
+        'tokenAmount': 16746036207,
+        'approveAddress': '0xAFcE990754C38Be5E0C341707B2A162C4e67547B',
+        'chainId': 80001,
+        'tokenAddress': '0x9c3C9283D3e44854697Cd22D3Faa240Cfb032889',
+        'quoteId': next(self.quote_ids)
+      }))
+    responses.add_callback(responses.POST, 'https://filecoin.org/getQuote', callback=callback, content_type='application/json')
+
+  def get_quote(self, body=None):
+    return self.client.post('/getQuote', data=json.dumps(body or self.body), content_type='application/json')
+
+  @responses.activate
+  def test_identical_request_reuses_quote(self):
+    self.mock_get_quote()
+    first = self.get_quote()
+    second = self.get_quote()
+
+    self.assertEqual(first.status_code, 201)
+    self.assertEqual(second.status_code, 201)
+    self.assertEqual(second.data, first.data)
+    self.assertEqual(len(responses.calls), 1)
+    self.assertEqual(Quote.objects.filter(quoteId='quote-1').count(), 1)
+
+  @responses.activate
+  def test_different_request(self):
+    self.mock_get_quote()
+    self.get_quote()
+
+    # Another user gets its own quote
+    response = self.get_quote({**self.body, 'userAddress': '0x0000000000000000000000000000000000000001'})
+    self.assertEqual(response.data['quoteId'], 'quote-2')
+
+    # So does a request for other files
+    response = self.get_quote({**self.body, 'files': [{"length": 123}]})
+    self.assertEqual(response.data['quoteId'], 'quote-3')
+
+  @responses.activate
+  def test_used_quote_not_reused(self):
+    self.mock_get_quote()
+    self.get_quote()
+    Quote.objects.filter(quoteId='quote-1').update(status='300')
+
+    response = self.get_quote()
+    self.assertEqual(response.data['quoteId'], 'quote-2')
+
+  @responses.activate
+  def test_storage_registration_invalidates(self):
+    self.mock_get_quote()
+    self.get_quote()
+    invalidate_storage_quotes(Storage.objects.get(type='filecoin'))
+
+    response = self.get_quote()
+    self.assertEqual(response.data['quoteId'], 'quote-2')
+
+
+class TestTTLCache(SimpleTestCase):
+  def test_lru_eviction(self):
+    cache = TTLCache('test', maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    self.assertEqual(cache.get('a'), 1)
+    self.assertIsNone(cache.get('b'))
+    self.assertEqual(cache.get('c'), 3)
+
+  def test_expiry(self):
+    cache = TTLCache('test', maxsize=2, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    self.assertIsNone(cache.get('a'))
+
+  def test_invalidate(self):
+    cache = TTLCache('test', maxsize=10, ttl=60)
+    cache.set((1, 'a'), 1)
+    cache.set((2, 'a'), 2)
+    cache.invalidate(lambda key: key[0] == 1)
+    self.assertIsNone(cache.get((1, 'a')))
+    self.assertEqual(cache.get((2, 'a')), 2)
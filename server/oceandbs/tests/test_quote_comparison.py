@@ -0,0 +1,93 @@
+import threading
+import time
+
+from django.test import override_settings
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+import responses
+
+from oceandbs import circuit_breaker
+from oceandbs.models import Quote, Storage
+from ..utils import quote_cache
+
+# Every active storage is asked for a quote at once, only the quote picked by the client is recorded
+@override_settings(QUOTE_COMPARISON_TIMEOUT=0.5)
+class TestQuoteComparison(APITestCase):
+  fixtures = ['storages.json']
+
+  def setUp(self):
+    self.client = APIClient()
+    quote_cache.clear()
+    circuit_breaker.reset()
+    Storage.objects.create(type='arweave', description='Arweave', url='https://arweave.org/')
+    Storage.objects.create(type='slow', description='Slow storage', url='https://slow.org/')
+    Storage.objects.create(type='down', description='Failing storage', url='https://down.org/')
+    self.body = {
+      "files": [{"length": 123}],
+      "duration": 12,
+      "payment": {"chainId": 80001, "tokenAddress": "0x9c3C9283D3e44854697Cd22D3Faa240Cfb032889"},
+      "userAddress": "0xCC866199C810B216710A3F3714d35920C343a8CD"
+    }
+
+  def tearDown(self):
+    quote_cache.clear()
+    circuit_breaker.reset()
+
+  def mock_storages(self):
+    def quote(quoteId, tokenAmount):
+      return json.dumps({
+        'tokenAmount': tokenAmount,
+        'approveAddress': '0xAFcE990754C38Be5E0C341707B2A162C4e67547B',
+        'chainId': 80001,
+        'tokenAddress': '0x9c3C9283D3e44854697Cd22D3Faa240Cfb032889',
+        'quoteId': quoteId
+      })
+
+    # The slow storage answers once the test released it, after the deadline
+    self.release = threading.Event()
+
+    def slow(request):
+      self.release.wait(5)
+      return (200, {}, quote('slow-quote', 1))
+
+    responses.post(url='https://filecoin.org/getQuote', body=quote('filecoin-quote', 2000), status=200)
+    responses.post(url='https://arweave.org/getQuote', body=quote('arweave-quote', 1000), status=200)
+    responses.add_callback(responses.POST, 'https://slow.org/getQuote', callback=slow)
+    responses.post(url='https://down.org/getQuote', status=500)
+
+  @responses.activate
+  def test_compare_and_select(self):
+    self.mock_storages()
+    start = time.perf_counter()
+    response = self.client.post('/getQuotes', data=json.dumps(self.body), content_type='application/json')
+    elapsed = time.perf_counter() - start
+
+    self.assertEqual(response.status_code, 200)
+    self.assertLess(elapsed, 1)
+    self.assertEqual([quote['quoteId'] for quote in response.data['quotes']], ['arweave-quote', 'filecoin-quote'])
+    self.assertEqual(response.data['unavailable'], ['down', 'slow'])
+    self.assertFalse(Quote.objects.filter(quoteId__in=['arweave-quote', 'filecoin-quote']).exists())
+
+    selection = response.data['quotes'][0]['selection']
+    response = self.client.post('/selectQuote', data=json.dumps({'selection': selection}), content_type='application/json')
+    self.assertEqual(response.status_code, 201)
+    self.assertEqual(response.data['quoteId'], 'arweave-quote')
+    self.assertEqual(response.data['chainId'], 80001)
+
+    # Selecting it again does not record it twice
+    self.client.post('/selectQuote', data=json.dumps({'selection': selection}), content_type='application/json')
+    self.assertEqual(Quote.objects.filter(quoteId='arweave-quote').count(), 1)
+    self.assertFalse(Quote.objects.filter(quoteId='filecoin-quote').exists())
+
+    # Let the late request end before the mocked storages go away
+    self.release.set()
+    while len(responses.calls) < 4:
+      time.sleep(0.01)
+
+  def test_tampered_selection(self):
+    response = self.client.post('/selectQuote', data=json.dumps({'selection': 'forged'}), content_type='application/json')
+    self.assertEqual(response.status_code, 400)
+
+  def test_invalid_input(self):
+    response = self.client.post('/getQuotes', data=json.dumps({'files': []}), content_type='application/json')
+    self.assertEqual(response.status_code, 400)
@@ -0,0 +1,71 @@
+import time
+
+import requests
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs import circuit_breaker
+from oceandbs.models import Quote
+from ..utils import generate_signature
+
+# The links of a completed upload are stored the first time they are fetched, and then served without calling the storage
+class TestQuoteLinkCache(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    circuit_breaker.reset()
+    responses.get(url='https://filecoin.org/getLink', json=[{"type": "filecoin", "CID": "xxxx"}], status=200)
+
+  def tearDown(self):
+    circuit_breaker.reset()
+
+  def get_link(self, nonce):
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    return self.client.get(f'/getLink?quoteId=123565&nonce={nonce}&signature={signature}')
+
+  @responses.activate
+  def test_completed_quote(self):
+    Quote.objects.filter(quoteId='123565').update(status='400')
+    nonce = int(time.time())
+
+    response = self.get_link(nonce)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data, {"type": "filecoin", "CID": "xxxx"})
+    self.assertEqual(Quote.objects.get(quoteId='123565').link, {"type": "filecoin", "CID": "xxxx"})
+
+    response = self.get_link(nonce + 1)
+    self.assertEqual(response.data, {"type": "filecoin", "CID": "xxxx"})
+    self.assertEqual(len(responses.calls), 1)
+
+  @responses.activate
+  def test_quote_in_progress(self):
+    Quote.objects.filter(quoteId='123565').update(status='300')
+    nonce = int(time.time())
+
+    self.get_link(nonce)
+    response = self.get_link(nonce + 1)
+    self.assertEqual(response.data, {"type": "filecoin", "CID": "xxxx"})
+    self.assertIsNone(Quote.objects.get(quoteId='123565').link)
+    self.assertEqual(len(responses.calls), 2)
+
+  def test_stored_link_needs_signature(self):
+    Quote.objects.filter(quoteId='123565').update(status='400', link={"type": "filecoin", "CID": "xxxx"})
+    response = self.client.get('/getLink?quoteId=123565')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  @responses.activate
+  def test_storage_timeout(self):
+    responses.replace(responses.GET, 'https://filecoin.org/getLink', body=requests.Timeout('read timed out'))
+    response = self.get_link(int(time.time()))
+    self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+  @responses.activate
+  def test_storage_error_page(self):
+    responses.replace(responses.GET, 'https://filecoin.org/getLink', body='<html>Bad Gateway</html>', status=502)
+    response = self.get_link(int(time.time()))
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(response.data, {'error': '<html>Bad Gateway</html>'})
@@ -0,0 +1,49 @@
+from django.db.models import F
+from django.test import override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from oceandbs.models import Quote, RegistryVersion, Storage
+from oceandbs.registry import get_registry_version, registry
+
+# Storages are resolved from a process-local snapshot, reloaded when the registry version stored in the database moves
+class TestRegistry(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    registry.clear()
+
+  def tearDown(self):
+    registry.clear()
+
+  def test_lookups_without_queries(self):
+    registry.get_snapshot()
+    with self.assertNumQueries(0):
+      storage = registry.get('filecoin')
+      self.assertEqual(storage.url, 'https://filecoin.org/')
+      self.assertEqual([storage.type for storage in registry.active()], ['filecoin'])
+      quote = Quote(quoteId='x', storage_id=storage.pk, duration=1)
+      self.assertIs(registry.attach(quote).storage, storage)
+      self.assertEqual(storage.payment.all()[0].acceptedTokens.all()[0].title, 'OCEAN')
+
+  @override_settings(REGISTRY_CHECK_INTERVAL=0)
+  def test_change_by_another_process(self):
+    registry.get_snapshot()
+    # Another process changes a storage and moves the version, without going through this process
+    Storage.objects.filter(type='filecoin').update(url='https://filecoin.io/')
+    with self.assertNumQueries(1):
+      self.assertEqual(registry.get('filecoin').url, 'https://filecoin.org/')
+
+    RegistryVersion.objects.filter(pk=1).update(version=F('version') + 1)
+    self.assertEqual(registry.get('filecoin').url, 'https://filecoin.io/')
+
+  def test_saved_changes_move_the_version(self):
+    version = get_registry_version()
+    registry.get_snapshot()
+    Storage.objects.create(type='arweave', description='Arweave', url='https://arweave.org/')
+    self.assertGreater(get_registry_version(), version)
+    self.assertEqual([storage.type for storage in registry.active()], ['filecoin', 'arweave'])
+
+  def test_unknown_storage(self):
+    self.assertIsNone(registry.get('unknown'))
+    self.assertEqual(self.client.post('/getQuote', data={'type': 'unknown', 'files': []}, format='json').status_code, 400)
@@ -0,0 +1,101 @@
+import json
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs.models import File as DBSFile, Quote, UploadSession, UPLOAD_CODE
+from ..utils import generate_signature
+
+STAGING_DIR = tempfile.mkdtemp()
+
+# Create an upload session, send the file in two byte ranges and finalize it
+@override_settings(UPLOAD_STAGING_DIR=STAGING_DIR)
+class TestResumableUploadEndpoints(APITestCase):
+  fixtures = ["storages.json"]
+
+  @classmethod
+  def tearDownClass(cls):
+    super().tearDownClass()
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+
+  def setUp(self):
+    self.client = APIClient()
+    nonce = int(time.time())
+    signature = generate_signature(123565, nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    self.content = b'0123456789' * 100
+
+    response = self.client.post(
+      f'/upload/session?quoteId=123565&nonce={nonce}&signature={signature}',
+      data=json.dumps({'filename': 'data.bin', 'length': len(self.content)}),
+      content_type='application/json'
+    )
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(response.data['offset'], 0)
+    self.session_url = '/upload/session/' + response.data['sessionId']
+
+  def put_range(self, offset, data):
+    return self.client.put(f'{self.session_url}?offset={offset}', data=data, content_type='application/octet-stream')
+
+  @responses.activate
+  def test_resumable_upload(self):
+    responses.post(
+      url='http://127.0.0.1:5001/api/v0/add',
+      body='{"Name":"data.bin","Hash":"QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq","Size":"1000"}',
+      status=200
+    )
+    responses.post(url='https://filecoin.org/upload/', status=200)
+
+    response = self.put_range(0, self.content[:600])
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['offset'], 600)
+
+    # Finalizing before all the bytes are committed is refused
+    response = self.client.post(self.session_url + '/finalize')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # After a dropped connection, the client asks for the committed offset and resumes from there
+    response = self.client.get(self.session_url)
+    self.assertEqual(response.data['offset'], 600)
+    response = self.put_range(600, self.content[600:])
+    self.assertEqual(response.data['offset'], len(self.content))
+
+    response = self.client.post(self.session_url + '/finalize')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data, "File upload succeeded.")
+
+    session = UploadSession.objects.get()
+    self.assertTrue(session.finalized)
+    self.assertEqual(DBSFile.objects.get().cid, 'QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq')
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[5][0]))
+
+  def test_offset_mismatch(self):
+    self.put_range(0, self.content[:100])
+
+    response = self.put_range(50, self.content[50:200])
+    self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+    self.assertEqual(response.data['offset'], 100)
+
+  def test_range_exceeding_length(self):
+    response = self.put_range(0, self.content + b'extra')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(UploadSession.objects.get().offset, 0)
+
+  def test_concurrent_ranges(self):
+    # A second request at offset 0 read the session before the first one committed its bytes
+    stale = UploadSession.objects.get()
+    self.assertEqual(self.put_range(0, self.content[:600]).status_code, status.HTTP_200_OK)
+
+    with mock.patch.object(UploadSession.objects, 'get', return_value=stale):
+      response = self.put_range(0, b'x' * 600)
+    self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+    self.assertEqual(response.data['offset'], 600)
+    # The bytes of the losing request were never written
+    with open(stale.path, 'rb') as staged:
+      self.assertEqual(staged.read(600), self.content[:600])
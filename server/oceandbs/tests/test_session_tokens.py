@@ -0,0 +1,120 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.test import override_settings
+from eth_account.messages import encode_defunct
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+from web3.auto import w3
+import responses
+
+from oceandbs import circuit_breaker, metrics, signatures
+from oceandbs.models import Quote, Storage
+from ..utils import generate_signature
+
+# A signed request is exchanged for a session token, checked with an HMAC on the following requests instead of a signature recovery
+class TestSessionTokens(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    self.account = w3.eth.account.from_key(getattr(settings, 'TEST_PRIVATE_KEY', ''))
+    self.nonce = int(time.time())
+    circuit_breaker.reset()
+    signatures.clear()
+    metrics.reset()
+    Quote.objects.filter(quoteId='123565').update(status='300')
+    responses.get(url='https://filecoin.org/getLink', json=[{"type": "filecoin", "CID": "xxxx"}], status=200)
+
+  def tearDown(self):
+    circuit_breaker.reset()
+    signatures.clear()
+
+  def quote_token(self, nonce):
+    signature = generate_signature(123565, nonce, self.account.key).signature.hex()
+    body = {'quoteId': '123565', 'nonce': nonce, 'signature': signature}
+    return self.client.post('/getToken', data=json.dumps(body), content_type='application/json'), signature
+
+  def user_token(self, nonce, userAddress=None):
+    message = "0x" + hashlib.sha256(('' + str(nonce)).encode('utf-8')).hexdigest()
+    signature = w3.eth.account.sign_message(encode_defunct(text=message), private_key=self.account.key).signature.hex()
+    body = {'userAddress': userAddress or self.account.address, 'nonce': nonce, 'signature': signature}
+    return self.client.post('/getToken', data=json.dumps(body), content_type='application/json')
+
+  @responses.activate
+  def test_quote_token(self):
+    response, signature = self.quote_token(self.nonce)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    token = response.data['token']
+    self.assertEqual(metrics.get_counter('signature_recoveries'), 1)
+
+    for _ in range(3):
+      response = self.client.get('/getLink', {'quoteId': '123565', 'token': token})
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+    # The micro-service still receives the nonce and signature the token was issued for
+    self.assertIn(signature, responses.calls[0].request.url)
+    self.assertIn(f'nonce={self.nonce}', responses.calls[0].request.url)
+    self.assertEqual(metrics.get_counter('signature_recoveries'), 1)
+    self.assertEqual(metrics.get_counter('session_token_checks', scope='quote'), 3)
+
+  def test_tampered_token(self):
+    token = self.quote_token(self.nonce)[0].data['token']
+    payload, mac = token.split('.')
+    for forged in (payload + '.' + mac[:-2] + ('AA' if mac[-2:] != 'AA' else 'BB'), payload[:-1] + '.' + mac, 'xxxx'):
+      response = self.client.get('/getLink', {'quoteId': '123565', 'token': forged})
+      self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+  def test_token_of_another_quote(self):
+    Quote.objects.create(quoteId='123566', storage=Storage.objects.get(type='filecoin'), duration=1)
+    token = self.quote_token(self.nonce)[0].data['token']
+    response = self.client.get('/getLink', {'quoteId': '123566', 'token': token})
+    self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+  @override_settings(SESSION_TOKEN_TTL=-1)
+  def test_expired_token(self):
+    token = self.quote_token(self.nonce)[0].data['token']
+    response = self.client.get('/getLink', {'quoteId': '123565', 'token': token})
+    self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    self.assertEqual(response.data, "Token expired.")
+
+  @responses.activate
+  def test_newer_signature_revokes_token(self):
+    token = self.quote_token(self.nonce)[0].data['token']
+    signature = generate_signature(123565, self.nonce + 1, self.account.key).signature.hex()
+    response = self.client.get('/getLink', {'quoteId': '123565', 'nonce': self.nonce + 1, 'signature': signature})
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    response = self.client.get('/getLink', {'quoteId': '123565', 'token': token})
+    self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    self.assertEqual(response.data, "Token revoked.")
+
+  def test_user_token(self):
+    response = self.user_token(self.nonce)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    token = response.data['token']
+
+    for _ in range(2):
+      response = self.client.get('/getHistory', {'source': 'local', 'userAddress': self.account.address, 'token': token})
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    response = self.client.get('/getHistory', {'source': 'local', 'userAddress': '0x1234', 'token': token})
+    self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    # A quote token is not accepted for the user
+    quote_token = self.quote_token(self.nonce)[0].data['token']
+    response = self.client.get('/getHistory', {'source': 'local', 'userAddress': self.account.address, 'token': quote_token})
+    self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+  def test_user_nonce_consumed(self):
+    self.assertEqual(self.user_token(self.nonce).status_code, status.HTTP_200_OK)
+    self.assertEqual(self.user_token(self.nonce).status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.user_token(self.nonce + 1, userAddress='0x1234').status_code, status.HTTP_403_FORBIDDEN)
+
+  def test_invalid_input(self):
+    body = {'quoteId': '123565', 'userAddress': self.account.address, 'nonce': self.nonce, 'signature': '0x1234'}
+    response = self.client.post('/getToken', data=json.dumps(body), content_type='application/json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    body = {'quoteId': '123565', 'nonce': self.nonce, 'signature': '0x1234'}
+    response = self.client.post('/getToken', data=json.dumps(body), content_type='application/json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.test import override_settings
+from rest_framework.test import APIClient, APITestCase
+from web3.auto import w3
+
+from oceandbs import metrics, signatures
+from ..utils import generate_signature
+
+# Addresses recovered from a (message, signature) pair are cached, a pair sent again costs no secp256k1 recovery
+class TestSignatureCache(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    self.account = w3.eth.account.from_key(getattr(settings, 'TEST_PRIVATE_KEY', ''))
+    signatures.clear()
+    metrics.reset()
+
+  def tearDown(self):
+    signatures.clear()
+
+  def test_recover_address(self):
+    nonce = int(time.time())
+    signature = generate_signature(123565, nonce, self.account.key).signature.hex()
+    message = "0x" + hashlib.sha256(f'123565{nonce}'.encode('utf-8')).hexdigest()
+
+    self.assertEqual(signatures.recover_address(message, signature), self.account.address)
+    self.assertEqual(signatures.recover_address(message, signature), self.account.address)
+
+    self.assertEqual(metrics.get_counter('signature_recoveries'), 1)
+    self.assertEqual(metrics.get_counter('cache_misses', cache='signatures'), 1)
+    self.assertEqual(metrics.get_counter('cache_hits', cache='signatures'), 1)
+
+  def test_other_message(self):
+    signature = generate_signature(123565, 1, self.account.key).signature.hex()
+    signatures.recover_address('0x1', signature)
+    # The same signature over another message recovers another address
+    self.assertNotEqual(signatures.recover_address('0x2', signature), signatures.recover_address('0x1', signature))
+
+  def test_invalid_signature(self):
+    for _ in range(2):
+      with self.assertRaises(Exception):
+        signatures.recover_address('0x1', '0x1234')
+    self.assertEqual(len(signatures.recovered_addresses), 0)
+
+
+# With workers, recoveries are gathered into batches run by a pool of processes
+@override_settings(SIGNATURE_WORKERS=2, SIGNATURE_BATCH_WAIT=0.05)
+class TestSignatureProcessPool(APITestCase):
+
+  def setUp(self):
+    self.account = w3.eth.account.from_key(getattr(settings, 'TEST_PRIVATE_KEY', ''))
+    signatures.clear()
+    metrics.reset()
+
+  def tearDown(self):
+    signatures.clear()
+
+  def test_batched_recoveries(self):
+    pairs = []
+    for index in range(20):
+      message = "0x" + hashlib.sha256(f'quote-{index}'.encode('utf-8')).hexdigest()
+      pairs.append((message, generate_signature('quote-', index, self.account.key).signature.hex()))
+    pairs.append(('0x1', '0x1234'))
+
+    results = {}
+    def verify(message, signature):
+      try:
+        results[message] = signatures.recover_address(message, signature)
+      except signatures.SignatureError as e:
+        results[message] = e
+
+    threads = [threading.Thread(target=verify, args=pair) for pair in pairs]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertTrue(all(results[message] == self.account.address for message, _ in pairs[:-1]))
+    self.assertIsInstance(results['0x1'], signatures.SignatureError)
+    self.assertEqual(metrics.get_counter('signature_recoveries'), 21)
+    # Pairs submitted together share batches
+    self.assertLess(metrics.snapshot()['histograms']['signature_batch_size']['count'], 21)
+
+  def test_dead_worker(self):
+    verifier = signatures.get_verifier()
+    message = "0x" + hashlib.sha256('quote-1'.encode('utf-8')).hexdigest()
+    signature = generate_signature('quote-', 1, self.account.key).signature.hex()
+    self.assertEqual(verifier.recover(message, signature), self.account.address)
+
+    # A worker killed by the system breaks its pool, the next recoveries succeed all the same
+    pool = verifier.pool
+    process = next(iter(pool._processes.values()))
+    os.kill(process.pid, signal.SIGKILL)
+    process.join()
+    for _ in range(2):
+      self.assertEqual(verifier.recover(message, signature), self.account.address)
+    self.assertIsNot(verifier.pool, pool)
+    self.assertEqual(metrics.get_counter('signature_pool_restarts'), 1)
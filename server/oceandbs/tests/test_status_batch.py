@@ -0,0 +1,71 @@
+import datetime
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+import responses
+
+from oceandbs import circuit_breaker
+from oceandbs.models import Quote, Storage, UploadJob
+
+# The statuses of many quotes are read in one query, only the stale ones are asked to their storage
+@override_settings(STATUS_MAX_AGE=60, STATUS_BATCH_MAX_IDS=5)
+class TestStatusBatch(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    circuit_breaker.reset()
+    filecoin = Storage.objects.get(type='filecoin')
+    arweave = Storage.objects.create(type='arweave', description='Arweave', url='https://arweave.org/')
+    Quote.objects.create(quoteId='paying', storage=filecoin, duration=1, status='100')
+    Quote.objects.create(quoteId='uploading', storage=arweave, duration=1, status='300')
+    Quote.objects.create(quoteId='done', storage=filecoin, duration=1, status='400')
+    Quote.objects.create(quoteId='checked', storage=filecoin, duration=1, status='200', statusChecked=timezone.now())
+    Quote.objects.create(quoteId='old', storage=filecoin, duration=1, status='200',
+      statusChecked=timezone.now() - datetime.timedelta(minutes=5))
+    staging = Quote.objects.create(quoteId='staging', storage=filecoin, duration=1, status='300')
+    UploadJob.objects.create(quote=staging, files=[], nonce='1', signature='0x')
+
+  def tearDown(self):
+    circuit_breaker.reset()
+
+  @responses.activate
+  def test_stale_statuses_refreshed(self):
+    responses.get(url='https://filecoin.org/getStatus?quoteId=paying', json={'status': 300}, status=200)
+    responses.get(url='https://arweave.org/getStatus?quoteId=uploading', json={'status': 400}, status=200)
+
+    # One query to read the quotes, one to update the refreshed ones
+    with self.assertNumQueries(2):
+      response = self.client.get('/getStatuses?quoteIds=paying,uploading,done,checked,unknown')
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data['statuses'], {
+      'paying': '300', 'uploading': '400', 'done': '400', 'checked': '200', 'unknown': None
+    })
+    self.assertEqual(len(responses.calls), 2)
+    self.assertEqual(Quote.objects.get(quoteId='paying').status, '300')
+    self.assertIsNotNone(Quote.objects.get(quoteId='uploading').statusChecked)
+
+  def test_fresh_statuses(self):
+    # Final statuses, recently checked ones and quotes still being uploaded are served from the database
+    with self.assertNumQueries(1):
+      response = self.client.post('/getStatuses', data=json.dumps({'quoteIds': ['done', 'checked', 'staging']}), content_type='application/json')
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data['statuses'], {'done': '400', 'checked': '200', 'staging': '300'})
+
+  @responses.activate
+  def test_failing_storage(self):
+    responses.get(url='https://filecoin.org/getStatus?quoteId=old', status=500)
+
+    response = self.client.get('/getStatuses?quoteIds=old')
+    self.assertEqual(response.data['statuses'], {'old': '200'})
+    self.assertLess(Quote.objects.get(quoteId='old').statusChecked, timezone.now() - datetime.timedelta(minutes=4))
+
+  def test_invalid_input(self):
+    self.assertEqual(self.client.get('/getStatuses').status_code, 400)
+    self.assertEqual(self.client.get('/getStatuses?quoteIds=a,b,c,d,e,f').status_code, 400)
+    response = self.client.post('/getStatuses', data=json.dumps({'quoteIds': 'done'}), content_type='application/json')
+    self.assertEqual(response.status_code, 400)
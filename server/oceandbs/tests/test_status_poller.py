@@ -0,0 +1,69 @@
+import datetime
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs import circuit_breaker
+from oceandbs.models import Quote, Storage, UploadJob
+from ..utils import poll_quote_statuses
+
+# Quotes in progress are refreshed in the background, getStatus then answers from the database until the status is stale
+@override_settings(STATUS_MAX_AGE=60)
+class TestStatusPoller(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    circuit_breaker.reset()
+    self.filecoin = Storage.objects.get(type='filecoin')
+    self.arweave = Storage.objects.create(type='arweave', description='Arweave', url='https://arweave.org/')
+    Quote.objects.create(quoteId='paying', storage=self.filecoin, duration=1, status='100')
+    Quote.objects.create(quoteId='uploading', storage=self.arweave, duration=1, status='300')
+    Quote.objects.create(quoteId='done', storage=self.filecoin, duration=1, status='400')
+    Quote.objects.create(quoteId='pushed', storage=self.filecoin, duration=1, status='300', statusUpdated=timezone.now())
+    staging = Quote.objects.create(quoteId='staging', storage=self.filecoin, duration=1, status='300')
+    UploadJob.objects.create(quote=staging, files=[], nonce='1', signature='0x')
+
+  def tearDown(self):
+    circuit_breaker.reset()
+
+  @responses.activate
+  def test_poll(self):
+    responses.get(url='https://filecoin.org/getStatus?quoteId=paying', json={'status': 300}, status=200)
+    responses.get(url='https://arweave.org/getStatus?quoteId=uploading', json={'status': 400}, status=200)
+
+    # One query to find the quotes in progress, one to update them all
+    with self.assertNumQueries(2):
+      changed = poll_quote_statuses()
+
+    self.assertEqual(changed, 2)
+    self.assertEqual(len(responses.calls), 2)
+    self.assertEqual(Quote.objects.get(quoteId='paying').status, '300')
+    self.assertEqual(Quote.objects.get(quoteId='uploading').status, '400')
+    self.assertIsNotNone(Quote.objects.get(quoteId='paying').statusChecked)
+
+    # The fresh status is served without calling the storage
+    response = self.client.get('/getStatus?quoteId=paying')
+    self.assertEqual(response.data['status'], '300')
+    self.assertEqual(len(responses.calls), 2)
+
+  @responses.activate
+  def test_stale_status(self):
+    responses.get(url='https://filecoin.org/getStatus?quoteId=paying', json={'status': 200}, status=200)
+    Quote.objects.filter(quoteId='paying').update(statusChecked=timezone.now() - datetime.timedelta(minutes=5))
+
+    response = self.client.get('/getStatus?quoteId=paying')
+    self.assertEqual(response.data['status'], 200)
+    self.assertEqual(len(responses.calls), 1)
+
+  @responses.activate
+  def test_failing_storage(self):
+    responses.get(url='https://filecoin.org/getStatus?quoteId=paying', status=500)
+    responses.get(url='https://arweave.org/getStatus?quoteId=uploading', json={'status': 400}, status=200)
+
+    poll_quote_statuses()
+    self.assertEqual(Quote.objects.get(quoteId='paying').status, '100')
+    self.assertIsNone(Quote.objects.get(quoteId='paying').statusChecked)
+    self.assertEqual(Quote.objects.get(quoteId='uploading').status, '400')
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import time
+from unittest import mock
+
+from django.conf import settings
+from eth_account.messages import encode_defunct
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+from web3.auto import w3
+import responses
+
+from oceandbs.models import Quote, Storage
+
+# Statuses pushed by the storage micro-services are applied in bulk, and getStatus then stops calling them
+class TestStatusPush(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    self.account = w3.eth.account.from_key(getattr(settings, 'TEST_PRIVATE_KEY', ''))
+    self.environ = mock.patch.dict(os.environ, {'APPROVED_ADDRESS': self.account.address})
+    self.environ.start()
+    self.storage = Storage.objects.get(type='filecoin')
+    for quoteId in ('quote-1', 'quote-2'):
+      Quote.objects.create(quoteId=quoteId, storage=self.storage, duration=1, status='1')
+
+  def tearDown(self):
+    self.environ.stop()
+
+  def push(self, statuses, nonce=None, key=None):
+    nonce = nonce or int(time.time())
+    message = "0x" + hashlib.sha256(('filecoin' + str(nonce)).encode('utf-8')).hexdigest()
+    signature = w3.eth.account.sign_message(encode_defunct(text=message), private_key=key or self.account.key).signature.hex()
+    body = {'type': 'filecoin', 'nonce': nonce, 'signature': signature, 'statuses': statuses}
+    return self.client.post('/updateStatus', data=json.dumps(body), content_type='application/json')
+
+  @responses.activate
+  def test_push_statuses(self):
+    statuses = [
+      {'quoteId': '123565', 'status': 300},
+      {'quoteId': 'quote-1', 'status': 400},
+      {'quoteId': 'quote-2', 'status': 401},
+      {'quoteId': 'unknown', 'status': 400},
+    ]
+    # Nonce consumption, then a single UPDATE for all the quotes, and the lookup of the unknown ones
+    # The storage comes from the registry snapshot
+    self.client.get('/')
+    with self.assertNumQueries(3):
+      response = self.push(statuses)
+
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data, {'updated': 3, 'unknown': ['unknown']})
+    self.assertEqual(Quote.objects.get(quoteId='123565').status, '300')
+    self.assertEqual(Quote.objects.get(quoteId='quote-1').status, '400')
+    self.assertEqual(Quote.objects.get(quoteId='quote-2').status, '401')
+
+    # getStatus is now served from the database, the micro-service is not called
+    response = self.client.get('/getStatus?quoteId=quote-1')
+    self.assertEqual(response.data['status'], '400')
+    self.assertEqual(len(responses.calls), 0)
+
+  def test_replayed_push(self):
+    nonce = int(time.time())
+    self.assertEqual(self.push([{'quoteId': 'quote-1', 'status': 300}], nonce=nonce).status_code, status.HTTP_200_OK)
+    response = self.push([{'quoteId': 'quote-1', 'status': 400}], nonce=nonce)
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(Quote.objects.get(quoteId='quote-1').status, '300')
+
+  def test_non_approved_signer(self):
+    other_key = '0x' + '11' * 32
+    response = self.push([{'quoteId': 'quote-1', 'status': 400}], key=other_key)
+    self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    self.assertEqual(Quote.objects.get(quoteId='quote-1').status, '1')
+
+  def test_invalid_status(self):
+    response = self.push([{'quoteId': 'quote-1', 'status': 999}])
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(Quote.objects.get(quoteId='quote-1').status, '1')
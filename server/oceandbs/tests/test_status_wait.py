@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase
+
+from oceandbs import tasks
+from oceandbs.models import Quote
+from oceandbs.status_broker import broker
+
+# Clients waiting on getStatus/wait get an answer as soon as the status of their quote changes.
+# The async view reads the database from its own thread, so the fixtures have to be committed.
+class TestStatusWait(TransactionTestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    Quote.objects.filter(quoteId='123565').update(status='1')
+
+  async def wait(self, known, timeout=5):
+    return await self.async_client.get(f'/getStatus/wait?quoteId=123565&status={known}&timeout={timeout}')
+
+  async def wait_for_watchers(self, count):
+    for _ in range(500):
+      if sum(len(watchers) for watchers in broker.watchers.values()) >= count:
+        return
+      await asyncio.sleep(0.01)
+    self.fail(f"Less than {count} clients waiting.")
+
+  async def test_status_already_different(self):
+    response = await self.wait('300')
+    self.assertEqual(response.json(), {'status': '1', 'changed': True})
+
+  async def test_status_change(self):
+    async def publish():
+      await self.wait_for_watchers(1)
+      # Status updates are published from request or scheduler threads
+      threading.Thread(target=broker.publish, args=('123565', 400)).start()
+
+    response, _ = await asyncio.gather(self.wait('1'), publish())
+    self.assertEqual(response.json(), {'status': '400', 'changed': True})
+    self.assertEqual(broker.watched(), [])
+
+  async def test_same_status_published(self):
+    async def publish():
+      await self.wait_for_watchers(1)
+      broker.publish('123565', 1)
+      await asyncio.sleep(0.05)
+      broker.publish('123565', 300)
+
+    response, _ = await asyncio.gather(self.wait('1'), publish())
+    self.assertEqual(response.json(), {'status': '300', 'changed': True})
+
+  async def test_timeout(self):
+    response = await self.wait('1', timeout=0.1)
+    self.assertEqual(response.json(), {'status': '1', 'changed': False})
+
+  async def test_unknown_quote(self):
+    response = await self.async_client.get('/getStatus/wait?quoteId=unknown&status=1')
+    self.assertEqual(response.status_code, 404)
+
+  async def test_change_made_by_another_process(self):
+    async def update():
+      await self.wait_for_watchers(1)
+      await sync_to_async(Quote.objects.filter(quoteId='123565').update)(status='400')
+      await sync_to_async(tasks.publish_watched_statuses)()
+
+    response, _ = await asyncio.gather(self.wait('1'), update())
+    self.assertEqual(response.json(), {'status': '400', 'changed': True})
+
+  async def test_many_watchers_without_threads(self):
+    threads = threading.active_count()
+
+    async def publish():
+      await self.wait_for_watchers(200)
+      # The few threads started are the ones of the executors reading the database, not one per client
+      self.assertLess(threading.active_count() - threads, 20)
+      broker.publish('123565', 400)
+
+    results = await asyncio.gather(*[self.wait('1') for _ in range(200)], publish())
+    self.assertTrue(all(response.json()['status'] == '400' for response in results[:-1]))
@@ -0,0 +1,96 @@
+import datetime
+import hashlib
+import os
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.utils import timezone
+from eth_account.messages import encode_defunct
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+from web3.auto import w3
+
+from oceandbs import tasks
+from oceandbs.models import Storage
+from oceandbs.registry import get_registry_version, registry
+
+# Storages stay active as long as they register again or send heartbeats, the others are deactivated in a single UPDATE
+class TestStorageHeartbeat(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    self.account = w3.eth.account.from_key(getattr(settings, 'TEST_PRIVATE_KEY', ''))
+    self.environ = mock.patch.dict(os.environ, {'APPROVED_ADDRESS': self.account.address})
+    self.environ.start()
+    registry.clear()
+    self.old = timezone.now() - datetime.timedelta(seconds=settings.STORAGE_HEARTBEAT_TIMEOUT + 60)
+    Storage.objects.filter(type='filecoin').update(last_heartbeat=self.old)
+    Storage.objects.create(type='arweave', description='Arweave', url='https://arweave.org/')
+
+  def tearDown(self):
+    self.environ.stop()
+    registry.clear()
+
+  def heartbeat(self, storage_type, nonce=None):
+    nonce = nonce or int(time.time())
+    return self.post('/heartbeat', 'heartbeat', storage_type, nonce)
+
+  def post(self, path, prefix, storage_type, nonce, **data):
+    message = "0x" + hashlib.sha256((prefix + storage_type + str(nonce)).encode('utf-8')).hexdigest()
+    signature = w3.eth.account.sign_message(encode_defunct(text=message), private_key=self.account.key).signature.hex()
+    body = {'type': storage_type, 'nonce': nonce, 'signature': signature, **data}
+    return self.client.post(path, data=json.dumps(body), content_type='application/json')
+
+  def test_expiry(self):
+    version = get_registry_version()
+    self.assertEqual([storage.type for storage in registry.active()], ['filecoin', 'arweave'])
+
+    self.assertEqual(tasks.remove_expired_storage(), 1)
+    self.assertFalse(Storage.objects.get(type='filecoin').is_active)
+    self.assertTrue(Storage.objects.get(type='arweave').is_active)
+    # The registry version moved, the info endpoint and the views no longer see the expired storage
+    self.assertGreater(get_registry_version(), version)
+    self.assertEqual([storage['type'] for storage in self.client.get('/').data], ['arweave'])
+
+  def test_sweep_without_expired_storage(self):
+    Storage.objects.filter(type='filecoin').update(last_heartbeat=timezone.now())
+    with self.assertNumQueries(1):
+      self.assertEqual(tasks.remove_expired_storage(), 0)
+
+  def test_heartbeat(self):
+    self.assertEqual(self.heartbeat('filecoin').status_code, status.HTTP_200_OK)
+    self.assertGreater(Storage.objects.get(type='filecoin').last_heartbeat, self.old)
+    self.assertEqual(tasks.remove_expired_storage(), 0)
+
+  def test_replayed_heartbeat(self):
+    nonce = int(time.time())
+    self.assertEqual(self.heartbeat('filecoin', nonce).status_code, status.HTTP_200_OK)
+    self.assertEqual(self.heartbeat('filecoin', nonce).status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_heartbeat_and_status_push_in_the_same_second(self):
+    nonce = int(time.time())
+    self.assertEqual(self.heartbeat('filecoin', nonce).status_code, status.HTTP_200_OK)
+    response = self.post('/updateStatus', '', 'filecoin', nonce, statuses=[{'quoteId': '123565', 'status': 300}])
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  def test_heartbeat_signature_not_accepted_as_status_push(self):
+    nonce = int(time.time())
+    message = "0x" + hashlib.sha256(('heartbeat' + 'filecoin' + str(nonce)).encode('utf-8')).hexdigest()
+    signature = w3.eth.account.sign_message(encode_defunct(text=message), private_key=self.account.key).signature.hex()
+    body = {'type': 'filecoin', 'nonce': nonce, 'signature': signature, 'statuses': [{'quoteId': '123565', 'status': 400}]}
+    response = self.client.post('/updateStatus', data=json.dumps(body), content_type='application/json')
+    self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+  def test_expired_storage_registers_again(self):
+    tasks.remove_expired_storage()
+    self.assertEqual(self.heartbeat('filecoin').status_code, status.HTTP_404_NOT_FOUND)
+
+    signature = w3.eth.account.sign_message(encode_defunct(text='https://filecoin.org/'), private_key=self.account.key).signature.hex()
+    body = {'type': 'filecoin', 'url': 'https://filecoin.org/', 'signature': signature}
+    response = self.client.post('/register', data=json.dumps(body), content_type='application/json')
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    self.assertTrue(Storage.objects.get(type='filecoin').is_active)
+    self.assertEqual(tasks.remove_expired_storage(), 0)
@@ -0,0 +1,69 @@
+import os
+from unittest import mock
+
+from django.conf import settings
+from eth_account.messages import encode_defunct
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework.utils import json
+from web3.auto import w3
+
+from oceandbs.models import Storage
+from oceandbs.registry import registry
+from ..utils import storage_info_cache
+
+# The info endpoint is rendered once per registry version, and served from memory until the storages change
+class TestStorageInfo(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    self.account = w3.eth.account.from_key(getattr(settings, 'TEST_PRIVATE_KEY', ''))
+    self.environ = mock.patch.dict(os.environ, {'APPROVED_ADDRESS': self.account.address})
+    self.environ.start()
+    registry.clear()
+    storage_info_cache.clear()
+
+  def tearDown(self):
+    self.environ.stop()
+    registry.clear()
+    storage_info_cache.clear()
+
+  def register(self, storage_type, url):
+    signature = w3.eth.account.sign_message(encode_defunct(text=url), private_key=self.account.key).signature.hex()
+    body = {
+      'type': storage_type,
+      'description': f'{storage_type} storage',
+      'url': url,
+      'signature': signature,
+      'payment': [{'chainId': '80001', 'acceptedTokens': [{'OCEAN': '0xOCEAN'}]}]
+    }
+    return self.client.post('/register', data=json.dumps(body), content_type='application/json')
+
+  def test_cached_info(self):
+    # Registry version, storages, then their payment methods and accepted tokens, whatever their number
+    with self.assertNumQueries(4):
+      response = self.client.get('/')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response['Content-Type'], 'application/json')
+    self.assertEqual(response.data[0]['payment'][0]['acceptedTokens'][0], {'title': 'OCEAN', 'value': '0x9c3C9283D3e44854697Cd22D3Faa240Cfb032889'})
+
+    with self.assertNumQueries(0):
+      cached = self.client.get('/')
+    self.assertEqual(cached.content, response.content)
+    self.assertEqual(json.loads(cached.content), response.data)
+
+  def test_registration(self):
+    self.client.get('/')
+    self.assertEqual(self.register('arweave', 'https://arweave.org/').status_code, status.HTTP_201_CREATED)
+
+    response = self.client.get('/')
+    self.assertEqual([storage['type'] for storage in response.data], ['filecoin', 'arweave'])
+    self.assertEqual(response.data[1]['payment'][0]['acceptedTokens'], [{'title': 'OCEAN', 'value': '0xOCEAN'}])
+
+  def test_reactivation(self):
+    Storage.objects.filter(type='filecoin').update(is_active=False)
+    self.assertEqual(self.client.get('/').data, [])
+
+    self.assertEqual(self.register('filecoin', 'https://filecoin.org/').status_code, status.HTTP_201_CREATED)
+    self.assertEqual([storage['type'] for storage in self.client.get('/').data], ['filecoin'])
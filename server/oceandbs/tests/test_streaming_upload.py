@@ -0,0 +1,135 @@
+import io
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+import responses
+
+from oceandbs.models import File as DBSFile, Quote, UPLOAD_CODE
+from ..utils import generate_signature
+
+# Request body read by the WSGI handler as it would be from the socket. Halfway through, it waits for IPFS to receive
+# the beginning of the file: the rest of the body is only sent once the IPFS add is under way.
+class OverlapInput(io.BytesIO):
+  def __init__(self, content, ipfs_started):
+    super().__init__(content)
+    self.half = len(content) // 2
+    self.ipfs_started = ipfs_started
+    self.overlapped = None
+
+  def read(self, size=-1):
+    if self.overlapped is None and self.tell() >= self.half:
+      self.overlapped = self.ipfs_started.wait(timeout=5)
+    return super().read(size)
+
+  def readline(self, size=-1):
+    return self.read(size) if size and size > 0 else super().readline(size)
+
+
+# Using the standard APIClient to post a multipart body streamed to IPFS by the upload handler
+@override_settings(IPFS_STREAMING_UPLOAD=True, IPFS_STREAM_CHUNK_SIZE=1024, IPFS_STREAM_QUEUE_SIZE=2)
+class TestStreamingUploadEndpoint(APITestCase):
+  fixtures = ["storages.json"]
+
+  def setUp(self):
+    self.client = APIClient()
+    self.nonce = int(time.time())
+    self.signature = generate_signature(123565, self.nonce, getattr(settings, 'TEST_PRIVATE_KEY', '')).signature.hex()
+    self.streamed = []
+
+  def ipfs_add_callback(self, request):
+    # The body is a generator fed chunk by chunk by the upload handler
+    self.streamed.append(b''.join(request.body))
+    return (200, {}, '{"Name":"data.bin","Hash":"QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq","Size":"10240"}')
+
+  @responses.activate
+  def test_streaming_upload(self):
+    responses.add_callback(responses.POST, 'http://127.0.0.1:5001/api/v0/add', callback=self.ipfs_add_callback)
+    responses.post(url='https://filecoin.org/upload/', status=200)
+
+    content = b'0123456789' * 1024
+    response = self.client.post(
+      f'/upload?quoteId=123565&nonce={self.nonce}&signature={self.signature}',
+      {'file1': SimpleUploadedFile('data.bin', content)},
+      format="multipart"
+    )
+
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(len(self.streamed), 1)
+    self.assertIn(content, self.streamed[0])
+
+    file = DBSFile.objects.get()
+    self.assertEqual(file.cid, 'QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq')
+    self.assertEqual(file.length, len(content))
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[5][0]))
+
+  @responses.activate
+  def test_streaming_upload_ipfs_failure(self):
+    responses.post(url='http://127.0.0.1:5001/api/v0/add', status=500)
+
+    response = self.client.post(
+      f'/upload?quoteId=123565&nonce={self.nonce}&signature={self.signature}',
+      {'file1': SimpleUploadedFile('data.bin', b'0123456789' * 1024)},
+      format="multipart"
+    )
+
+    self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    self.assertEqual(DBSFile.objects.count(), 0)
+
+  @responses.activate
+  def test_uploaded_quote(self):
+    responses.add_callback(responses.POST, 'http://127.0.0.1:5001/api/v0/add', callback=self.ipfs_add_callback)
+    Quote.objects.filter(quoteId='123565').update(status=str(UPLOAD_CODE[5][0]))
+
+    response = self.client.post(
+      f'/upload?quoteId=123565&nonce={self.nonce}&signature={self.signature}',
+      {'file1': SimpleUploadedFile('data.bin', b'0123456789' * 1024)},
+      format="multipart"
+    )
+
+    # The upload is refused before the body is read, nothing is sent to IPFS
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(response.data, "Files already uploaded.")
+    self.assertEqual(len(responses.calls), 0)
+
+  def test_no_file_releases_quote(self):
+    Quote.objects.filter(quoteId='123565').update(status=str(UPLOAD_CODE[6][0]))
+
+    response = self.client.post(f'/upload?quoteId=123565&nonce={self.nonce}&signature={self.signature}', {}, format="multipart")
+
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(Quote.objects.get().status, str(UPLOAD_CODE[6][0]))
+
+  @responses.activate
+  def test_ipfs_add_overlaps_transfer(self):
+    ipfs_started = threading.Event()
+    def ipfs_add_callback(request):
+      received = b''
+      for chunk in request.body:
+        ipfs_started.set()
+        received += chunk
+      self.streamed.append(received)
+      return (200, {}, '{"Name":"data.bin","Hash":"QmPmnyA8ZaYFJknPhVBE1u4hbGqvLGvu5cxCAPb1Nqb1aq","Size":"102400"}')
+    responses.add_callback(responses.POST, 'http://127.0.0.1:5001/api/v0/add', callback=ipfs_add_callback)
+    responses.post(url='https://filecoin.org/upload/', status=200)
+
+    content = b'0123456789' * 10240
+    body = OverlapInput(encode_multipart(BOUNDARY, {'file1': SimpleUploadedFile('data.bin', content)}), ipfs_started)
+    response = self.client.request(**{
+      'REQUEST_METHOD': 'POST',
+      'PATH_INFO': '/upload',
+      'QUERY_STRING': f'quoteId=123565&nonce={self.nonce}&signature={self.signature}',
+      'CONTENT_TYPE': MULTIPART_CONTENT,
+      'CONTENT_LENGTH': str(len(body.getvalue())),
+      'wsgi.input': body,
+    })
+
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    # IPFS received the first chunks of the file before the client had sent the second half of the body
+    self.assertIs(body.overlapped, True)
+    self.assertIn(content, self.streamed[0])
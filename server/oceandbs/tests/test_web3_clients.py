@@ -0,0 +1,78 @@
+import json
+import threading
+from unittest import mock
+
+from rest_framework.test import APITestCase
+import responses
+
+from oceandbs import http_client, metrics, web3_clients
+
+ABI = '[{"constant":false,"inputs":[{"name":"guy","type":"address"},{"name":"wad","type":"uint256"}],"name":"approve","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"nonpayable","type":"function"}]'
+TOKEN = '0x222c30d5b3b54b5a7e9a7f0e2f0d1c2e3b4a5f60'
+
+# Web3 clients are kept per RPC endpoint, with their contracts, and their calls are timed
+class TestWeb3Clients(APITestCase):
+
+  def setUp(self):
+    web3_clients.clear()
+    metrics.reset()
+
+  def tearDown(self):
+    web3_clients.clear()
+
+  def test_client_per_endpoint(self):
+    client = web3_clients.get_client('https://rpc.example.org/')
+    self.assertIs(web3_clients.get_client('https://rpc.example.org/'), client)
+    self.assertIsNot(web3_clients.get_client('https://other.example.org/'), client)
+
+  def test_contract_cache(self):
+    client = web3_clients.get_client('https://rpc.example.org/')
+    contract = client.get_contract(80001, TOKEN, ABI)
+    self.assertIs(client.get_contract('80001', TOKEN.upper().replace('0X', '0x'), ABI), contract)
+    self.assertIsNot(client.get_contract(1, TOKEN, ABI), contract)
+    self.assertIs(web3_clients.get_abi(ABI), web3_clients.get_abi(ABI))
+
+  def test_contract_per_abi(self):
+    client = web3_clients.get_client('https://rpc.example.org/')
+    contract = client.get_contract(80001, TOKEN, ABI)
+    # Another ABI for the same token gets its own contract, with the functions of that ABI
+    other_abi = ABI.replace('"approve"', '"transfer"')
+    other = client.get_contract(80001, TOKEN, other_abi)
+    self.assertIsNot(other, contract)
+    self.assertTrue(hasattr(other.functions, 'transfer'))
+    self.assertFalse(hasattr(other.functions, 'approve'))
+
+  @responses.activate
+  def test_rpc_latency(self):
+    responses.post(url='https://rpc.example.org/', json={"jsonrpc": "2.0", "id": 0, "result": "0x13881"}, status=200)
+    client = web3_clients.get_client('https://rpc.example.org/')
+    for _ in range(2):
+      self.assertEqual(client.w3.eth.chain_id, 80001)
+
+    histogram = metrics.snapshot()['histograms']['rpc_request_seconds{host="rpc.example.org",method="eth_chainId"}']
+    self.assertEqual(histogram['count'], 2)
+    self.assertEqual(json.loads(responses.calls[0].request.body)['method'], 'eth_chainId')
+
+  @responses.activate
+  def test_pooled_session(self):
+    responses.post(url='https://rpc.example.org/', json={"jsonrpc": "2.0", "id": 0, "result": "0x13881"}, status=200)
+    client = web3_clients.get_client('https://rpc.example.org/')
+    session = http_client.get_session('https://rpc.example.org/')
+    # Whatever the thread, calls go through the pooled session of the endpoint host
+    results = []
+    with mock.patch.object(session, 'post', wraps=session.post) as post:
+      threads = [threading.Thread(target=lambda: results.append(client.w3.eth.chain_id)) for _ in range(3)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+    self.assertEqual(results, [80001] * 3)
+    self.assertEqual(post.call_count, 3)
+
+  @responses.activate
+  def test_rpc_error(self):
+    responses.post(url='https://rpc.example.org/', json={"jsonrpc": "2.0", "id": 0, "error": {"code": -32000, "message": "failed"}}, status=200)
+    client = web3_clients.get_client('https://rpc.example.org/')
+    with self.assertRaises(ValueError):
+      client.w3.eth.chain_id
+    self.assertEqual(metrics.get_counter('rpc_errors', host='rpc.example.org', method='eth_chainId'), 1)
@@ -0,0 +1,125 @@
+import hashlib
+
+import multihash
+import multiformats_cid
+
+# Defaults of `ipfs add` in kubo: fixed size chunker and balanced DAG layout
+DEFAULT_CHUNK_SIZE = 262144
+MAX_LINKS = 174
+
+# UnixFS data type of a file node
+UNIXFS_FILE = 2
+
+
+def _varint(value):
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _field_varint(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _field_bytes(number, value):
+    return _varint((number << 3) | 2) + _varint(len(value)) + value
+
+
+def _unixfs_data(filesize, data=None, blocksizes=()):
+    encoded = _field_varint(1, UNIXFS_FILE)
+    if data:
+        encoded += _field_bytes(2, data)
+    encoded += _field_varint(3, filesize)
+    for blocksize in blocksizes:
+        encoded += _field_varint(4, blocksize)
+    return encoded
+
+
+def _dag_pb_node(data, links=()):
+    # Canonical dag-pb encoding: links first, then data
+    encoded = b''
+    for cid, tsize in links:
+        link = _field_bytes(1, cid.buffer) + _field_bytes(2, b'') + _field_varint(3, tsize)
+        encoded += _field_bytes(2, link)
+    return encoded + _field_bytes(1, data)
+
+
+class UnixFSHasher:
+    """
+    Computes in-process the CID `ipfs add` gives to a file, without sending it anywhere.
+    It matches kubo defaults: fixed size chunks, balanced layout with at most 174 links per node,
+    sha2-256, CIDv0 with dag-pb leaves, or CIDv1 with raw leaves (as `--cid-version=1` does).
+    Content is fed with update() as it arrives, only the current chunk and the pending links are kept.
+    """
+
+    def __init__(self, cid_version=0, chunk_size=DEFAULT_CHUNK_SIZE):
+        if cid_version not in (0, 1):
+            raise ValueError(f"Unsupported CID version: {cid_version}")
+        self.cid_version = cid_version
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        # Pending (cid, tsize, filesize) entries for each level of the tree, leaves being level 0
+        self.levels = [[]]
+        self.length = 0
+
+    def update(self, data):
+        self.buffer += data
+        self.length += len(data)
+        while len(self.buffer) > self.chunk_size:
+            self._add_leaf(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+
+    def cid(self):
+        if self.buffer or not self.levels[0] and len(self.levels) == 1:
+            self._add_leaf(bytes(self.buffer))
+            self.buffer = bytearray()
+
+        # Close every level from the bottom, the root being the single node left on top
+        level = 0
+        while True:
+            entries = self.levels[level]
+            if level == len(self.levels) - 1 and len(entries) == 1:
+                cid = entries[0][0]
+                return (cid.encode('base32') if self.cid_version == 1 else cid.encode()).decode('ascii')
+            self._add_entry(level + 1, self._internal_node(entries))
+            self.levels[level] = []
+            level += 1
+
+    def _hash(self, codec, block):
+        digest = multihash.encode(hashlib.sha256(block).digest(), 'sha2-256')
+        return multiformats_cid.make_cid(self.cid_version, codec, digest)
+
+    def _add_leaf(self, chunk):
+        if self.cid_version == 1:
+            entry = (self._hash('raw', chunk), len(chunk), len(chunk))
+        else:
+            block = _dag_pb_node(_unixfs_data(len(chunk), chunk))
+            entry = (self._hash('dag-pb', block), len(block), len(chunk))
+        self._add_entry(0, entry)
+
+    def _add_entry(self, level, entry):
+        if level == len(self.levels):
+            self.levels.append([])
+        # A full level is only closed once more content comes, so that a file filling it exactly keeps it as root
+        if len(self.levels[level]) == MAX_LINKS:
+            node = self._internal_node(self.levels[level])
+            self.levels[level] = []
+            self._add_entry(level + 1, node)
+        self.levels[level].append(entry)
+
+    def _internal_node(self, entries):
+        filesize = sum(entry[2] for entry in entries)
+        data = _unixfs_data(filesize, blocksizes=[entry[2] for entry in entries])
+        block = _dag_pb_node(data, [(entry[0], entry[1]) for entry in entries])
+        return (self._hash('dag-pb', block), len(block) + sum(entry[1] for entry in entries), filesize)
+
+
+# This function computes the CID of a content given as an iterator of chunks
+def compute_cid(chunks, cid_version=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    hasher = UnixFSHasher(cid_version, chunk_size)
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.cid()
@@ -0,0 +1,180 @@
+import hashlib
+import io
+import os
+import queue
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .utils import ipfs_add_stream, new_cid_hasher, parse_ipfs_add_entry
+
+# Marker pushed in the chunk queue once the client has sent the whole file
+_END_OF_FILE = object()
+# Marker pushed in the chunk queue when the client upload has been interrupted
+_ABORTED = object()
+
+
+class IPFSUploadedFile(UploadedFile):
+    """
+    File object placed in request.FILES once its bytes have been streamed to IPFS.
+    It holds no content, only the result of the IPFS add (or the error raised by it)
+    and the CID computed locally while the bytes were received.
+    """
+
+    ipfs_streamed = True
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None, cid=None, error=None, sha256=None, local_cid=None):
+        super().__init__(io.BytesIO(), name, content_type, size, charset, content_type_extra)
+        self.cid = cid
+        self.error = error
+        self.sha256 = sha256
+        self.local_cid = local_cid
+
+
+class IPFSStreamingUploadHandler(FileUploadHandler):
+    """
+    Upload handler piping every multipart chunk received from the client straight
+    into a streaming `/api/v0/add` request, so that the file is never buffered as
+    a whole in memory and the IPFS add overlaps with the client transfer.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = getattr(settings, 'IPFS_STREAM_CHUNK_SIZE', 64 * 2 ** 10)
+        self.queue_size = getattr(settings, 'IPFS_STREAM_QUEUE_SIZE', 16)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        # Bounded queue: the request thread blocks when IPFS is slower than the client,
+        # which keeps the memory used per upload to queue_size * chunk_size.
+        self.chunks = queue.Queue(maxsize=self.queue_size)
+        self.digest = hashlib.sha256()
+        self.hasher = new_cid_hasher()
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+        self.worker = threading.Thread(target=self._stream_to_ipfs, daemon=True)
+        self.worker.start()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        self.hasher.update(raw_data)
+        self._push(raw_data)
+        # Returning None prevents any other handler from buffering the chunk
+        return None
+
+    def file_complete(self, file_size):
+        self._push(_END_OF_FILE)
+        self.worker.join()
+
+        cid = None
+        error = self.error
+        if error is None:
+            try:
+                _, cid, _ = parse_ipfs_add_entry(self.entry)
+            except (KeyError, TypeError):
+                error = ValueError(f"Invalid IPFS response for file '{self.file_name}': {self.entry}")
+
+        return IPFSUploadedFile(
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            cid=cid,
+            error=error,
+            sha256=self.digest.hexdigest(),
+            local_cid=self.hasher.cid()
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, 'worker'):
+            self._push(_ABORTED)
+            self.worker.join()
+
+    def _push(self, item):
+        # Once the IPFS request is over (most likely failed), remaining chunks are dropped
+        while not self.done.is_set():
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _chunks(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is _END_OF_FILE:
+                return
+            if chunk is _ABORTED:
+                raise IOError(f"Upload of file '{self.file_name}' interrupted by the client.")
+            yield chunk
+
+    def _stream_to_ipfs(self):
+        try:
+            self.entry = ipfs_add_stream(self.file_name, self._chunks())
+        except Exception as e:
+            print(f"Error streaming file '{self.file_name}' to IPFS: {e}")
+            self.error = e
+        finally:
+            self.done.set()
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    File object placed in request.FILES once its bytes have been durably written to the staging directory.
+    """
+
+    def __init__(self, staged_path, name, content_type, size, charset, content_type_extra=None, sha256=None, local_cid=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.staged_path = staged_path
+        self.sha256 = sha256
+        self.local_cid = local_cid
+
+
+class StagingUploadHandler(FileUploadHandler):
+    """
+    Upload handler writing every multipart chunk to a file of the staging directory,
+    synced to disk once complete, so that the upload can be processed in the background.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = getattr(settings, 'IPFS_STREAM_CHUNK_SIZE', 64 * 2 ** 10)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+        self.staged_path = os.path.join(settings.UPLOAD_STAGING_DIR, uuid.uuid4().hex)
+        self.staged = open(self.staged_path, 'wb')
+        self.digest = hashlib.sha256()
+        self.hasher = new_cid_hasher()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        self.hasher.update(raw_data)
+        self.staged.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.staged.flush()
+        os.fsync(self.staged.fileno())
+        self.staged.close()
+        return StagedUploadedFile(
+            self.staged_path,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.digest.hexdigest(),
+            local_cid=self.hasher.cid()
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, 'staged'):
+            self.staged.close()
+            os.remove(self.staged_path)
@@ -4,9 +4,20 @@ from . import views
 urlpatterns = [
     path('', views.StorageListView.as_view(), name="info"),
     path('register', views.StorageCreationView.as_view(), name="service-creation"),
+    path('updateStatus', views.QuoteStatusUpdateView.as_view(), name="status-update"),
+    path('heartbeat', views.StorageHeartbeatView.as_view(), name="heartbeat"),
     path('getStatus', views.QuoteStatusView.as_view(), name="status"),
+    path('getStatus/wait', views.wait_quote_status, name="status-wait"),
+    path('getStatuses', views.QuoteStatusBatchView.as_view(), name="status-batch"),
     path('getLink', views.QuoteLink.as_view(), name="link"),
     path('getHistory', views.QuoteHistory.as_view(), name="history"),
+    path('getToken', views.SessionTokenView.as_view(), name="session-token"),
     path('getQuote', views.QuoteCreationView.as_view()),
-    path('upload', views.UploadFile.as_view())
+    path('getQuotes', views.QuoteComparisonView.as_view(), name="quote-comparison"),
+    path('selectQuote', views.QuoteSelectionView.as_view(), name="quote-selection"),
+    path('upload', views.UploadFile.as_view()),
+    path('upload/session', views.UploadSessionCreateView.as_view(), name="upload-session-creation"),
+    path('upload/session/<uuid:sessionId>', views.UploadSessionView.as_view(), name="upload-session"),
+    path('upload/session/<uuid:sessionId>/finalize', views.UploadSessionFinalizeView.as_view(), name="upload-session-finalize"),
+    path('metrics', views.MetricsView.as_view(), name="metrics")
 ]
\ No newline at end of file
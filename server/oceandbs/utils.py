@@ -1,31 +1,411 @@
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import base64
 import hashlib
+import heapq
 import json
+import os
+import re
+import time
+import uuid
+from urllib.parse import urljoin, urlencode
 import requests
 
 from django.utils import timezone
 from django.conf import settings
+from django.db.models import Case, CharField, Exists, F, OuterRef, Q, Value, When
+from django.core import signing
 from django.core.exceptions import ObjectDoesNotExist
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 import mimetypes
 
 from web3.auto import w3
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
 from eth_account.messages import encode_defunct
 from requests.exceptions import RequestException
 
-from .models import File
+from . import http_client, web3_clients
+from .cache import TTLCache
+from . import circuit_breaker
+from .circuit_breaker import CircuitOpenError, get_breaker, storage_request
+from .models import File, Quote, Storage, UploadJob, UserNonce, UPLOAD_CODE, JOB_STATE
+from .registry import registry
+from .session_tokens import TokenError, read_token
+from .signatures import recover_address
+from .serializers import QuoteSerializer, StorageSerializer
+from .status_broker import broker
+from .unixfs import UnixFSHasher
+
+# Quotes returned by the storages, by normalized getQuote request, reused as long as they are not used for an upload
+quote_cache = TTLCache('quotes', getattr(settings, 'QUOTE_CACHE_SIZE', 1024), getattr(settings, 'QUOTE_CACHE_TTL', 300))
+
+# Rendered body of the info endpoint, by registry version
+storage_info_cache = TTLCache('storage_info', 2, getattr(settings, 'STORAGE_INFO_CACHE_TTL', 60))
+
+
+# This function returns the quote cache key of a getQuote request, or None if the request is malformed.
+# The quote belongs to the user, so the key includes the user address.
+def get_quote_cache_key(storage, data):
+    try:
+        return (
+            storage.pk,
+            str(data['userAddress']).lower(),
+            int(data['duration']),
+            str(data['payment']['chainId']),
+            str(data['payment']['tokenAddress']).lower(),
+            tuple(int(file['length']) for file in data['files'])
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# This function returns the cached response of a getQuote request, if its quote is still waiting for files
+def get_cached_quote(key):
+    cached = quote_cache.get(key)
+    if cached is None:
+        return None
+    unused = Quote.objects.filter(
+        pk=cached['pk'],
+        status=str(UPLOAD_CODE[1][0]),
+        upload_sessions__isnull=True,
+        upload_jobs__isnull=True
+    ).exclude(files__cid__isnull=False).exists()
+    if not unused:
+        quote_cache.delete(key)
+        return None
+    return cached['response']
+
+
+# This function caches the response of a getQuote request
+def cache_quote(key, quote, response):
+    quote_cache.set(key, {'pk': quote.pk, 'response': response})
+
+
+# This function builds the data of the Quote recorded for a getQuote request, from the quote returned by the storage
+def prepare_quote_data(storage, data, response_data):
+    data = {**data, 'payment': dict(data['payment'])}
+    data['storage'] = storage.pk
+    data['status'] = UPLOAD_CODE[1][0]
+    data['payment']['paymentMethod'] = {'chainId': data['payment']['chainId']}
+    data['payment']['userAddress'] = data['userAddress']
+    data.update(response_data)
+    return data
+
+
+# This function asks a storage micro-service for a quote, giving up after timeout seconds
+def request_storage_quote(storage, data, timeout):
+    headers = {'User-Agent': 'Mozilla/5.0', 'Content-Type': 'application/json'}
+    response = storage_request(
+        storage,
+        'POST',
+        urljoin(storage.url, 'getQuote'),
+        data=json.dumps({**data, 'type': storage.type}),
+        headers=headers,
+        timeout=(min(timeout, http_client.get_default_timeout()[0]), timeout)
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _token_amount(offer):
+    try:
+        return int(offer['tokenAmount'])
+    except (TypeError, ValueError):
+        try:
+            return float(offer['tokenAmount'])
+        except (TypeError, ValueError):
+            return float('inf')
+
+
+# This function asks every storage for a quote concurrently, all the answers being awaited QUOTE_COMPARISON_TIMEOUT seconds at most.
+# It returns the quotes ranked by token amount, each with a signed selection token, and the types of the storages that failed or were too slow.
+# Nothing is recorded: the quote picked by the client is recorded by select_storage_quote.
+def compare_storage_quotes(storages, data):
+    timeout = getattr(settings, 'QUOTE_COMPARISON_TIMEOUT', 10)
+    offers = []
+    unavailable = []
+
+    # Quotes already given to the user for the same request are reused, those storages are not called
+    pending = []
+    for storage in storages:
+        key = get_quote_cache_key(storage, data)
+        cached = get_cached_quote(key) if key else None
+        if cached is not None:
+            offers.append((storage, cached))
+        else:
+            pending.append(storage)
+
+    if pending:
+        pool = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='get-quote')
+        futures = {pool.submit(request_storage_quote, storage, data, timeout): storage for storage in pending}
+        done, not_done = wait(futures, timeout=timeout)
+        # Requests still running are bounded by their own timeout, they are not awaited
+        pool.shutdown(wait=False)
+
+        for future in done:
+            storage = futures[future]
+            try:
+                offers.append((storage, future.result()))
+            except (CircuitOpenError, RequestException, ValueError) as e:
+                print(f"No quote from storage '{storage.type}': {e}")
+                unavailable.append(storage.type)
+        for future in not_done:
+            print(f"No quote from storage '{futures[future].type}' within {timeout} seconds.")
+            unavailable.append(futures[future].type)
+
+    quotes = []
+    for storage, offer in offers:
+        if 'quoteId' not in offer or 'tokenAmount' not in offer:
+            print(f"Invalid quote from storage '{storage.type}': {offer}")
+            unavailable.append(storage.type)
+            continue
+        quotes.append({
+            'type': storage.type,
+            'quoteId': offer['quoteId'],
+            'tokenAmount': offer['tokenAmount'],
+            'approveAddress': offer.get('approveAddress'),
+            'chainId': data['payment']['chainId'],
+            'tokenAddress': offer.get('tokenAddress', data['payment']['tokenAddress']),
+            'selection': signing.dumps({'storage': storage.pk, 'request': data, 'quote': offer}, salt='oceandbs.quote')
+        })
+    quotes.sort(key=_token_amount)
+    return quotes, sorted(unavailable)
+
+
+# This function records the quote picked by the client among the ones returned by compare_storage_quotes.
+# It returns the quote as getQuote does, or a Response describing the error.
+def select_storage_quote(selection):
+    try:
+        selected = signing.loads(selection, salt='oceandbs.quote', max_age=getattr(settings, 'QUOTE_CACHE_TTL', 300))
+    except signing.SignatureExpired:
+        return Response({'error': 'Quote expired, compare the quotes again.'}, status=400)
+    except signing.BadSignature:
+        return Response({'error': 'Invalid quote selection.'}, status=400)
+
+    storage = registry.get_by_pk(selected['storage'])
+    if storage is None or not storage.is_active:
+        return Response({'error': 'Chosen storage type does not exist.'}, status=400)
+
+    # Selecting the same quote twice records it once
+    quote = Quote.objects.filter(storage=storage, quoteId=selected['quote']['quoteId']).first()
+    if quote is None:
+        serializer = QuoteSerializer(data=prepare_quote_data(storage, selected['request'], selected['quote']))
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        quote = serializer.save()
+
+    quote_response = {
+        'quoteId': quote.quoteId,
+        'tokenAmount': quote.tokenAmount,
+        'approveAddress': quote.approveAddress,
+        'chainId': selected['request']['payment']['chainId'],
+        'tokenAddress': quote.tokenAddress
+    }
+    key = get_quote_cache_key(storage, selected['request'])
+    if key:
+        cache_quote(key, quote, quote_response)
+    return quote_response
+
+
+# This function drops the cached quotes of a storage, whose prices may have changed
+def invalidate_storage_quotes(storage):
+    quote_cache.invalidate(lambda key: key[0] == storage.pk)
+
+
+# This function returns the info endpoint payload, listing the active storages with their payment methods, and its JSON body.
+# It is serialized once per registry version from the registry snapshot, where the payment methods and accepted tokens are prefetched.
+def get_storage_info():
+    snapshot = registry.get_snapshot()
+    info = storage_info_cache.get(snapshot.version)
+    if info is None:
+        data = StorageSerializer(snapshot.active, many=True).data
+        info = (data, JSONRenderer().render(data))
+        storage_info_cache.set(snapshot.version, info)
+    return info
+
+
+# This function returns the IPFS endpoint used to add files
+def get_ipfs_add_url():
+    return getattr(settings, 'IPFS_SERVICE_ENDPOINT') or "http://127.0.0.1:5001/api/v0/add"
+
+
+# This function returns the parameters of the IPFS adds, so that IPFS chunks files the way the local CID computation does
+def get_ipfs_add_params():
+    return {
+        'cid-version': getattr(settings, 'IPFS_CID_VERSION', 0),
+        'chunker': f"size-{getattr(settings, 'IPFS_CHUNK_SIZE', 262144)}"
+    }
+
+
+# This function returns the timeout of the IPFS adds: adding a large file may take long, so only the connection is bounded
+def get_ipfs_add_timeout():
+    return (http_client.get_default_timeout()[0], None)
+
+
+# This function returns a hasher computing the CID IPFS gives to a content, with the configured CID version and chunk size
+def new_cid_hasher():
+    return UnixFSHasher(getattr(settings, 'IPFS_CID_VERSION', 0), getattr(settings, 'IPFS_CHUNK_SIZE', 262144))
+
+
+# This function computes both the sha256 hex digest and the CID of a content given as an iterator of chunks
+def digests_of_chunks(chunks):
+    digest = hashlib.sha256()
+    hasher = new_cid_hasher()
+    for chunk in chunks:
+        digest.update(chunk)
+        hasher.update(chunk)
+    return digest.hexdigest(), hasher.cid()
+
+
+# This function compares the CID returned by IPFS with the one computed locally, IPFS being the reference
+def check_local_cid(filename, local_cid, cid):
+    if local_cid and cid and local_cid != cid:
+        print(f"Warning: IPFS returned CID {cid} for file '{filename}', {local_cid} was computed locally.")
+        return False
+    return True
+
+
+# This function extracts the name, CID and size of an entry returned by the IPFS add endpoint.
+# It supports both the IPFS cluster format (name/cid/size) and the kubo one (Name/Hash/Size).
+def parse_ipfs_add_entry(entry):
+    name = entry['name'] if 'name' in entry else entry['Name']
+    cid = entry['cid'] if 'cid' in entry else entry['Hash']
+    if isinstance(cid, dict):
+        cid = cid['/']
+    size = entry['size'] if 'size' in entry else entry['Size']
+    return name, cid, size
+
+
+# This function streams a single file to the IPFS add endpoint, the body being sent chunk by chunk
+def ipfs_add_stream(filename, chunks):
+    boundary = uuid.uuid4().hex
+    filename = (filename or 'file').replace('"', '')
+
+    def body():
+        yield (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8')
+        for chunk in chunks:
+            yield chunk
+        yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+    headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+    response = http_client.post(get_ipfs_add_url(), params=get_ipfs_add_params(), data=body(), headers=headers, timeout=get_ipfs_add_timeout())
+    response.raise_for_status()
+
+    # The add endpoint answers with one JSON entry per line, the last one being the added file
+    lines = [line for line in response.text.splitlines() if line.strip()]
+    if not lines:
+        raise ValueError(f"Empty IPFS response for file '{filename}'.")
+    return json.loads(lines[-1])
+
+
+# This function reads a file staged on disk chunk by chunk
+def read_staged_file(path):
+    chunk_size = getattr(settings, 'IPFS_STREAM_CHUNK_SIZE', 64 * 2 ** 10)
+    with open(path, 'rb') as staged_file:
+        for chunk in iter(lambda: staged_file.read(chunk_size), b''):
+            yield chunk
+
+
+# This function returns the CID of a file already added to IPFS with the same content, if any.
+# When the CID of the content was computed locally, a file recorded with that CID is a match too.
+def find_known_cid(sha256, local_cid=None):
+    if not sha256 or not getattr(settings, 'IPFS_DEDUPLICATION', True):
+        return None
+    cid = File.objects.filter(sha256=sha256, cid__isnull=False).values_list('cid', flat=True).first()
+    if not cid and local_cid and File.objects.filter(cid=local_cid).exists():
+        cid = local_cid
+    if cid:
+        print(f"Content {sha256} already added to IPFS with CID {cid}, reusing it.")
+    return cid
+
+
+# This function adds a single file to IPFS, sending it again on failure up to IPFS_ADD_RETRIES times.
+# chunks is a callable returning a fresh iterator over the file content for every attempt.
+def ipfs_add_with_retries(filename, chunks):
+    retries = getattr(settings, 'IPFS_ADD_RETRIES', 2)
+    for attempt in range(retries + 1):
+        try:
+            return ipfs_add_stream(filename, chunks())
+        except (RequestException, ValueError) as e:
+            if attempt == retries:
+                raise
+            print(f"Error adding file '{filename}' to IPFS, retrying ({attempt + 1}/{retries}): {e}")
+            time.sleep(0.5 * (attempt + 1))
+
+
+# This function adds files to IPFS concurrently, one request per file through a pool of IPFS_ADD_CONCURRENCY workers.
+# files maps a key to a (filename, chunks) tuple, and (key, entry, error) is yielded as soon as each file is done.
+def ipfs_add_concurrently(files):
+    concurrency = max(1, getattr(settings, 'IPFS_ADD_CONCURRENCY', 1))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ipfs-add') as pool:
+        futures = {
+            pool.submit(ipfs_add_with_retries, filename, chunks): key
+            for key, (filename, chunks) in files.items()
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+# This function uploads every file in its own IPFS request, recording each File as soon as its CID comes back.
+# Files already added are kept when others fail, the error listing only the failed ones.
+def upload_files_to_ipfs_concurrently(file_data, quote, content_types, digests):
+    references = {}
+    failures = {}
+    files = {field_name: (uploaded_file.name, uploaded_file.chunks) for field_name, uploaded_file in file_data.items()}
+
+    for field_name, entry, error in ipfs_add_concurrently(files):
+        uploaded_file = file_data[field_name]
+        if error is None:
+            try:
+                _, cid, _ = parse_ipfs_add_entry(entry)
+            except (KeyError, TypeError):
+                error = ValueError(f"Invalid IPFS response: {entry}")
+        if error is not None:
+            print(f"Error uploading file '{uploaded_file.name}' to IPFS: {error}")
+            failures[uploaded_file.name] = error
+            continue
+        check_local_cid(uploaded_file.name, getattr(uploaded_file, 'local_cid', None), cid)
+
+        File.objects.create(
+            quote=quote,
+            title=uploaded_file.name,
+            cid=cid,
+            public_url=f"https://ipfs.io/ipfs/{cid}?filename={uploaded_file.name}",
+            length=uploaded_file.size,
+            sha256=digests.get(uploaded_file.name)
+        )
+        print(f"File '{uploaded_file.name}' uploaded to IPFS and saved to the database.")
+        references[field_name] = {
+            "ipfs_uri": "ipfs://" + str(cid),
+            "content_type": content_types.get(uploaded_file.name, None)
+        }
+
+    if failures:
+        details = ', '.join(f"'{name}': {error}" for name, error in failures.items())
+        raise ValueError(f"Error uploading files to IPFS: {details}")
+
+    # Keep the references in the order the files were sent
+    return [references[field_name] for field_name in file_data]
+
 
 # This function is used to upload the files temporarily to IPFS
 def upload_files_to_ipfs(request_files, quote):
     files_reference = []
-    url = getattr(settings, 'IPFS_SERVICE_ENDPOINT') or "http://127.0.0.1:5001/api/v0/add"
+    url = get_ipfs_add_url()
     print('IPFS URL: ', url)
 
     # Preparing files with appropriate content type
     file_data = {}
     content_types = {}  # New dictionary for content types
+    digests = {}  # sha256 of the files content, by file name
+    local_cids = {}  # CID of the files computed locally, by file name
 
     for field_name, uploaded_file in request_files.items():
         print(f"Processing file '{uploaded_file}'.")
@@ -35,11 +415,52 @@ def upload_files_to_ipfs(request_files, quote):
             content_types[uploaded_file.name] = content_type  # Save the content type in the new dictionary
         else:
             print(f"Could not guess MIME type for file '{uploaded_file.name}'. Using default.")
-        
+
+        # Files streamed to IPFS while being received already have their CID, no need to send them again.
+        # Same thing for files whose content was already added to IPFS by a previous upload.
+        if getattr(uploaded_file, 'ipfs_streamed', False):
+            if uploaded_file.error is not None:
+                raise ValueError(f"Error streaming file '{uploaded_file.name}' to IPFS: {uploaded_file.error}")
+            cid = uploaded_file.cid
+            sha256 = uploaded_file.sha256
+            check_local_cid(uploaded_file.name, uploaded_file.local_cid, cid)
+        else:
+            sha256, uploaded_file.local_cid = digests_of_chunks(uploaded_file.chunks())
+            uploaded_file.seek(0)
+            cid = find_known_cid(sha256, uploaded_file.local_cid)
+
+        if cid:
+            added_file = {
+                'title': uploaded_file.name,
+                'cid': cid,
+                'public_url': f"https://ipfs.io/ipfs/{cid}?filename={uploaded_file.name}",
+                'length': uploaded_file.size,
+                'sha256': sha256
+            }
+            File.objects.create(quote=quote, **added_file)
+            print(f"File '{added_file['title']}' already in IPFS, saved to the database.")
+            files_reference.append({
+                "ipfs_uri": "ipfs://" + str(added_file['cid']),
+                "content_type": content_types.get(uploaded_file.name, None)
+            })
+            continue
+
+        digests[uploaded_file.name] = sha256
+        local_cids[uploaded_file.name] = uploaded_file.local_cid
         file_data[field_name] = uploaded_file  # Always store the uploaded_file in file_data
 
+    if not file_data:
+        print(f"files_reference: {files_reference}")
+        return files_reference
+
+    # One request per file, so that a large file does not hold up the others and a failure only affects its own file
+    if getattr(settings, 'IPFS_ADD_CONCURRENCY', 1) > 1:
+        files_reference.extend(upload_files_to_ipfs_concurrently(file_data, quote, content_types, digests))
+        print(f"files_reference: {files_reference}")
+        return files_reference
+
     try:
-        response = requests.post(url, files=file_data)
+        response = http_client.post(url, params=get_ipfs_add_params(), files=file_data, timeout=get_ipfs_add_timeout())
         response.raise_for_status()  # This will raise an error for HTTP error responses
         
         print("Processing files from IPFS response...")
@@ -53,14 +474,17 @@ def upload_files_to_ipfs(request_files, quote):
                 print(f"JSON response for file: {json_version}")  # Print the JSON response for each file
 
                 # Check if 'Name' is in the json_version before proceeding
-                if 'name' in json_version:
-                    added_file['title'] = json_version['name']
-                    print(f"File '{added_file['title']}' uploaded successfully to IPFS. {json_version['name']}")
-                    added_file['cid'] = json_version['cid']
+                if 'name' in json_version or 'Name' in json_version:
+                    name, cid, size = parse_ipfs_add_entry(json_version)
+                    added_file['title'] = name
+                    print(f"File '{added_file['title']}' uploaded successfully to IPFS. {name}")
+                    added_file['cid'] = cid
+                    check_local_cid(name, local_cids.get(name), cid)
                     added_file['public_url'] = f"https://ipfs.io/ipfs/{added_file['cid']}?filename={added_file['title']}"
-                    added_file['length'] = json_version['size']
+                    added_file['length'] = size
+                    added_file['sha256'] = digests.get(name)
 
-                    content_type_retrieved = content_types.get(json_version['name'], None)
+                    content_type_retrieved = content_types.get(name, None)
                     print(f"Content type for file '{added_file['title']}' is '{content_type_retrieved}'.")
                     print(f"Saving file '{added_file['title']}' to the database...")
                     File.objects.create(quote=quote, **added_file)
@@ -109,14 +533,15 @@ def create_allowance(quote, user_private_key, abi):
         rpcProvider = "https://rpc-mumbai.maticvigil.com"
 
     try:
-        my_provider = Web3.HTTPProvider(rpcProvider)
-        w3 = Web3(my_provider)
-        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        chainId = quote.payment.paymentMethod.chainId
+    except (ObjectDoesNotExist, AttributeError):
+        chainId = None
 
-        abi = json.loads(abi)
-
-        contractAddress = w3.toChecksumAddress(quote.tokenAddress)
-        contract = w3.eth.contract(contractAddress, abi=abi)
+    try:
+        # The Web3 client of the endpoint and the token contract are built once, and reused by the following allowances
+        client = web3_clients.get_client(rpcProvider)
+        w3 = client.w3
+        contract = client.get_contract(chainId, quote.tokenAddress, abi)
 
         userAddress = w3.toChecksumAddress(quote.payment.userAddress)
         approvalAddress = w3.toChecksumAddress(quote.approveAddress)
@@ -168,7 +593,7 @@ def upload_files_to_microservice(quote, params, files_reference):
     print(f"Sending request to microservice url: {url}")
 
     try:
-        response = requests.post(url, data=json.dumps(data), headers=headers)
+        response = http_client.post(url, data=json.dumps(data), headers=headers)
         response.raise_for_status()
     except RequestException as e:
         detailed_message = e.response.text if hasattr(e, 'response') and hasattr(e.response, 'text') else "No detailed message provided."
@@ -188,6 +613,472 @@ def upload_files_to_microservice(quote, params, files_reference):
 
 
 
+# This function atomically flags a quote as uploading, unless its files are being or have been uploaded already
+def claim_quote_upload(quote):
+    claimed = Quote.objects.filter(pk=quote.pk).exclude(
+        status__in=[str(UPLOAD_CODE[4][0]), str(UPLOAD_CODE[5][0])]
+    ).update(status=UPLOAD_CODE[4][0])
+    if claimed:
+        quote.status = UPLOAD_CODE[4][0]
+        broker.publish(quote.quoteId, quote.status)
+    return bool(claimed)
+
+
+# This function gives back a quote claimed by claim_quote_upload whose files were not received, restoring its previous status
+def release_quote_upload(quote, status):
+    if Quote.objects.filter(pk=quote.pk, status=str(UPLOAD_CODE[4][0])).update(status=status):
+        quote.status = status
+        broker.publish(quote.quoteId, quote.status)
+
+
+# This function pushes the files of a quote to IPFS, then hands them off to the storage microservice
+def upload_quote_files(quote, params, request_files):
+    # Check upload status to see if files have not been already uploaded
+    if str(quote.status) in [str(UPLOAD_CODE[4][0]), str(UPLOAD_CODE[5][0])]:
+        return Response("Files already uploaded.", status=400)
+
+    # Update quote status to uploading
+    quote.status = UPLOAD_CODE[4][0]
+    try:
+        quote.save(update_fields=['status'])
+    except Exception as e:
+        return Response(f"Error updating quote status: {str(e)}", status=500)
+    broker.publish(quote.quoteId, quote.status)
+
+    return push_quote_files(quote, params, request_files)
+
+
+# This function uploads the files of a quote already flagged as uploading, and sets its final status.
+# Only the status column is written: the nonce may have been advanced by other requests while the files were pushed.
+def push_quote_files(quote, params, request_files):
+    try:
+        # Upload files to IPFS
+        files_reference = upload_files_to_ipfs(request_files, quote)
+    except Exception as e:
+        # Flag the upload as failed so that the user is able to retry it
+        quote.status = UPLOAD_CODE[6][0]
+        quote.save(update_fields=['status'])
+        broker.publish(quote.quoteId, quote.status)
+        return Response(f"Error uploading to IPFS: {str(e)}", status=500)
+
+    # Upload files to micro-service
+    try:
+        response = upload_files_to_microservice(quote, params, files_reference)
+    except Exception as e:
+        # Flag the upload as failed so that the user is able to retry it
+        quote.status = UPLOAD_CODE[6][0]
+        quote.save(update_fields=['status'])
+        broker.publish(quote.quoteId, quote.status)
+        return Response(f"Error uploading to micro-service: {str(e)}", status=500)
+
+    if (response.status_code == 200):
+        print("File upload to microservice succeeded.")
+        quote.status = UPLOAD_CODE[5][0]
+        try:
+            quote.save(update_fields=['status'])
+        except Exception as e:
+            return Response(f"Error saving quote after successful upload: {str(e)}", status=500)
+        broker.publish(quote.quoteId, quote.status)
+        return Response("File upload succeeded.", status=200)
+
+    else:
+        print(f"Microservice upload failed with status code: {response.status_code}. Error message: {response.content}")
+        quote.status = UPLOAD_CODE[6][0]
+        try:
+            quote.save(update_fields=['status'])
+        except Exception as e:
+            return Response(f"Error updating quote status after failed upload: {str(e)}", status=500)
+        broker.publish(quote.quoteId, quote.status)
+
+        return Response(f"Microservice upload failed with status code: {response.status_code}", status=401)
+
+
+
+# This function sets the status of many quotes in a single UPDATE query.
+# updates maps the value of the given field (pk or quoteId) to the new status, other fields are set as given.
+def bulk_update_statuses(quotes, field, updates, **fields):
+    return quotes.filter(**{f'{field}__in': updates}).update(
+        status=Case(*[When(**{field: key}, then=Value(status)) for key, status in updates.items()], output_field=CharField()),
+        **fields
+    )
+
+
+# This function asks a storage micro-service for the status of one of its quotes
+def fetch_quote_status(storage, quoteId):
+    response = storage_request(storage, 'GET', urljoin(storage.url, f'getStatus?quoteId={quoteId}'))
+    response.raise_for_status()
+    return str(response.json()['status'])
+
+
+# This function turns the getLink answer of a storage micro-service into the links returned to the client.
+# Arweave answers with the list of its transactions, filecoin with a list whose first item holds the CID,
+# and other storages are passed through. It raises ValueError when the answer is not JSON.
+def normalize_link_response(storage, content):
+    links = json.loads(content)
+    if storage.type == "filecoin":
+        return {
+            "type": storage.type,
+            "CID": links[0]['CID']
+        }
+    return links
+
+
+# This function asks the storage micro-services for the status of the given quotes, through STATUS_POLL_CONCURRENCY workers.
+# The quotes of a storage whose circuit is open are skipped, and so are the ones whose status could not be fetched.
+# The statuses are written back in a single UPDATE query, and the new status of every refreshed quote is returned by pk.
+def refresh_quote_statuses(quotes):
+    by_storage = {}
+    for quote in quotes:
+        by_storage.setdefault(quote.storage, []).append(quote)
+    if not by_storage:
+        return {}
+
+    codes = {str(code) for code, _ in UPLOAD_CODE}
+    updates = {}
+    with ThreadPoolExecutor(max_workers=getattr(settings, 'STATUS_POLL_CONCURRENCY', 8), thread_name_prefix='status-poll') as pool:
+        futures = {}
+        for storage, storage_quotes in by_storage.items():
+            # A storage whose circuit is open is not polled at all
+            if get_breaker(storage).status()['state'] == circuit_breaker.OPEN:
+                print(f"Skipping the status poll of {len(storage_quotes)} quotes of storage '{storage.type}', circuit open.")
+                continue
+            for quote in storage_quotes:
+                futures[pool.submit(fetch_quote_status, storage, quote.quoteId)] = quote
+
+        for future in as_completed(futures):
+            quote = futures[future]
+            try:
+                status = future.result()
+            except (CircuitOpenError, RequestException, ValueError, KeyError, TypeError) as e:
+                print(f"Error polling the status of quote {quote.quoteId}: {e}")
+                continue
+            updates[quote.pk] = status if status in codes else quote.status
+
+    # Unchanged statuses are written too, to record when they were checked
+    if updates:
+        bulk_update_statuses(Quote.objects.all(), 'pk', updates, statusChecked=timezone.now())
+        broker.publish_many({quote.quoteId: updates[quote.pk] for quote in quotes if quote.pk in updates})
+    return updates
+
+
+# This function refreshes the status of the quotes in progress (100, 200, 300) from their storage micro-services.
+# Up to STATUS_POLL_BATCH quotes, the least recently checked first, are polled at once. Quotes whose status is pushed
+# by their storage, or whose files are still being sent by an upload job, are left out.
+def poll_quote_statuses():
+    in_progress = [str(UPLOAD_CODE[index][0]) for index in (2, 3, 4)]
+    quotes = list(Quote.objects.filter(status__in=in_progress, statusUpdated__isnull=True, storage__is_active=True) \
+        .exclude(upload_jobs__state__in=[JOB_STATE[0][0], JOB_STATE[1][0]]) \
+        .select_related('storage') \
+        .order_by(F('statusChecked').asc(nulls_first=True))[:getattr(settings, 'STATUS_POLL_BATCH', 500)])
+
+    updates = refresh_quote_statuses(quotes)
+    changed = sum(1 for quote in quotes if quote.pk in updates and updates[quote.pk] != quote.status)
+    print(f"Polled {len(updates)} quote statuses, {changed} changed.")
+    return changed
+
+
+# This function returns the status of many quotes at once, as a map of quoteId to status (None for unknown quotes).
+# All the quotes are read in a single query. The stale ones, neither pushed by their storage nor checked within STATUS_MAX_AGE,
+# are refreshed together from their storage micro-services. Final statuses (400, 401) never go stale, and quotes whose
+# files are still being sent by an upload job keep their local status.
+def get_quote_statuses(quoteIds):
+    pending_job = UploadJob.objects.filter(quote=OuterRef('pk'), state__in=[JOB_STATE[0][0], JOB_STATE[1][0]])
+    quotes = list(Quote.objects.filter(quoteId__in=quoteIds).select_related('storage').annotate(uploading=Exists(pending_job)))
+
+    final = [str(UPLOAD_CODE[index][0]) for index in (5, 6)]
+    max_age = timezone.now() - timezone.timedelta(seconds=getattr(settings, 'STATUS_MAX_AGE', 60))
+    stale = [
+        quote for quote in quotes
+        if quote.statusUpdated is None and not quote.uploading and quote.status not in final
+        and (quote.statusChecked is None or quote.statusChecked <= max_age)
+    ]
+    updates = refresh_quote_statuses(stale)
+
+    statuses = dict.fromkeys(quoteIds)
+    for quote in quotes:
+        statuses[quote.quoteId] = updates.get(quote.pk, quote.status)
+    return statuses
+
+
+# This function checks a request of a storage micro-service, a status push or a heartbeat. It must be signed by the approved
+# address, like the registration, over SHA256(prefix+type+nonce), with a nonce higher than the previous one of the same kind of
+# request of the storage, kept in nonce_field. The prefix keeps a signature of one kind of request from being replayed as the other.
+# It returns the storage, or a Response describing the error.
+def check_storage_push(data, nonce_field='statusNonce', prefix=''):
+    if not all(data.get(key) for key in ('type', 'nonce', 'signature')):
+        return Response("Invalid input data.", status=400)
+
+    try:
+        nonce = int(data['nonce'])
+    except (TypeError, ValueError):
+        return Response("Nonce value invalid.", status=400)
+
+    storage = registry.get(data['type'])
+    if storage is None:
+        return Response("Chosen storage type does not exist.", status=404)
+
+    message = "0x" + hashlib.sha256((prefix + str(data['type']) + str(nonce)).encode('utf-8')).hexdigest()
+    try:
+        recovered_address = recover_address(message, data['signature'])
+    except Exception as e:
+        print(f"Failed to verify the status push signature: {e}")
+        return Response("Invalid signature.", status=400)
+
+    approved_address = os.environ.get('APPROVED_ADDRESS') or ''
+    if recovered_address.lower() != approved_address.lower():
+        print("Status push received from non-approved address.")
+        return Response("Status push received from non-approved address.", status=403)
+
+    # The nonce is consumed atomically, a replayed push is refused
+    if not Storage.objects.filter(pk=storage.pk, **{f'{nonce_field}__lt': nonce}).update(**{nonce_field: nonce}):
+        return Response("Nonce value invalid.", status=400)
+
+    return storage
+
+
+# This function applies the statuses pushed by a storage in a single UPDATE query.
+# statuses is a list of {"quoteId": ..., "status": ...}, the number of updated quotes and the unknown quoteIds are returned.
+def apply_status_updates(storage, statuses):
+    codes = {str(code) for code, _ in UPLOAD_CODE}
+    updates = {}
+    for entry in statuses:
+        status = str(entry['status'])
+        if status not in codes:
+            raise ValueError(f"Invalid status {status} for quote {entry['quoteId']}.")
+        # The latest transition of a quote in the batch wins
+        updates[str(entry['quoteId'])] = status
+
+    if not updates:
+        return 0, []
+
+    updated = bulk_update_statuses(Quote.objects.filter(storage=storage), 'quoteId', updates, statusUpdated=timezone.now())
+    broker.publish_many(updates)
+    if updated == len(updates):
+        return updated, []
+
+    known = set(Quote.objects.filter(storage=storage, quoteId__in=updates).values_list('quoteId', flat=True))
+    return updated, [quoteId for quoteId in updates if quoteId not in known]
+
+
+# This function checks a request signed by a user for their own data, like the history: the signature of SHA256('' + nonce)
+# must come from userAddress, with a nonce higher than the previous one of the user. It returns True, or a Response describing the error.
+def check_user_signature(userAddress, nonce, signature):
+    try:
+        nonce = int(nonce)
+    except (TypeError, ValueError):
+        return Response("Nonce value invalid.", status=400)
+
+    message = "0x" + hashlib.sha256(('' + str(nonce)).encode('utf-8')).hexdigest()
+    try:
+        recovered_address = recover_address(message, signature)
+    except Exception as e:
+        print(f"Failed to verify the user signature: {e}")
+        return Response("Invalid signature.", status=400)
+
+    if recovered_address.lower() != str(userAddress).lower():
+        return Response("Signature does not match the user address.", status=403)
+
+    # The nonce is consumed atomically, a replayed request is refused
+    UserNonce.objects.get_or_create(userAddress=recovered_address.lower())
+    if not UserNonce.objects.filter(userAddress=recovered_address.lower(), nonce__lt=nonce).update(nonce=nonce):
+        return Response("Nonce value invalid.", status=400)
+
+    return True
+
+
+# This function checks a session token issued for a user, given instead of a nonce and a signature. The token is bound to the nonce
+# consumed when it was issued: a newer signed request of the user revokes it. On success the nonce and signature the token was
+# issued for are set in params, to be forwarded to the micro-services. It returns True, or a Response describing the error.
+def check_user_token(params):
+    userAddress = str(params.get('userAddress', [''])[0]).lower()
+    try:
+        claims = read_token(params['token'][0], 'user', userAddress)
+    except TokenError as e:
+        return Response(str(e), status=401)
+
+    if not UserNonce.objects.filter(userAddress=userAddress, nonce=claims['nonce']).exists():
+        return Response("Token revoked.", status=401)
+
+    params['nonce'] = [str(claims['nonce'])]
+    params['signature'] = [claims['signature']]
+    return True
+
+
+# This function encodes a history position as an opaque cursor, given back by the client to read the next page
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+# This function decodes a cursor made by encode_cursor, it raises ValueError when the cursor is invalid
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+# This function encodes the position of the last quote of a history page, the next page starts right after it
+def encode_history_cursor(quote):
+    return encode_cursor([quote.created.isoformat(), quote.pk])
+
+
+# This function decodes a history cursor, it raises ValueError when the cursor is invalid
+def decode_history_cursor(cursor):
+    try:
+        created, pk = decode_cursor(cursor)
+        return datetime.fromisoformat(created), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+# This function returns the status code of a quote, or None when it has none. Rows written by older versions hold the whole
+# UPLOAD_CODE tuple, such as "(300, 'Uploading file to storage')", their code is the leading integer.
+def parse_quote_status(value):
+    match = re.match(r"\s*\(?\s*(-?\d+)", str(value or ''))
+    return int(match.group(1)) if match else None
+
+
+# This function returns a page of the history of a user from the local quotes, the newest first, and the cursor of the next page.
+# Pages are read with keyset pagination on the (userAddress, created) index: the cost of a page does not depend on its position,
+# nor on the number of quotes of the user.
+def get_local_history(userAddress, storage_type=None, cursor=None, page_size=25):
+    quotes = Quote.objects.filter(userAddress=str(userAddress).lower()) \
+        .select_related('storage', 'payment__paymentMethod') \
+        .prefetch_related('files') \
+        .order_by('-created', '-pk')
+    if storage_type:
+        quotes = quotes.filter(storage__type=storage_type)
+    if cursor:
+        created, pk = decode_history_cursor(cursor)
+        quotes = quotes.filter(Q(created__lt=created) | Q(created=created, pk__lt=pk))
+
+    page = list(quotes[:page_size + 1])
+    history = [{
+        "type": quote.storage.type if quote.storage else None,
+        "quoteId": quote.quoteId,
+        "status": parse_quote_status(quote.status),
+        "chainId": int(quote.payment.paymentMethod.chainId) if quote.payment and quote.payment.paymentMethod else None,
+        "tokenAddress": quote.tokenAddress,
+        "tokenAmount": quote.tokenAmount,
+        "approveAddress": quote.approveAddress,
+        "created": quote.created.isoformat(),
+        "files": [{"cid": file.cid, "length": file.length} for file in quote.files.all()],
+    } for quote in page[:page_size]]
+    next_cursor = encode_history_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return history, next_cursor
+
+
+# This function returns the creation times of the history entries of the storages, read from the local quotes in a single query,
+# as the micro-services do not return them. entries maps the pk of a storage to its entries, the result maps
+# (storage pk, quoteId) to a timestamp.
+def history_entry_times(entries):
+    quoteIds = {
+        str(entry['quoteId']) for storage_entries in entries.values() for entry in storage_entries
+        if isinstance(entry, dict) and entry.get('quoteId') is not None
+    }
+    if not quoteIds:
+        return {}
+    quotes = Quote.objects.filter(storage__in=list(entries), quoteId__in=quoteIds).values_list('storage_id', 'quoteId', 'created')
+    return {(storage_id, quoteId): created.timestamp() for storage_id, quoteId, created in quotes}
+
+
+# This function returns the merge keys of the entries of a storage, in the order the storage returned them, the newest first.
+# Entries of quotes unknown locally take the time of the entry before them (or after them, at the top of the list), and the keys
+# never increase, so that the order of the storage, which the cursor offsets count in, is kept.
+def history_merge_keys(storage, entries, times):
+    known = [
+        times.get((storage.pk, str(entry.get('quoteId')))) if isinstance(entry, dict) else None
+        for entry in entries
+    ]
+    previous = next((created for created in known if created is not None), 0.0)
+    keys = []
+    for created in known:
+        if created is not None:
+            previous = min(previous, created)
+        keys.append(previous)
+    return keys
+
+
+# This function reads a page of the history of a user from a storage micro-service, the newest entries first
+def fetch_storage_history(storage, params, page, page_size):
+    query_params = {**params, 'page': page, 'pageSize': page_size}
+    response = storage_request(storage, 'GET', urljoin(storage.url, f'getHistory?{urlencode(query_params)}'))
+    response.raise_for_status()
+    entries = []
+    for entry in response.json():
+        # Some micro-services group their entries in lists
+        entries.extend(entry if isinstance(entry, list) else [entry])
+    return entries
+
+
+# This function reads the entries of the history of a user on a storage from the given position, at least page_size of them
+# unless the history ends first. When the position falls inside a page of the storage, the next page is read as well.
+# It returns the entries and whether the history of the storage ends with them.
+def fetch_storage_history_from(storage, params, offset, page_size):
+    page, skip = offset // page_size + 1, offset % page_size
+    entries = fetch_storage_history(storage, params, page, page_size)
+    exhausted = len(entries) < page_size
+    entries = entries[skip:]
+    if skip and not exhausted:
+        following = fetch_storage_history(storage, params, page + 1, page_size)
+        exhausted = len(following) < page_size
+        entries += following
+    return entries, exhausted
+
+
+# This function reads the history of a user from every given storage at once, and merges the entries by the creation time of their
+# local quotes, the newest first.
+# The cursor holds how many entries of each storage were already returned (None once a storage has no more), so a page only
+# fetches the pages of each storage it continues from, never the earlier ones. It returns the page, the cursor of the next one,
+# and the types of the storages that could not be read.
+def get_merged_history(storages, params, cursor=None, page_size=25):
+    offsets = decode_cursor(cursor) if cursor else {}
+    if not isinstance(offsets, dict) or not all(offset is None or isinstance(offset, int) for offset in offsets.values()):
+        raise ValueError("Invalid cursor.")
+    offsets = {storage.type: offsets.get(storage.type, 0) for storage in storages}
+    sources = [storage for storage in storages if offsets[storage.type] is not None]
+
+    fetched = {}
+    buffers = {}
+    exhausted = {}
+    unavailable = []
+    if sources:
+        with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='get-history') as pool:
+            futures = {
+                pool.submit(fetch_storage_history_from, storage, params, offsets[storage.type], page_size): storage
+                for storage in sources
+            }
+            for future in as_completed(futures):
+                storage = futures[future]
+                try:
+                    entries, exhausted[storage.type] = future.result()
+                except (CircuitOpenError, RequestException, ValueError) as e:
+                    print(f"No history from storage '{storage.type}': {e}")
+                    unavailable.append(storage.type)
+                    continue
+                fetched[storage] = entries
+
+    times = history_entry_times({storage.pk: entries for storage, entries in fetched.items()})
+    for storage, entries in fetched.items():
+        buffers[storage.type] = list(zip(history_merge_keys(storage, entries, times), [storage.type] * len(entries), entries))
+
+    history = []
+    consumed = dict.fromkeys(buffers, 0)
+    for _, storage_type, entry in heapq.merge(*buffers.values(), key=lambda item: item[0], reverse=True):
+        history.append({'type': storage_type, **entry} if isinstance(entry, dict) else entry)
+        consumed[storage_type] += 1
+        if len(history) == page_size:
+            break
+
+    for storage_type, count in consumed.items():
+        if exhausted[storage_type] and count == len(buffers[storage_type]):
+            offsets[storage_type] = None
+        else:
+            offsets[storage_type] += count
+    next_cursor = encode_cursor(offsets) if any(offset is not None for offset in offsets.values()) else None
+    return history, next_cursor, sorted(unavailable)
+
+
 # This function is used to generate the signature for every request
 def generate_signature(quoteId, nonce, pkey):
   message = "0x" + hashlib.sha256((str(quoteId) + str(nonce)).encode('utf-8')).hexdigest()
@@ -197,27 +1088,53 @@ def generate_signature(quoteId, nonce, pkey):
   return signed_message
 
 
+# This function checks a session token issued for the quote, given instead of a nonce and a signature. The token is bound to the nonce
+# consumed when it was issued: a newer signed request for the quote revokes it. On success the nonce and signature the token was
+# issued for are set in params, to be forwarded to the micro-service.
+def check_quote_token(params, quote):
+  try:
+    claims = read_token(params['token'][0], 'quote', quote.quoteId)
+  except TokenError as e:
+    return Response(str(e), status=401)
+
+  if round(quote.nonce.timestamp()) != claims['nonce']:
+    return Response("Token revoked.", status=401)
+
+  params['nonce'] = [str(claims['nonce'])]
+  params['signature'] = [claims['signature']]
+  return True
+
+
 def check_params_validity(params, quote):
-  if not all(key in params for key in ('nonce', 'signature')):
+  # A session token can be given instead of the nonce and the signature
+  with_token = 'token' in params and 'signature' not in params
+  if not with_token and not all(key in params for key in ('nonce', 'signature')):
     return Response("Missing query parameters.", status=400)
 
   # Check expiration date of the quote vs current date
   if quote.created > timezone.now() + timezone.timedelta(minutes=30):
     return Response("Quote already expired, please create a new one.", status=400)
 
-  # Check nonce
-  if str(round(quote.nonce.timestamp())) > params['nonce'][0]:
+  if with_token:
+    return check_quote_token(params, quote)
+
+  # Nonces are timestamps, compared as numbers
+  try:
+    nonce = datetime.fromtimestamp(int(params['nonce'][0]), timezone.utc)
+  except (TypeError, ValueError, OverflowError, OSError):
     return Response("Nonce value invalid.", status=400)
 
   message = "0x" + hashlib.sha256((str(quote.quoteId) + str(params['nonce'][0])).encode('utf-8')).hexdigest()
-  message = encode_defunct(text=message)
-  
-  # Use verifyMessage from web3/ethereum API
-  check_signature = w3.eth.account.recover_message(message, signature=params['signature'][0])
+
+  # Use verifyMessage from web3/ethereum API, through the cache of recovered addresses
+  check_signature = recover_address(message, params['signature'][0])
 
   if check_signature:
-    quote.nonce = datetime.fromtimestamp(int(params['nonce'][0]), timezone.utc)
-    quote.save()
+    # The nonce only moves forward, in a single conditional UPDATE: of concurrent requests with the same nonce, one is accepted,
+    # whatever the worker or node serving them. Only the nonce column is written.
+    if not Quote.objects.filter(pk=quote.pk, nonce__lt=nonce).update(nonce=nonce):
+      return Response("Nonce value invalid.", status=400)
+    quote.nonce = nonce
 
     return True
 
@@ -1,12 +1,18 @@
+import asyncio
 import datetime
 import json
 import time
 import os
+import shutil
+import tempfile
 
 import requests
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from urllib.parse import urljoin, urlparse, urlencode
@@ -15,17 +21,48 @@ from rest_framework import serializers, parsers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiExample, inline_serializer, OpenApiParameter
+from drf_spectacular.types import OpenApiTypes
 
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 
 from .serializers import StorageSerializer, QuoteSerializer, CreateStorageSerializer
-from .models import Quote, Storage, File, PaymentMethod, AcceptedToken, UPLOAD_CODE
-from .utils import check_params_validity, upload_files_to_ipfs, upload_files_to_microservice, create_allowance
+from .models import Quote, Storage, File, PaymentMethod, AcceptedToken, UploadSession, UPLOAD_CODE, JOB_STATE
+from .utils import check_params_validity, claim_quote_upload, release_quote_upload, push_quote_files, upload_quote_files, ipfs_add_stream, parse_ipfs_add_entry, create_allowance, \
+    read_staged_file, digests_of_chunks, find_known_cid, check_local_cid, get_quote_cache_key, get_cached_quote, cache_quote, \
+    invalidate_storage_quotes, prepare_quote_data, compare_storage_quotes, select_storage_quote, check_storage_push, \
+    apply_status_updates, get_quote_statuses, normalize_link_response, check_user_signature, get_local_history, \
+    get_merged_history, get_storage_info, check_user_token
+from .upload_handlers import IPFSStreamingUploadHandler, IPFSUploadedFile, StagingUploadHandler
+from .jobs import enqueue_upload_job
+from . import metrics
+from .circuit_breaker import CircuitOpenError, storage_request
+from .registry import registry
+from .session_tokens import issue_token
+from .signatures import recover_address
+from .status_broker import broker as status_broker
 from web3.auto import w3
 from eth_account.messages import encode_defunct
 
 
+# Response whose JSON body was rendered beforehand, it is sent as is
+class PreRenderedResponse(Response):
+    def __init__(self, data, body, **kwargs):
+        super().__init__(data, **kwargs)
+        self.prerendered = body
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = 'application/json'
+        return self.prerendered
+
+
+# This function returns the response sent instead of calling a storage whose circuit is open
+def storage_unavailable(error):
+    print(error)
+    return Response({'error': str(error)}, status=503, headers={'Retry-After': str(int(error.retry_after) + 1)})
+
+
 # Storage service creation class
 class StorageCreationView(APIView):
     write_serializer_class = CreateStorageSerializer
@@ -102,9 +139,7 @@ class StorageCreationView(APIView):
             try:
                 print(f"Received signature in request: {signature}")
                 print(f"Received original_message in request: {original_message}")
-                message = encode_defunct(text=original_message)
-                print(f"Encoded message: {message}")
-                recovered_address = w3.eth.account.recover_message(message, signature=signature)
+                recovered_address = recover_address(original_message, signature)
                 print(f"Recovered Ethereum address: {recovered_address}")
             except Exception as e:
                 print("Failed to verify the signature.")
@@ -120,13 +155,18 @@ class StorageCreationView(APIView):
 
             print("Registration request received from approved address. Proceeding with registration.")
             storage, created = Storage.objects.get_or_create(type=data['type'])
+            # A registering storage may come with new prices
+            invalidate_storage_quotes(storage)
 
             if not created:
                 if storage.is_active:
+                    # Registering again keeps the storage alive, without changing the registry
+                    Storage.objects.filter(pk=storage.pk).update(last_heartbeat=timezone.now())
                     print("Chosen storage type is already active and registered.")
                     return Response('Chosen storage type is already active and registered.', status=200)
                 else:
                     storage.is_active = True
+                    storage.last_heartbeat = timezone.now()
                     storage.save()
                     print("Chosen storage type reactivated.")
                     return Response('Chosen storage type reactivated.', status=201)
@@ -160,12 +200,117 @@ class StorageCreationView(APIView):
                         paymentMethod=payment_method, title=token_title, value=token_value)
                     accepted_token.save()
                     print("Accepted token created")
-                
+
             return Response('Desired storage created.', status=201)
         except Exception as e:
             print(f"Unhandled exception occurred: {e}")
             return Response("Internal server error.", status=500)
 
+# Private endpoint where the storage micro-services push the status transitions of their quotes
+class QuoteStatusUpdateView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=inline_serializer(
+            name='QuoteStatusUpdateRequest',
+            fields={
+                'type': serializers.CharField(),
+                'nonce': serializers.IntegerField(),
+                'signature': serializers.CharField(),
+                'statuses': serializers.ListField(child=serializers.DictField()),
+            }
+        ),
+        examples=[
+            OpenApiExample(
+                "QuoteStatusUpdateExample",
+                value={
+                    "type": "filecoin",
+                    "nonce": 1700000000,
+                    "signature": "0x...",
+                    "statuses": [
+                        {"quoteId": "xxxx", "status": 300},
+                        {"quoteId": "yyyy", "status": 400}
+                    ]
+                },
+                request_only=True,
+                response_only=False
+            )
+        ],
+        responses={
+            200: inline_serializer(
+                name='QuoteStatusUpdateResponse',
+                fields={
+                    'updated': serializers.IntegerField(),
+                    'unknown': serializers.ListField(child=serializers.CharField()),
+                }
+            ),
+        }
+    )
+    def post(self, request):
+        """
+        Apply a batch of quote status transitions pushed by a storage micro-service
+        """
+        data = request.data
+        statuses = data.get('statuses')
+        if not isinstance(statuses, list) or len(statuses) > getattr(settings, 'STATUS_PUSH_MAX_BATCH', 1000):
+            return Response("Invalid input data.", status=400)
+        if not all(isinstance(entry, dict) and 'quoteId' in entry and 'status' in entry for entry in statuses):
+            return Response("Invalid input data.", status=400)
+
+        storage = check_storage_push(data)
+        if isinstance(storage, Response):
+            return storage
+
+        try:
+            updated, unknown = apply_status_updates(storage, statuses)
+        except ValueError as e:
+            return Response(str(e), status=400)
+
+        print(f"Applied {len(statuses)} status updates from storage '{storage.type}'.")
+        return Response({"updated": updated, "unknown": unknown}, status=200)
+
+
+# Private endpoint where the storage micro-services signal that they are alive
+class StorageHeartbeatView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=inline_serializer(
+            name='StorageHeartbeatRequest',
+            fields={
+                'type': serializers.CharField(),
+                'nonce': serializers.IntegerField(),
+                'signature': serializers.CharField(),
+            }
+        ),
+        examples=[
+            OpenApiExample(
+                "StorageHeartbeatExample",
+                value={
+                    "type": "filecoin",
+                    "nonce": 1700000000,
+                    "signature": "0x..."
+                },
+                request_only=True,
+                response_only=False
+            )
+        ],
+        responses={
+            200: OpenApiResponse(description='Heartbeat recorded.'),
+            404: OpenApiResponse(description='Chosen storage type does not exist.'),
+        }
+    )
+    def post(self, request):
+        """
+        Record that a storage micro-service is alive, an expired storage has to register again
+        """
+        storage = check_storage_push(request.data, nonce_field='heartbeatNonce', prefix='heartbeat')
+        if isinstance(storage, Response):
+            return storage
+
+        # The registry does not change, the snapshots of the processes are kept
+        Storage.objects.filter(pk=storage.pk).update(last_heartbeat=timezone.now())
+        return Response('Heartbeat recorded.', status=200)
+
+
 # Storage service listing class
 
 
@@ -221,11 +366,9 @@ class StorageListView(APIView):
         """
         List all available storages
         """
-        storages = Storage.objects.filter(is_active=True)
-        print(f"Retrieved storages: {storages}")
-        serializer = self.read_serializer_class(storages, many=True)
-        print(f"Serialized storages: {serializer.data}")
-        return Response(serializer.data, status=200)
+        # Rendered once and kept until the storages change: the first call of every frontend session costs no query
+        data, body = get_storage_info()
+        return PreRenderedResponse(data, body, status=200)
 
 # Quote creation endpoint
 
@@ -295,12 +438,17 @@ class QuoteCreationView(APIView):
             return Response("Invalid input data.", status=400)
 
         # From type, retrieve associated storage object
-        try:
-            storage = Storage.objects.get(type=data['type'])
-            # If not exists, raise error
-        except:
+        storage = registry.get(data['type'])
+        if storage is None:
             return Response({'error': 'Chosen storage type does not exist.'}, status=400)
-        
+
+        # The same request from the same user gets back its quote, as long as no file was uploaded for it
+        cache_key = get_quote_cache_key(storage, data)
+        cached_quote = get_cached_quote(cache_key) if cache_key else None
+        if cached_quote is not None:
+            print(f"Reusing quote {cached_quote['quoteId']} for identical request.")
+            return Response(cached_quote, status=201)
+
         response = None 
 
         try:
@@ -318,9 +466,11 @@ class QuoteCreationView(APIView):
             print(f"Data being sent: {json.dumps(data)}")
             print(f"Headers being sent: {headers}")
 
-            response = requests.post(
+            response = storage_request(
+                storage,
+                'POST',
                 get_quote_url,
-                json.dumps(data),
+                data=json.dumps(data),
                 headers=headers,
                 timeout=10  # Set a timeout to avoid indefinite waiting
             )
@@ -332,6 +482,9 @@ class QuoteCreationView(APIView):
             else:
                 print(f"Received {response.status_code} status code from {get_quote_url} with response: {response.text}")
 
+        except CircuitOpenError as e:
+            return storage_unavailable(e)
+
         except requests.Timeout:
             print(f"Request to {get_quote_url} timed out.")
 
@@ -358,11 +511,7 @@ class QuoteCreationView(APIView):
                         print(f"Error decoding JSON: {e}")
                         return Response({'error': 'Invalid response format'}, status=500)
 
-                    data['storage'] = storage.pk
-                    data['status'] = UPLOAD_CODE[1][0]
-                    data['payment']['paymentMethod'] = {'chainId': data['payment']['chainId']}
-                    data['payment']['userAddress'] = data['userAddress']
-                    data.update(response_data)
+                    data = prepare_quote_data(storage, data, response_data)
 
                     serializer = QuoteSerializer(data=data)
                     if serializer.is_valid():
@@ -370,13 +519,16 @@ class QuoteCreationView(APIView):
                         try:
                             quote = serializer.save()
                             print("Quote saved successfully.")
-                            return Response({
+                            quote_response = {
                                 'quoteId': quote.quoteId,
                                 'tokenAmount': quote.tokenAmount,
                                 'approveAddress': quote.approveAddress,
                                 'chainId': data['payment']['paymentMethod']['chainId'],
                                 'tokenAddress': quote.tokenAddress
-                            }, status=201)
+                            }
+                            if cache_key:
+                                cache_quote(cache_key, quote, quote_response)
+                            return Response(quote_response, status=201)
                         except Exception as e:
                             print(f"Error saving quote: {e}")
                             return Response({'error': 'Error saving quote'}, status=500)
@@ -398,6 +550,81 @@ class QuoteCreationView(APIView):
             print(f"Unhandled exception: {e}")
             return JsonResponse({'error': 'An unexpected error occurred'}, status=500)
 
+# Quote comparison endpoint, asking every active storage for a quote at once
+class QuoteComparisonView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=inline_serializer(
+            name='QuoteComparisonRequest',
+            fields={
+                'files': serializers.ListField(child=serializers.DictField()),
+                'duration': serializers.IntegerField(),
+                'payment': serializers.DictField(),
+                'userAddress': serializers.CharField(),
+            }
+        ),
+        responses={
+            200: inline_serializer(
+                name='QuoteComparisonResponse',
+                fields={
+                    'quotes': serializers.ListField(child=serializers.DictField()),
+                    'unavailable': serializers.ListField(child=serializers.CharField()),
+                }
+            ),
+        }
+    )
+    def post(self, request):
+        """
+        Compare the quotes of every active storage, cheapest first. Storages failing or answering too late are listed as unavailable.
+        """
+        data = request.data
+        if not all(key in data for key in ('files', 'duration', 'payment', 'userAddress')) \
+                or not isinstance(data['payment'], dict) or not all(key in data['payment'] for key in ('chainId', 'tokenAddress')):
+            return Response("Invalid input data.", status=400)
+
+        storages = registry.active()
+        quotes, unavailable = compare_storage_quotes(storages, {key: data[key] for key in ('files', 'duration', 'payment', 'userAddress')})
+        return Response({'quotes': quotes, 'unavailable': unavailable}, status=200)
+
+
+# Quote selection endpoint, recording the quote picked among the compared ones
+class QuoteSelectionView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=inline_serializer(
+            name='QuoteSelectionRequest',
+            fields={
+                'selection': serializers.CharField(),
+            }
+        ),
+        responses={
+            201: inline_serializer(
+                name='QuoteSelectionResponse',
+                fields={
+                    'quoteId': serializers.CharField(),
+                    'tokenAmount': serializers.IntegerField(),
+                    'approveAddress': serializers.CharField(),
+                    'chainId': serializers.IntegerField(),
+                    'tokenAddress': serializers.CharField(),
+                }
+            ),
+        }
+    )
+    def post(self, request):
+        """
+        Record the quote picked by the client, from the selection token returned by getQuotes
+        """
+        selection = request.data.get('selection')
+        if not selection:
+            return Response("Invalid input data.", status=400)
+
+        quote = select_storage_quote(selection)
+        if isinstance(quote, Response):
+            return quote
+
+        return Response(quote, status=201)
+
+
 # Quote detail endpoint displaying the detail of a quote, no update, no deletion for now.
 class QuoteStatusView(APIView):
     @csrf_exempt
@@ -436,28 +663,135 @@ class QuoteStatusView(APIView):
         """
         quoteId = request.GET.get('quoteId')
         try:
-            quote = Quote.objects.get(quoteId=quoteId)
+            quote = registry.attach(Quote.objects.get(quoteId=quoteId))
         except Quote.DoesNotExist:
             return Response('Quote does not exist.', status=404)
 
+        # While the files are pushed in the background, or if that failed, the micro-service does not know them yet
+        job = quote.upload_jobs.last()
+        if job is not None and job.state != JOB_STATE[2][0]:
+            return Response({
+                "status": quote.status
+            })
+
+        # Statuses pushed by the micro-service are up to date, and so are the ones recently polled: it does not need to be asked
+        max_age = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'STATUS_MAX_AGE', 60))
+        if quote.statusUpdated is not None or (quote.statusChecked is not None and quote.statusChecked > max_age):
+            return Response({
+                "status": quote.status
+            })
+
         # Request status of quote from micro-service
         get_status_endpoint = f'getStatus?quoteId={quoteId}'
         get_status_url = urljoin(quote.storage.url, get_status_endpoint)
-        response = requests.get(
-            get_status_url
-        )
+        try:
+            response = storage_request(quote.storage, 'GET', get_status_url)
+        except CircuitOpenError as e:
+            return storage_unavailable(e)
+        except requests.RequestException as e:
+            # The micro-service could not be reached, the last known status is kept
+            print(f"Error requesting the status of quote {quoteId}: {e}")
+            return Response({
+                "status": quote.status
+            })
 
+        # Only the status columns are written, the nonce may have been advanced by other requests meanwhile
+        quote.statusChecked = timezone.now()
         try:
             quote.status = json.loads(response.content)['status']
-            quote.save()
+            quote.save(update_fields=['status', 'statusChecked'])
         except Exception as e:
             quote.status = UPLOAD_CODE[6][0]
-            quote.save()
+            quote.save(update_fields=['status', 'statusChecked'])
+        status_broker.publish(quote.quoteId, quote.status)
 
         return Response({
             "status": quote.status
         })
 
+# Status of many quotes endpoint
+class QuoteStatusBatchView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=[],
+        parameters=[
+            OpenApiParameter(
+                name='quoteIds',
+                description='Comma separated quote IDs',
+                type=str
+            )
+        ],
+        examples=[
+            OpenApiExample(
+                "QuoteStatusBatchResponseExample",
+                value={
+                    "statuses": {"xxxx": "300", "yyyy": "400", "zzzz": None},
+                },
+                request_only=False,
+                response_only=True
+            )
+        ],
+        responses={
+            200: inline_serializer(
+                name='QuoteStatusBatchResponse',
+                fields={
+                    'statuses': serializers.DictField(child=serializers.CharField(allow_null=True))
+                }
+            ),
+            400: OpenApiResponse(description='Invalid input data.'),
+        }
+    )
+    def get(self, request):
+        """
+        Retrieve the statuses of many quotes at once
+        """
+        quoteIds = [quoteId for quoteId in request.GET.get('quoteIds', '').split(',') if quoteId]
+        return self.statuses(quoteIds)
+
+    @csrf_exempt
+    @extend_schema(
+        request=inline_serializer(
+            name='QuoteStatusBatchRequest',
+            fields={
+                'quoteIds': serializers.ListField(child=serializers.CharField()),
+            }
+        ),
+        examples=[
+            OpenApiExample(
+                "QuoteStatusBatchRequestExample",
+                value={
+                    "quoteIds": ["xxxx", "yyyy", "zzzz"]
+                },
+                request_only=True,
+                response_only=False
+            )
+        ],
+        responses={
+            200: inline_serializer(
+                name='QuoteStatusBatchResponse',
+                fields={
+                    'statuses': serializers.DictField(child=serializers.CharField(allow_null=True))
+                }
+            ),
+            400: OpenApiResponse(description='Invalid input data.'),
+        }
+    )
+    def post(self, request):
+        """
+        Retrieve the statuses of many quotes at once, for lists of quoteIds too long for a query string
+        """
+        quoteIds = request.data.get('quoteIds')
+        if not isinstance(quoteIds, list) or not all(isinstance(quoteId, str) for quoteId in quoteIds):
+            return Response("Invalid input data.", status=400)
+        return self.statuses(quoteIds)
+
+    def statuses(self, quoteIds):
+        if not quoteIds or len(quoteIds) > getattr(settings, 'STATUS_BATCH_MAX_IDS', 1000):
+            return Response("Invalid input data.", status=400)
+        return Response({
+            "statuses": get_quote_statuses(quoteIds)
+        })
+
 # Upload file associated with a quote endpoint
 class UploadFile(APIView):
     @csrf_exempt
@@ -477,6 +811,16 @@ class UploadFile(APIView):
                 name='signature',
                 description='Signature',
                 type=str
+            ),
+            OpenApiParameter(
+                name='token',
+                description='Session token from getToken, given instead of the nonce and the signature',
+                type=str
+            ),
+            OpenApiParameter(
+                name='async',
+                description='Return 202 as soon as the files are staged, and upload them in the background',
+                type=bool
             )
         ],
         request={
@@ -510,6 +854,7 @@ class UploadFile(APIView):
         ],
         responses={
             200: OpenApiResponse(description='File upload succeeded.'),
+            202: OpenApiResponse(description='Files staged, upload running in the background.'),
             400: OpenApiResponse(description='Looks like something failed.'),
         }
     )
@@ -518,7 +863,7 @@ class UploadFile(APIView):
         quoteId = request.GET.get('quoteId')
 
         try:
-            quote = Quote.objects.get(quoteId=quoteId)
+            quote = registry.attach(Quote.objects.get(quoteId=quoteId))
         except Quote.DoesNotExist:
             return Response('Quote does not exist.', status=404)
 
@@ -526,52 +871,328 @@ class UploadFile(APIView):
         if isinstance(is_valid, Response):
             return is_valid
 
-        # Check existence of FILES in the request
-        if not request.FILES:
+        run_async = request.GET.get('async', '').lower() == 'true'
+
+        # The quote is claimed before the body is read, as the streaming handler pushes the files to IPFS while they are received:
+        # a duplicate or replayed upload is refused without its content being sent anywhere.
+        previous_status = quote.status
+        if not claim_quote_upload(quote):
+            return Response("Files already uploaded.", status=400)
+
+        # The body is only parsed when request.FILES is first accessed, so the handlers must be set before.
+        if run_async:
+            # Stage the files on disk, they are pushed to IPFS and to the micro-service in the background
+            request.upload_handlers = [StagingUploadHandler(request)]
+        elif getattr(settings, 'IPFS_STREAMING_UPLOAD', False):
+            # Stream the files to IPFS while they are received instead of buffering the whole body
+            request.upload_handlers = [IPFSStreamingUploadHandler(request)]
+
+        # Check existence of FILES in the request, the claim is released when no file could be received
+        try:
+            files_received = bool(request.FILES)
+        except Exception:
+            release_quote_upload(quote, previous_status)
+            raise
+        if not files_received:
+            release_quote_upload(quote, previous_status)
             return Response("No file sent alongside the request.", status=400)
 
-        # Check upload status to see if files have not been already uploaded
-        if quote.status in [UPLOAD_CODE[4][0], UPLOAD_CODE[5][0]]:
+        if run_async:
+            staged_files = [
+                {
+                    'name': uploaded_file.name,
+                    'path': uploaded_file.staged_path,
+                    'size': uploaded_file.size,
+                    'sha256': uploaded_file.sha256,
+                    'cid': uploaded_file.local_cid
+                }
+                for uploaded_file in request.FILES.values()
+            ]
+            enqueue_upload_job(quote, params, staged_files)
+            # The CIDs are computed while the files are received, so they are known before the IPFS add
+            files = [{'name': staged['name'], 'cid': staged['cid']} for staged in staged_files]
+            return Response({"status": quote.status, "files": files}, status=202)
+
+        # Push the files to IPFS then to the micro-service, the quote is flagged as failed when that does not succeed
+        return push_quote_files(quote, params, request.FILES)
+
+
+# Resumable upload: create an upload session for a quote
+class UploadSessionCreateView(APIView):
+    parser_classes = (parsers.JSONParser,)
+
+    @csrf_exempt
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='quoteId',
+                description='Quote ID',
+                type=str
+            ),
+            OpenApiParameter(
+                name='nonce',
+                description='Nonce',
+                type=int
+            ),
+            OpenApiParameter(
+                name='signature',
+                description='Signature',
+                type=str
+            ),
+            OpenApiParameter(
+                name='token',
+                description='Session token from getToken, given instead of the nonce and the signature',
+                type=str
+            )
+        ],
+        examples=[
+            OpenApiExample(
+                "UploadSessionCreationRequestExample",
+                value={
+                    "filename": "dataset.csv",
+                    "length": 4294967296
+                },
+                request_only=True,
+                response_only=False
+            ),
+            OpenApiExample(
+                "UploadSessionCreationResponseExample",
+                value={
+                    "sessionId": "2c1e1b4e-8f6e-4a55-9d6c-0f7a4a5c3e11",
+                    "offset": 0,
+                    "length": 4294967296
+                },
+                request_only=False,
+                response_only=True
+            )
+        ],
+        responses={
+            201: OpenApiResponse(description='Upload session created.'),
+            400: OpenApiResponse(description='Invalid input data.'),
+            404: OpenApiResponse(description='Quote does not exist.'),
+        }
+    )
+    def post(self, request):
+        """
+        Create a resumable upload session for a quote, the signature being checked only once
+        """
+        params = {**request.GET}
+        quoteId = request.GET.get('quoteId')
+
+        try:
+            quote = registry.attach(Quote.objects.get(quoteId=quoteId))
+        except Quote.DoesNotExist:
+            return Response('Quote does not exist.', status=404)
+
+        is_valid = check_params_validity(params, quote)
+        if isinstance(is_valid, Response):
+            return is_valid
+
+        if str(quote.status) in [str(UPLOAD_CODE[4][0]), str(UPLOAD_CODE[5][0])]:
             return Response("Files already uploaded.", status=400)
 
-        # Update quote status to uploading
-        quote.status = UPLOAD_CODE[4]
+        filename = request.data.get('filename')
         try:
-            quote.save()
-        except Exception as e:
-            return Response(f"Error updating quote status: {str(e)}", status=500)
+            length = int(request.data.get('length'))
+        except (TypeError, ValueError):
+            return Response("Invalid input data.", status=400)
+        if not filename or length <= 0:
+            return Response("Invalid input data.", status=400)
+
+        session = UploadSession.objects.create(
+            quote=quote,
+            filename=filename,
+            length=length,
+            nonce=params['nonce'][0],
+            signature=params['signature'][0]
+        )
+
+        # Create the empty staging file receiving the byte ranges
+        os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+        open(session.path, 'wb').close()
+
+        return Response({
+            "sessionId": str(session.sessionId),
+            "offset": session.offset,
+            "length": session.length
+        }, status=201)
 
+
+# Resumable upload: query the committed offset of a session and send byte ranges
+class UploadSessionView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=[],
+        responses={
+            200: inline_serializer(
+                name='UploadSessionOffsetResponse',
+                fields={
+                    'offset': serializers.IntegerField(),
+                    'length': serializers.IntegerField()
+                }
+            ),
+            404: OpenApiResponse(description='Upload session does not exist.'),
+        }
+    )
+    def get(self, request, sessionId):
+        """
+        Retrieve the number of bytes committed for an upload session
+        """
         try:
-        # Upload files to IPFS
-            files_reference = upload_files_to_ipfs(request.FILES, quote)
-        except Exception as e:
-            return Response(f"Error uploading to IPFS: {str(e)}", status=500)
+            session = UploadSession.objects.get(sessionId=sessionId)
+        except UploadSession.DoesNotExist:
+            return Response('Upload session does not exist.', status=404)
+
+        return Response({
+            "offset": session.offset,
+            "length": session.length
+        })
+
+    @csrf_exempt
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='offset',
+                description='Offset of the first byte sent in the body, must match the committed offset',
+                type=int
+            )
+        ],
+        request={
+            "application/octet-stream": OpenApiTypes.BINARY
+        },
+        responses={
+            200: OpenApiResponse(description='Byte range committed, returns the new offset.'),
+            400: OpenApiResponse(description='Invalid input data.'),
+            404: OpenApiResponse(description='Upload session does not exist.'),
+            409: OpenApiResponse(description='Offset does not match the committed offset.'),
+        }
+    )
+    def put(self, request, sessionId):
+        """
+        Append a byte range to an upload session, starting at the committed offset
+        """
+        try:
+            session = UploadSession.objects.get(sessionId=sessionId)
+        except UploadSession.DoesNotExist:
+            return Response('Upload session does not exist.', status=404)
+
+        if session.finalized:
+            return Response('Upload session already finalized.', status=400)
+
+        try:
+            offset = int(request.GET.get('offset'))
+        except (TypeError, ValueError):
+            return Response("Missing or invalid offset.", status=400)
+
+        if offset != session.offset:
+            return Response({"offset": session.offset, "length": session.length}, status=409)
+
+        # Receive the body into a temporary file chunk by chunk, it is never held in memory as a whole.
+        # The staged file is only written once this request won the offset.
+        written = 0
+        stream = request.stream
+        chunk_size = getattr(settings, 'IPFS_STREAM_CHUNK_SIZE', 64 * 2 ** 10)
+        with tempfile.TemporaryFile(dir=settings.UPLOAD_STAGING_DIR) as received:
+            while stream is not None:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                if offset + written + len(chunk) > session.length:
+                    return Response("Byte range exceeds the declared length.", status=400)
+                received.write(chunk)
+                written += len(chunk)
+
+            # The conditional UPDATE locks the session until the bytes are appended: of concurrent requests at the same offset,
+            # one commits its bytes and the others get a 409 without having written anything
+            with transaction.atomic():
+                updated = UploadSession.objects.filter(pk=session.pk, offset=offset, finalized=False).update(offset=offset + written)
+                if updated:
+                    received.seek(0)
+                    with open(session.path, 'r+b') as staged:
+                        staged.seek(offset)
+                        shutil.copyfileobj(received, staged, chunk_size)
+                        staged.flush()
+                        os.fsync(staged.fileno())
+
+        if not updated:
+            session.refresh_from_db()
+            return Response({"offset": session.offset, "length": session.length}, status=409)
+
+        return Response({
+            "offset": offset + written,
+            "length": session.length
+        })
+
+
+# Resumable upload: push the staged file to IPFS then to the micro-service
+class UploadSessionFinalizeView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=[],
+        parameters=[
+            OpenApiParameter(
+                name='async',
+                description='Return 202 right away, and upload the staged file in the background',
+                type=bool
+            )
+        ],
+        responses={
+            200: OpenApiResponse(description='File upload succeeded.'),
+            202: OpenApiResponse(description='Upload running in the background.'),
+            400: OpenApiResponse(description='Upload incomplete.'),
+            404: OpenApiResponse(description='Upload session does not exist.'),
+        }
+    )
+    def post(self, request, sessionId):
+        """
+        Finalize an upload session once all its bytes have been committed
+        """
+        try:
+            session = UploadSession.objects.select_related('quote').get(sessionId=sessionId)
+        except UploadSession.DoesNotExist:
+            return Response('Upload session does not exist.', status=404)
+
+        if session.finalized:
+            return Response('Upload session already finalized.', status=400)
+
+        if session.offset != session.length:
+            return Response({"error": "Upload incomplete.", "offset": session.offset, "length": session.length}, status=400)
+
+        params = {'nonce': [session.nonce], 'signature': [session.signature]}
+
+        if request.GET.get('async', '').lower() == 'true':
+            if not claim_quote_upload(session.quote):
+                return Response("Files already uploaded.", status=400)
+
+            # The staged file now belongs to the job, which removes it once uploaded
+            session.finalized = True
+            session.save(update_fields=['finalized'])
+            sha256, local_cid = digests_of_chunks(read_staged_file(session.path))
+            staged_files = [{'name': session.filename, 'path': session.path, 'size': session.length, 'sha256': sha256, 'cid': local_cid}]
+            enqueue_upload_job(session.quote, params, staged_files)
+            return Response({"status": session.quote.status, "files": [{'name': session.filename, 'cid': local_cid}]}, status=202)
 
-        # Upload files to micro-service
         try:
-            response = upload_files_to_microservice(quote, params, files_reference)
+            # The staged file is only added to IPFS if its content is not there already
+            sha256, local_cid = digests_of_chunks(read_staged_file(session.path))
+            cid = find_known_cid(sha256, local_cid)
+            if not cid:
+                entry = ipfs_add_stream(session.filename, read_staged_file(session.path))
+                _, cid, _ = parse_ipfs_add_entry(entry)
+                check_local_cid(session.filename, local_cid, cid)
         except Exception as e:
-            return Response(f"Error uploading to micro-service: {str(e)}", status=500)
+            # The session is kept so that finalization can be retried
+            return Response(f"Error uploading to IPFS: {str(e)}", status=500)
 
-        if (response.status_code == 200):
-            print("File upload to microservice succeeded.")
-            quote.status = UPLOAD_CODE[5][0]
-            try:
-                quote.save()
-            except Exception as e:
-                return Response(f"Error saving quote after successful upload: {str(e)}", status=500)
-            return Response("File upload succeeded.", status=200)
-        
-        else:
-            print(f"Microservice upload failed with status code: {response.status_code}. Error message: {response.content}")
-            quote.status = UPLOAD_CODE[6][0]
-            try:
-                quote.save()
-            except Exception as e:
-                return Response(f"Error updating quote status after failed upload: {str(e)}", status=500)
+        staged_file = IPFSUploadedFile(session.filename, None, session.length, None, cid=cid, sha256=sha256, local_cid=local_cid)
+        response = upload_quote_files(session.quote, params, {'file': staged_file})
 
-            return Response(f"Microservice upload failed with status code: {response.status_code}", status=401)
+        if response.status_code == 200:
+            session.finalized = True
+            session.save(update_fields=['finalized'])
+            os.remove(session.path)
 
+        return response
 
 
 class QuoteLink(APIView):
@@ -593,6 +1214,11 @@ class QuoteLink(APIView):
                 name='signature',
                 description='Signature',
                 type=str
+            ),
+            OpenApiParameter(
+                name='token',
+                description='Session token from getToken, given instead of the nonce and the signature',
+                type=str
             )
         ],
         examples=[
@@ -624,7 +1250,7 @@ class QuoteLink(APIView):
         quoteId = request.GET.get('quoteId')
 
         try:
-            quote = Quote.objects.get(quoteId=quoteId)
+            quote = registry.attach(Quote.objects.get(quoteId=quoteId))
         except Quote.DoesNotExist:
             return Response('Quote does not exist.', status=404)
 
@@ -636,7 +1262,11 @@ class QuoteLink(APIView):
         """
     Retrieve the quote documents links from the associated micro-service
     """
-        
+
+        # Links of completed uploads never change, they are served as stored the first time
+        if quote.link is not None:
+            return Response(quote.link, status=200)
+
         # Construct the URL using urljoin
         get_link_url = urljoin(quote.storage.url, 'getLink')
 
@@ -648,34 +1278,33 @@ class QuoteLink(APIView):
         }
         
         # Request status of quote from micro-service
-        response = requests.get(get_link_url, params=query_parameters)
+        try:
+            response = storage_request(quote.storage, 'GET', get_link_url, params=query_parameters)
+        except CircuitOpenError as e:
+            return storage_unavailable(e)
+        except requests.RequestException as e:
+            # The micro-service timed out or could not be reached
+            print(f"Error requesting the link of quote {quoteId}: {e}")
+            return Response({'error': f"Storage '{quote.storage.type}' unavailable."}, status=503)
 
         if response.status_code != 200:
-            return Response(json.loads(response.content), status=400)
+            try:
+                return Response(json.loads(response.content), status=400)
+            except ValueError:
+                # Not a JSON body, e.g. an error page of a proxy
+                return Response({'error': response.text[:512]}, status=400)
 
         print("Sending response:", response.content)
 
-        if quote.storage.type == "arweave":
-            # TODO: improve that by managing the different link format from different services.
-            responseObj = json.loads(response.content)
-            # result = []
-            # for item in responseObj:
-            #   result.append({''})
-            return Response(responseObj, status=200)
-        elif quote.storage.type == "filecoin":
-            # TODO: improve that by managing the different link format from different services.
-            return Response({
-                "type": quote.storage.type,
-                "CID": json.loads(response.content)[0]['CID']
-            })
-        else:
-            try:
-                # Attempt to parse the response content as JSON
-                responseObj = json.loads(response.content)
-                return Response(responseObj, status=response.status_code)
-            except json.JSONDecodeError:
-                # If response.content is not valid JSON, return it as is
-                return Response(response.content, status=response.status_code)
+        try:
+            link = normalize_link_response(quote.storage, response.content)
+        except ValueError:
+            # If response.content is not valid JSON, return it as is
+            return Response(response.content, status=response.status_code)
+
+        if quote.status == str(UPLOAD_CODE[5][0]):
+            Quote.objects.filter(pk=quote.pk).update(link=link)
+        return Response(link, status=200)
 
 
 class QuoteHistory(APIView):
@@ -698,6 +1327,11 @@ class QuoteHistory(APIView):
                 description='Signature',
                 type=str
             ),
+            OpenApiParameter(
+                name='token',
+                description='Session token from getToken, given instead of the nonce and the signature',
+                type=str
+            ),
             OpenApiParameter(
                 name='page',
                 description='Page Number',
@@ -710,7 +1344,17 @@ class QuoteHistory(APIView):
             ),
             OpenApiParameter(
                 name='storage',
-                description='the name of the storage service',
+                description='the name of the storage service, or "all" to merge the history of every active storage',
+                type=str
+            ),
+            OpenApiParameter(
+                name='source',
+                description='"local" to read the history from the quotes recorded by the uploader, with cursor pagination',
+                type=str
+            ),
+            OpenApiParameter(
+                name='cursor',
+                description='Cursor of the page to read, as returned in "next" by the previous page (local source, or storage "all")',
                 type=str
             )
         ],
@@ -761,12 +1405,24 @@ class QuoteHistory(APIView):
         print(f'Entered getHistory endpoint: {datetime.datetime.now()}')
         params = {**request.GET}
 
+        # A session token issued for the user replaces the nonce and the signature
+        with_token = 'token' in params and 'signature' not in params
+        if with_token:
+            is_valid = check_user_token(params)
+            if isinstance(is_valid, Response):
+                return is_valid
+
+        if request.GET.get('source') == 'local':
+            return self.local_history(request, params, with_token)
+
         if not all(key in params for key in ('userAddress', 'nonce', 'signature', 'storage')):
             return Response("Missing query parameters. It must include userAddress, nonce, signature and storage.", status=400)
 
         print(f'Checked validation at: {datetime.datetime.now()}')
 
         storage_type = request.GET.get('storage')
+        if storage_type == 'all':
+            return self.merged_history(request, params)
         print(f'Retrieved storage type at {datetime.datetime.now()}, {storage_type}')
         userAddress = request.GET.get('userAddress')
         print(f'Retrieved userAddress at {datetime.datetime.now()}, {userAddress}')
@@ -777,13 +1433,7 @@ class QuoteHistory(APIView):
         Retrieve the quote documents from the micro-services
         """
         try:
-            storages = Storage.objects.filter(is_active=True)
-            print(f'Storages {storages} at {datetime.datetime.now()}')
-        except Exception as e:
-            return Response(f"Error while retrieving possible storages: {str(e)}", status=500)
-
-        try:
-            storage = Storage.objects.filter(is_active=True, type=storage_type).first()
+            storage = registry.get(storage_type)
             if storage is None:
                 print(f'No matching storage type found at {datetime.datetime.now()}')
                 return Response("No matching storage type found", status=404)
@@ -796,7 +1446,7 @@ class QuoteHistory(APIView):
                 'signature': params['signature'][0],
             }
             absolute_url = urljoin(storage.url, f'getHistory?{urlencode(query_params)}')
-            response = requests.get(absolute_url)
+            response = storage_request(storage, 'GET', absolute_url)
             print(f'Got response from microservice at {datetime.datetime.now()}')
             print(f'Response: {response}')
 
@@ -805,8 +1455,203 @@ class QuoteHistory(APIView):
             else:
                 return Response(response.json(), status=500)
 
+        except CircuitOpenError as e:
+            return storage_unavailable(e)
+
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             return Response(f"An error occurred: {str(e)}", status=500)
 
-        
+    # History of every active storage, merged by creation time
+    def merged_history(self, request, params):
+        pageSize = self.page_size(request)
+        if isinstance(pageSize, Response):
+            return pageSize
+
+        params = {key: params[key][0] for key in ('userAddress', 'nonce', 'signature')}
+        storages = registry.active()
+        try:
+            history, next_cursor, unavailable = get_merged_history(storages, params, request.GET.get('cursor'), pageSize)
+        except ValueError as e:
+            return Response(str(e), status=400)
+
+        return Response({
+            "quotes": history,
+            "next": next_cursor,
+            "unavailable": unavailable
+        }, status=200)
+
+    def page_size(self, request):
+        try:
+            pageSize = int(request.GET.get('pageSize', 25))
+        except ValueError:
+            return Response("Invalid page size.", status=400)
+        if pageSize < 1 or pageSize > getattr(settings, 'HISTORY_MAX_PAGE_SIZE', 100):
+            return Response("Invalid page size.", status=400)
+        return pageSize
+
+    # History read from the local quotes, one keyset page at a time
+    def local_history(self, request, params, with_token):
+        if not all(params.get(key, [''])[0] for key in ('userAddress', 'nonce', 'signature')):
+            return Response("Missing query parameters. It must include userAddress, nonce and signature.", status=400)
+
+        pageSize = self.page_size(request)
+        if isinstance(pageSize, Response):
+            return pageSize
+
+        userAddress = request.GET.get('userAddress')
+        # The session token was checked already, its nonce was consumed when it was issued
+        if not with_token:
+            is_valid = check_user_signature(userAddress, params['nonce'][0], params['signature'][0])
+            if isinstance(is_valid, Response):
+                return is_valid
+
+        try:
+            history, next_cursor = get_local_history(userAddress, request.GET.get('storage'), request.GET.get('cursor'), pageSize)
+        except ValueError as e:
+            return Response(str(e), status=400)
+
+        return Response({
+            "quotes": history,
+            "next": next_cursor
+        }, status=200)
+
+
+# Session token endpoint: a signed request for a quote or a user is exchanged for a short-lived token,
+# given instead of the nonce and the signature to getLink, upload and getHistory
+class SessionTokenView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=inline_serializer(
+            name='SessionTokenRequest',
+            fields={
+                'quoteId': serializers.CharField(required=False),
+                'userAddress': serializers.CharField(required=False),
+                'nonce': serializers.IntegerField(),
+                'signature': serializers.CharField(),
+            }
+        ),
+        examples=[
+            OpenApiExample(
+                "SessionTokenRequestExample",
+                value={
+                    "quoteId": "xxxx",
+                    "nonce": 1700000000,
+                    "signature": "0x..."
+                },
+                request_only=True,
+                response_only=False
+            ),
+            OpenApiExample(
+                "SessionTokenResponseExample",
+                value={
+                    "token": "eyJzY29wZSI6InF1b3RlIiwic3ViIjoieHh4eCJ9.xxxx",
+                    "expires": 1700000300
+                },
+                request_only=False,
+                response_only=True
+            )
+        ],
+        responses={
+            200: inline_serializer(
+                name='SessionTokenResponse',
+                fields={
+                    'token': serializers.CharField(),
+                    'expires': serializers.IntegerField(),
+                }
+            ),
+            400: OpenApiResponse(description='Invalid input data.'),
+            404: OpenApiResponse(description='Quote does not exist.'),
+        }
+    )
+    def post(self, request):
+        """
+        Check a signed request once, and return a session token for the quote or the user
+        """
+        data = request.data
+        nonce, signature = data.get('nonce'), data.get('signature')
+        try:
+            nonce = int(nonce)
+        except (TypeError, ValueError):
+            return Response("Invalid input data.", status=400)
+        if not signature or bool(data.get('quoteId')) == bool(data.get('userAddress')):
+            return Response("Invalid input data. It must include nonce, signature, and either quoteId or userAddress.", status=400)
+
+        if data.get('quoteId'):
+            try:
+                quote = registry.attach(Quote.objects.get(quoteId=data.get('quoteId')))
+            except Quote.DoesNotExist:
+                return Response('Quote does not exist.', status=404)
+
+            # The nonce is consumed as by any signed request for the quote
+            try:
+                is_valid = check_params_validity({'nonce': [str(nonce)], 'signature': [signature]}, quote)
+            except Exception as e:
+                print(f"Failed to verify the signature: {e}")
+                return Response("Invalid signature.", status=400)
+            if isinstance(is_valid, Response):
+                return is_valid
+            if is_valid is not True:
+                return Response("Invalid signature.", status=400)
+            token, expires = issue_token('quote', quote.quoteId, nonce, signature)
+        else:
+            userAddress = str(data.get('userAddress')).lower()
+            is_valid = check_user_signature(userAddress, nonce, signature)
+            if isinstance(is_valid, Response):
+                return is_valid
+            token, expires = issue_token('user', userAddress, nonce, signature)
+
+        return Response({"token": token, "expires": expires}, status=200)
+
+
+# Metrics endpoint: counters, latency histograms and upstream connection pools usage
+class MetricsView(APIView):
+    @csrf_exempt
+    @extend_schema(
+        request=[],
+        parameters=[],
+        responses={
+            200: OpenApiTypes.OBJECT
+        }
+    )
+    def get(self, request):
+        """
+        Return the metrics collected by this process
+        """
+        return Response(metrics.snapshot(), status=200)
+
+
+# Long-poll status endpoint: the request is held until the status of the quote differs from the one the client already knows.
+# It is an async view, so that a waiting client holds no thread when served through ASGI (server/asgi.py).
+async def wait_quote_status(request):
+    quoteId = request.GET.get('quoteId')
+    known = request.GET.get('status')
+    try:
+        timeout = min(float(request.GET.get('timeout', settings.STATUS_WAIT_TIMEOUT)), settings.STATUS_WAIT_TIMEOUT)
+    except ValueError:
+        return JsonResponse("Invalid timeout.", status=400, safe=False)
+
+    # Watch before reading the status, so that a change made in between is not missed
+    future = status_broker.watch(quoteId)
+    try:
+        quote = await sync_to_async(Quote.objects.filter(quoteId=quoteId).values_list('status').first)()
+        if quote is None:
+            return JsonResponse('Quote does not exist.', status=404, safe=False)
+        status = quote[0]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while known is not None and str(status) == str(known):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                status = await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                break
+            status_broker.unwatch(quoteId, future)
+            future = status_broker.watch(quoteId)
+    finally:
+        status_broker.unwatch(quoteId, future)
+
+    return JsonResponse({"status": status, "changed": known is None or str(status) != str(known)})
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+from web3 import Web3
+from web3.middleware import geth_poa_middleware
+
+from . import http_client, metrics
+
+_lock = threading.Lock()
+# One Web3 client per RPC endpoint
+_clients = {}
+# Parsed ABIs, keyed by the SHA256 of their JSON
+_abis = {}
+
+
+class PooledHTTPProvider(Web3.HTTPProvider):
+    """
+    HTTP provider sending the RPC calls through the pooled session of the endpoint host, shared by all the threads.
+    The sessions cached by web3 itself are per thread, a request thread would otherwise open its own connections.
+    """
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        response = http_client.get_session(self.endpoint_uri).post(self.endpoint_uri, data=request_data, **self.get_request_kwargs())
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
+
+
+class Web3Client:
+    """
+    Web3 instance of an RPC endpoint, with the contracts it was asked for, keyed by (chainId, tokenAddress, ABI hash).
+    """
+
+    def __init__(self, rpc_url):
+        self.rpc_url = rpc_url
+        self.w3 = Web3(PooledHTTPProvider(rpc_url, request_kwargs={'timeout': http_client.get_default_timeout()}))
+        self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        self.w3.middleware_onion.add(construct_rpc_latency_middleware(urlparse(rpc_url).netloc), name='rpc_latency')
+        self.lock = threading.Lock()
+        self.contracts = {}
+
+    # Returns the contract of the token, built once per (chainId, tokenAddress, ABI)
+    def get_contract(self, chainId, tokenAddress, abi):
+        key = (str(chainId), tokenAddress.lower(), abi_hash(abi))
+        contract = self.contracts.get(key)
+        if contract is None:
+            with self.lock:
+                contract = self.contracts.get(key)
+                if contract is None:
+                    contract = self.contracts[key] = self.w3.eth.contract(Web3.toChecksumAddress(tokenAddress), abi=get_abi(abi))
+        return contract
+
+
+# This function returns a middleware recording the latency and the errors of the RPC calls sent to the host, by JSON-RPC method
+def construct_rpc_latency_middleware(host):
+    def rpc_latency_middleware(make_request, w3):
+        def middleware(method, params):
+            start = time.perf_counter()
+            try:
+                response = make_request(method, params)
+            except Exception:
+                metrics.increment('rpc_errors', host=host, method=method)
+                raise
+            finally:
+                metrics.observe('rpc_request_seconds', time.perf_counter() - start, host=host, method=method)
+            if 'error' in response:
+                metrics.increment('rpc_errors', host=host, method=method)
+            return response
+        return middleware
+    return rpc_latency_middleware
+
+
+# This function returns the client of an RPC endpoint, created on first use
+def get_client(rpc_url):
+    client = _clients.get(rpc_url)
+    if client is None:
+        with _lock:
+            client = _clients.get(rpc_url)
+            if client is None:
+                client = _clients[rpc_url] = Web3Client(rpc_url)
+    return client
+
+
+# This function returns the SHA256 of an ABI, given as JSON or already parsed
+def abi_hash(abi):
+    if not isinstance(abi, str):
+        abi = json.dumps(abi, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(abi.encode('utf-8')).hexdigest()
+
+
+# This function returns the parsed ABI, from its JSON or as is when already parsed
+def get_abi(abi):
+    if not isinstance(abi, str):
+        return abi
+    key = abi_hash(abi)
+    parsed = _abis.get(key)
+    if parsed is None:
+        parsed = _abis[key] = json.loads(abi)
+    return parsed
+
+
+# This function drops the clients and the parsed ABIs
+def clear():
+    with _lock:
+        _clients.clear()
+        _abis.clear()
@@ -81,6 +81,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'server.wsgi.application'
+ASGI_APPLICATION = 'server.asgi.application'
 
 
 # Database
@@ -181,6 +182,94 @@ TEST_PRIVATE_KEY = os.environ.get("TEST_PRIVATE_KEY")
 TOKEN_ADDRESS = os.environ.get("TOKEN_ADDRESS")
 IPFS_SERVICE_ENDPOINT = os.environ.get("IPFS_SERVICE_ENDPOINT")
 
+# Stream uploaded files to IPFS chunk by chunk instead of buffering the whole request body
+IPFS_STREAMING_UPLOAD = os.environ.get("IPFS_STREAMING_UPLOAD", "true").lower() == "true"
+IPFS_STREAM_CHUNK_SIZE = int(os.environ.get("IPFS_STREAM_CHUNK_SIZE", 64 * 2 ** 10))  # 64 KB
+IPFS_STREAM_QUEUE_SIZE = int(os.environ.get("IPFS_STREAM_QUEUE_SIZE", 16))  # chunks buffered per upload
+
+# Number of files added to IPFS concurrently, each in its own request (1 sends all the files in a single request)
+IPFS_ADD_CONCURRENCY = int(os.environ.get("IPFS_ADD_CONCURRENCY", 1))
+IPFS_ADD_RETRIES = int(os.environ.get("IPFS_ADD_RETRIES", 2))
+
+# Reuse the CID of a file already added to IPFS with the same sha256 instead of adding its content again
+IPFS_DEDUPLICATION = os.environ.get("IPFS_DEDUPLICATION", "true").lower() == "true"
+
+# CID settings of the IPFS adds, also used to compute the CID of the uploads locally (0 uses dag-pb leaves, 1 raw leaves)
+IPFS_CID_VERSION = int(os.environ.get("IPFS_CID_VERSION", 0))
+IPFS_CHUNK_SIZE = int(os.environ.get("IPFS_CHUNK_SIZE", 262144))  # 256 KB, kubo default
+
+# Upstream HTTP calls (IPFS, storage microservices): keep-alive connections pooled per host
+UPSTREAM_POOL_CONNECTIONS = int(os.environ.get("UPSTREAM_POOL_CONNECTIONS", 4))
+UPSTREAM_POOL_MAXSIZE = int(os.environ.get("UPSTREAM_POOL_MAXSIZE", 20))  # connections kept per host
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5))  # seconds
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", 60))  # seconds
+
+# Circuit breaker of the storage micro-services: failing storages are answered with 503 instead of being called
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))  # consecutive failures
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", 0.5))  # failures share over the window
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", 10))  # calls in the window before the error rate applies
+BREAKER_WINDOW = float(os.environ.get("BREAKER_WINDOW", 60))  # seconds
+BREAKER_SLOW_CALL = float(os.environ.get("BREAKER_SLOW_CALL", 10))  # seconds after which a call counts as failed
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", 30))  # delay before a probe is let through
+
+# Quotes reused for identical getQuote requests of the same user, until they are used for an upload
+QUOTE_CACHE_TTL = int(os.environ.get("QUOTE_CACHE_TTL", 300))  # seconds
+QUOTE_CACHE_SIZE = int(os.environ.get("QUOTE_CACHE_SIZE", 1024))  # entries
+
+# Info endpoint body, kept in memory for a registry version, and at most this long
+STORAGE_INFO_CACHE_TTL = int(os.environ.get("STORAGE_INFO_CACHE_TTL", 60))  # seconds
+
+# Storage registry: each process checks the registry version at most this often, and reloads its snapshot when it moved
+REGISTRY_CHECK_INTERVAL = float(os.environ.get("REGISTRY_CHECK_INTERVAL", 5))  # seconds
+
+# Storages are deactivated once they did not register or send a heartbeat for this long
+STORAGE_HEARTBEAT_TIMEOUT = int(os.environ.get("STORAGE_HEARTBEAT_TIMEOUT", 600))  # seconds
+
+# Addresses recovered from signed requests, kept to verify retried requests without a new secp256k1 recovery
+SIGNATURE_CACHE_SIZE = int(os.environ.get("SIGNATURE_CACHE_SIZE", 4096))  # entries
+SIGNATURE_CACHE_TTL = int(os.environ.get("SIGNATURE_CACHE_TTL", 3600))  # seconds
+
+# Signature recovery: dotted path of the backend function, and the number of processes recovering the signatures
+# sent by all the request threads in batches (0 recovers them inline, in the request thread)
+SIGNATURE_BACKEND = os.environ.get("SIGNATURE_BACKEND", "oceandbs.signature_backends.eth_account_recover")
+SIGNATURE_WORKERS = int(os.environ.get("SIGNATURE_WORKERS", 0))
+SIGNATURE_BATCH_SIZE = int(os.environ.get("SIGNATURE_BATCH_SIZE", 64))  # signatures
+SIGNATURE_BATCH_WAIT = float(os.environ.get("SIGNATURE_BATCH_WAIT", 0.002))  # seconds
+
+# Session tokens exchanged for a signed request, signed with SESSION_TOKEN_SECRET (SECRET_KEY when empty)
+SESSION_TOKEN_SECRET = os.environ.get("SESSION_TOKEN_SECRET", "")
+SESSION_TOKEN_TTL = int(os.environ.get("SESSION_TOKEN_TTL", 300))  # seconds
+
+# Quote comparison: delay after which the storages that did not answer are left out
+QUOTE_COMPARISON_TIMEOUT = float(os.environ.get("QUOTE_COMPARISON_TIMEOUT", 10))  # seconds
+
+# Largest batch of quote statuses a storage micro-service may push at once
+STATUS_PUSH_MAX_BATCH = int(os.environ.get("STATUS_PUSH_MAX_BATCH", 1000))
+
+# Status poller: quotes in progress are refreshed in the background, getStatus only calls the storage when the status is older than STATUS_MAX_AGE
+STATUS_POLL_INTERVAL = int(os.environ.get("STATUS_POLL_INTERVAL", 30))  # seconds
+STATUS_POLL_BATCH = int(os.environ.get("STATUS_POLL_BATCH", 500))  # quotes polled per run
+STATUS_POLL_CONCURRENCY = int(os.environ.get("STATUS_POLL_CONCURRENCY", 8))  # concurrent getStatus calls
+STATUS_MAX_AGE = int(os.environ.get("STATUS_MAX_AGE", 60))  # seconds
+
+# Long-poll status endpoint: longest wait, and delay after which statuses changed by other processes reach the waiting clients
+STATUS_WAIT_TIMEOUT = float(os.environ.get("STATUS_WAIT_TIMEOUT", 30))  # seconds
+STATUS_WAIT_RECHECK = int(os.environ.get("STATUS_WAIT_RECHECK", 5))  # seconds
+
+# Largest number of quotes whose status getStatuses returns at once
+STATUS_BATCH_MAX_IDS = int(os.environ.get("STATUS_BATCH_MAX_IDS", 1000))
+
+# Largest page of the local quote history
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", 100))
+
+# Resumable uploads: bytes received are staged on disk until the session is finalized
+UPLOAD_STAGING_DIR = os.environ.get("UPLOAD_STAGING_DIR", os.path.join(BASE_DIR, 'staging'))
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", 24 * 60 * 60))  # seconds
+
+# Asynchronous uploads: number of background workers, and delay after which a job is considered stuck
+UPLOAD_JOB_WORKERS = int(os.environ.get("UPLOAD_JOB_WORKERS", 4))
+UPLOAD_JOB_TIMEOUT = int(os.environ.get("UPLOAD_JOB_TIMEOUT", 60 * 60))  # seconds
+
 if os.getenv('ENV_GITHUB_WORKFLOW'):
     PRIVATE_KEY = os.getenv("PRIVATE_KEY")
     TEST_PRIVATE_KEY = os.getenv("TEST_PRIVATE_KEY")